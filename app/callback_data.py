@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 00:20
+# @Author  : KimmyXYC
+# @File    : callback_data.py
+# @Software: PyCharm
+"""
+Inline button payloads.
+
+callback_data is one opcode character followed by the base64url encoded
+fields of that opcode, e.g. a vote is "V" + 16 uuid bytes + 1 option byte
+(24 characters instead of 43). Payloads of older messages ("jrv <uuid> yes",
+"setting <group_id> pin_msg true", ...) still decode to the same objects.
+"""
+
+import base64
+import struct
+import uuid as uuid_lib
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from loguru import logger
+from telebot import types
+
+# In a batch the plain actions apply to every applicant and the *_entry ones
+# to the applicant whose uuid the button carries. New actions are appended so
+# that the indexes of existing buttons keep their meaning.
+ACTIONS = ("approve", "reject", "ban", "approve_entry", "reject_entry", "ban_entry")
+VOTE_OPTIONS = ("yes", "no")
+TOGGLE_SETTINGS = (
+    "vote_to_join",
+    "anonymous_vote",
+    "pin_msg",
+    "clean_pinned_message",
+    "advanced_vote",
+)
+SETTING_ITEMS = (
+    *TOGGLE_SETTINGS,
+    "vote_time",
+    "mini_voters",
+    "language",
+    "back",
+    "close",
+)
+LANGUAGES = ("zh_CN", "zh_TW", "en_US")
+
+
+@dataclass(frozen=True, slots=True)
+class CallbackData:
+    """
+    A decoded payload. uuid is set for join request kinds, group_id/item/value
+    for settings (value keeps the textual form: "true", "600", "menu", ...).
+    """
+
+    kind: str
+    uuid: str | None = None
+    option: str | None = None
+    group_id: int | None = None
+    item: str | None = None
+    value: str | None = None
+
+
+# opcode -> (kind, struct layout of the packed fields)
+OPCODES = {
+    "A": ("action", struct.Struct(">16sB")),
+    "V": ("vote", struct.Struct(">16sB")),
+    "S": ("status", struct.Struct(">16s")),
+    "G": ("setting", struct.Struct(">qBH")),
+}
+_KIND_OPCODES = {kind: (opcode, layout) for opcode, (kind, layout) in OPCODES.items()}
+# Legacy prefix -> (kind, number of space separated parts)
+LEGACY = {
+    "jr": ("action", 3),
+    "jrv": ("vote", 3),
+    "jrs": ("status", 2),
+    "setting": ("setting", 4),
+}
+
+
+def _pack(kind: str, *fields) -> str:
+    opcode, layout = _KIND_OPCODES[kind]
+    payload = base64.urlsafe_b64encode(layout.pack(*fields)).rstrip(b"=")
+    return opcode + payload.decode("ascii")
+
+
+def _setting_arg(item: str, value: str) -> int:
+    """
+    The setting value as one unsigned short; 0 stands for "menu"/"main",
+    so numbers start at 1.
+    """
+    if item in TOGGLE_SETTINGS or item == "close":
+        if value not in {"true", "false"}:
+            raise ValueError(f"invalid value for {item}: {value}")
+        return int(value == "true")
+    if item == "back" and value == "main":
+        return 0
+    if item != "back" and value == "menu":
+        return 0
+    if item in {"vote_time", "mini_voters"} and value.isdigit() and int(value) > 0:
+        return int(value)
+    if item == "language" and value in LANGUAGES:
+        return LANGUAGES.index(value) + 1
+    raise ValueError(f"invalid value for {item}: {value}")
+
+
+def _setting_value(item: str, arg: int) -> str | None:
+    if item in TOGGLE_SETTINGS or item == "close":
+        return ("false", "true")[arg] if arg in (0, 1) else None
+    if item == "back":
+        return "main" if arg == 0 else None
+    if arg == 0:
+        return "menu"
+    if item in {"vote_time", "mini_voters"}:
+        return str(arg)
+    if item == "language" and arg <= len(LANGUAGES):
+        return LANGUAGES[arg - 1]
+    return None
+
+
+def encode_action(uuid: str, action: str) -> str:
+    return _pack("action", uuid_lib.UUID(uuid).bytes, ACTIONS.index(action))
+
+
+def encode_vote(uuid: str, option: str) -> str:
+    return _pack("vote", uuid_lib.UUID(uuid).bytes, VOTE_OPTIONS.index(option))
+
+
+def encode_status(uuid: str) -> str:
+    return _pack("status", uuid_lib.UUID(uuid).bytes)
+
+
+def encode_setting(group_id: int, item: str, value: str) -> str:
+    return _pack(
+        "setting", group_id, SETTING_ITEMS.index(item), _setting_arg(item, value)
+    )
+
+
+def _decode_compact(data: str) -> CallbackData | None:
+    entry = OPCODES.get(data[0])
+    if entry is None:
+        return None
+    kind, layout = entry
+    payload = data[1:]
+    if len(payload) != (layout.size * 4 + 2) // 3:
+        return None
+    try:
+        fields = layout.unpack(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+    except (ValueError, struct.error):
+        return None
+
+    if kind == "setting":
+        group_id, item_index, arg = fields
+        if item_index >= len(SETTING_ITEMS):
+            return None
+        item = SETTING_ITEMS[item_index]
+        value = _setting_value(item, arg)
+        if value is None:
+            return None
+        return CallbackData(kind, group_id=group_id, item=item, value=value)
+
+    request_uuid = str(uuid_lib.UUID(bytes=fields[0]))
+    if kind == "status":
+        return CallbackData(kind, uuid=request_uuid)
+    choices = ACTIONS if kind == "action" else VOTE_OPTIONS
+    if fields[1] >= len(choices):
+        return None
+    return CallbackData(kind, uuid=request_uuid, option=choices[fields[1]])
+
+
+def _decode_legacy(data: str) -> CallbackData | None:
+    parts = data.split(" ")
+    entry = LEGACY.get(parts[0])
+    if entry is None or len(parts) != entry[1]:
+        return None
+    kind = entry[0]
+
+    if kind == "setting":
+        _, group_id, item, value = parts
+        try:
+            group_id = int(group_id)
+        except ValueError:
+            return None
+        if item not in SETTING_ITEMS:
+            return None
+        # Round-trip through the compact encoding, so that both forms of a
+        # payload pass the same checks and decode to the same value.
+        try:
+            return _decode_compact(encode_setting(group_id, item, value))
+        except (ValueError, struct.error):
+            return None
+
+    try:
+        request_uuid = str(uuid_lib.UUID(parts[1]))
+    except ValueError:
+        return None
+    if kind == "status":
+        return CallbackData(kind, uuid=request_uuid)
+    choices = ACTIONS if kind == "action" else VOTE_OPTIONS
+    if parts[2] not in choices:
+        return None
+    return CallbackData(kind, uuid=request_uuid, option=parts[2])
+
+
+def decode_callback(data: str | None) -> CallbackData | None:
+    """
+    Decode callback_data; None when it is empty or malformed.
+    """
+    if not data:
+        return None
+    if " " in data:
+        return _decode_legacy(data)
+    return _decode_compact(data)
+
+
+CallbackHandler = Callable[[types.CallbackQuery, CallbackData], Awaitable]
+
+
+class CallbackRouter:
+    """
+    Dispatch callback queries to the handler registered for their kind.
+    Malformed payloads are answered right away, before any handler runs.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.rejected = 0
+        self._handlers: dict[str, CallbackHandler] = {}
+
+    def register(self, kind: str):
+        if kind not in _KIND_OPCODES:
+            raise ValueError(f"Unknown callback kind: {kind}")
+
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            self._handlers[kind] = handler
+            return handler
+
+        return decorator
+
+    async def dispatch(self, call: types.CallbackQuery):
+        data = decode_callback(call.data)
+        if data is None:
+            self.rejected += 1
+            logger.debug(f"Rejected malformed callback_data: {call.data!r}")
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id, text="Invalid callback"
+            )
+            return
+        handler = self._handlers.get(data.kind)
+        if handler is None:
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id, text="Unsupported callback"
+            )
+            return
+        await handler(call, data)
@@ -3,6 +3,8 @@
 # @File    : controller.py
 # @Software: PyCharm
 import asyncio
+from collections import deque
+from typing import Awaitable, Callable
 
 from asgiref.sync import sync_to_async
 from loguru import logger
@@ -13,14 +15,23 @@ from telebot.asyncio_helper import ApiTelegramException
 from telebot.asyncio_storage import StateMemoryStorage
 
 from setting.telegrambot import BotSetting
+from app.callback_data import CallbackData, CallbackRouter
+from app.coordination import Coordinator
+from app.join_request_batch import JoinRequestBatch, JoinRequestBatcher
 from app.join_request_vote import JoinRequestVote
+from app.metrics import ApiMetrics, JOIN_REQUEST_SESSIONS, MetricsServer, track_handler
+from app.rate_limit import OutboundLimiter
 from app_conf import settings
 from app import event
 from app.utils import generate_uuid
+from app.webhook import WebhookServer
 from app.settings_menu import handle_settings_callback, open_settings
 from utils.i18n import normalize_language_code, t
 from utils.join_request_store import JoinRequestSessionStore
 from utils.postgres import BotDatabase
+from utils.retention import Retention
+from utils.scheduler import DeadlineScheduler
+from utils.tracing import Tracer, span
 
 StepCache = StateMemoryStorage()
 
@@ -30,6 +41,137 @@ def sync_to_async_func():
     pass
 
 
+class UpdateDispatcher:
+    """
+    Bounded worker pool for incoming updates.
+    Updates are queued per chat so that each chat is processed in order, and a
+    fixed number of workers take ready chats round-robin, so one busy group
+    cannot starve the others. Callback queries get a lane of their own per
+    chat: votes and admin clicks do not wait behind join requests that are
+    paced by the per-group send limit. submit() blocks once max_pending
+    updates wait.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[types.Update], Awaitable],
+        workers: int = 8,
+        max_pending: int = 10000,
+        drain_timeout: float = 10,
+    ):
+        self._handle = handle
+        self._drain_timeout = drain_timeout
+        self._worker_count = max(int(workers), 1)
+        self._max_pending = max(int(max_pending), 1)
+        self._chat_queues: dict[tuple[str, int], deque] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._busy: set[tuple[str, int]] = set()
+        self._pending = 0
+        self._capacity = asyncio.Condition()
+        self._workers: list[asyncio.Task] = []
+
+    @staticmethod
+    def shard_key(update: types.Update) -> tuple[str, int]:
+        """
+        (lane, chat id): updates with the same key are handled in order.
+        """
+        for message in (
+            update.message,
+            update.edited_message,
+            update.chat_join_request,
+            update.my_chat_member,
+            update.chat_member,
+        ):
+            if message is not None:
+                return "chat", message.chat.id
+        if update.callback_query is not None:
+            call = update.callback_query
+            if call.message is not None:
+                return "callback", call.message.chat.id
+            return "callback", call.from_user.id
+        return "chat", update.update_id
+
+    async def submit(self, update: types.Update):
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._pending < self._max_pending)
+            self._pending += 1
+
+        key = self.shard_key(update)
+        queue = self._chat_queues.get(key)
+        if queue is None:
+            queue = self._chat_queues[key] = deque()
+        queue.append(update)
+        if len(queue) == 1 and key not in self._busy:
+            self._ready.put_nowait(key)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._chat_queues[key]
+            update = queue.popleft()
+            self._busy.add(key)
+            try:
+                await self._handle(update)
+            except Exception as e:
+                logger.opt(exception=e).error(
+                    f"update handling failed: update_id={update.update_id}"
+                )
+            finally:
+                self._busy.discard(key)
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chat_queues[key]
+                async with self._capacity:
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._capacity.notify_all()
+                    else:
+                        self._capacity.notify()
+
+    def queue_depths(self) -> dict[tuple[str, int], int]:
+        return {key: len(queue) for key, queue in self._chat_queues.items() if queue}
+
+    def stats(self) -> dict:
+        depths = self.queue_depths()
+        return {
+            "workers": self._worker_count,
+            "busy": len(self._busy),
+            "pending": self._pending,
+            "chats": len(depths),
+            "max_chat_depth": max(depths.values(), default=0),
+        }
+
+    def start(self):
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self._worker_count)
+        ]
+
+    async def _wait_idle(self):
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._pending == 0)
+
+    async def stop(self):
+        """
+        Handle the updates already queued (their offset has been confirmed to
+        Telegram, so they are not delivered again), then stop the workers.
+        Waits at most drain_timeout seconds.
+        """
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._wait_idle(), timeout=self._drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"dispatcher stopped with {self._pending} updates unhandled"
+                )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
 class BotRunner(object):
     def __init__(self):
         # 检查是否启用自定义 Bot API 服务器
@@ -54,21 +196,203 @@ class BotRunner(object):
         if not BotSetting.token:
             raise ValueError("TELEGRAM_BOT_TOKEN is required")
 
+        ApiMetrics.install()
+        OutboundLimiter.install()
         self.bot = AsyncTeleBot(BotSetting.token, state_storage=StepCache)
         self.join_request_store = JoinRequestSessionStore()
+        JOIN_REQUEST_SESSIONS.set_function(lambda: len(self.join_request_store))
+        self.scheduler = DeadlineScheduler()
+        self.join_request_batcher = None
+        if settings.get("batch.enable", False):
+            self.join_request_batcher = JoinRequestBatcher.from_settings(
+                self.scheduler,
+                start_single=self._start_single_join_request,
+                start_batch=self._start_join_request_batch,
+            )
+        self.dispatcher = UpdateDispatcher(
+            self._process_update,
+            workers=settings.get("dispatcher.workers", 8),
+            max_pending=settings.get("dispatcher.max_pending", 10000),
+            drain_timeout=settings.get("dispatcher.drain_timeout", 10),
+        )
 
-    def _bind_join_task_cleanup(self, uuid: str, task: asyncio.Task):
-        def _on_done(done_task: asyncio.Task):
-            asyncio.create_task(self.join_request_store.remove(uuid))
-            if done_task.cancelled():
-                return
-            error = done_task.exception()
-            if error:
-                logger.opt(exception=error).error(
-                    f"join request task failed: uuid={uuid}"
+    def _on_join_request_closed(self, uuid: str):
+        self.join_request_store.remove(uuid)
+
+    async def _start_join_request_vote(self, join_request_vote: JoinRequestVote):
+        self.join_request_store.set(join_request_vote.uuid, join_request_vote)
+        try:
+            await join_request_vote.start()
+        except Exception as e:
+            self.join_request_store.remove(join_request_vote.uuid)
+            logger.opt(exception=e).error(
+                f"join request task failed: uuid={join_request_vote.uuid}"
+            )
+
+    async def _start_single_join_request(
+        self, request: types.ChatJoinRequest, uuid: str, group_settings: dict
+    ):
+        join_request_vote = JoinRequestVote(
+            bot=self.bot,
+            request=request,
+            uuid=uuid,
+            group_settings=group_settings,
+            scheduler=self.scheduler,
+            on_close=self._on_join_request_closed,
+        )
+        await self._start_join_request_vote(join_request_vote)
+
+    async def _start_join_request_batch(
+        self, requests: list[tuple], group_settings: dict
+    ):
+        batch = JoinRequestBatch.create(
+            bot=self.bot,
+            requests=requests,
+            group_settings=group_settings,
+            scheduler=self.scheduler,
+            on_close=self._on_join_request_closed,
+        )
+        await self._run_join_request_batch(batch)
+
+    async def _run_join_request_batch(self, batch: JoinRequestBatch):
+        for entry in batch.entries:
+            self.join_request_store.set(entry.uuid, entry)
+        try:
+            await batch.start()
+        except Exception as e:
+            for entry in batch.entries:
+                self.join_request_store.remove(entry.uuid)
+            logger.opt(exception=e).error(
+                f"join request batch failed: batch_id={batch.batch_id}"
+            )
+
+    async def _resume_join_request_sessions(self):
+        """
+        Decline join requests orphaned by a previous crash and re-arm every
+        persisted vote session (with coordination: only the unowned ones).
+        """
+        grace = Coordinator.orphan_grace if Coordinator.enabled else 0
+        orphaned = await BotDatabase.close_orphaned_join_requests(grace)
+        for row in orphaned:
+            try:
+                await self.bot.decline_chat_join_request(
+                    chat_id=row["group_id"], user_id=row["user_id"]
                 )
+            except Exception:
+                pass
+        if orphaned:
+            logger.warning(f"Closed {len(orphaned)} orphaned join requests")
 
-        task.add_done_callback(_on_done)
+        if Coordinator.enabled:
+            sessions = await Coordinator.claim_orphaned(include_own=True)
+        else:
+            sessions = await BotDatabase.load_join_request_sessions()
+        await self._adopt_join_request_sessions(sessions)
+        if sessions:
+            logger.info(f"Resumed {len(sessions)} join request sessions")
+
+    async def _adopt_join_request_sessions(self, sessions: list[dict]):
+        batches: dict[str, list[dict]] = {}
+        for session in sessions:
+            if str(session["uuid"]) in self.join_request_store:
+                continue
+            if session["batch_id"] is not None:
+                batches.setdefault(str(session["batch_id"]), []).append(session)
+                continue
+            try:
+                join_request_vote = JoinRequestVote.from_session(
+                    bot=self.bot,
+                    session=session,
+                    scheduler=self.scheduler,
+                    on_close=self._on_join_request_closed,
+                )
+            except Exception:
+                logger.exception(
+                    f"failed to restore join request session: uuid={session['uuid']}"
+                )
+                continue
+            await self._start_join_request_vote(join_request_vote)
+
+        for batch_id, batch_sessions in batches.items():
+            try:
+                batch = JoinRequestBatch.from_sessions(
+                    bot=self.bot,
+                    sessions=batch_sessions,
+                    scheduler=self.scheduler,
+                    on_close=self._on_join_request_closed,
+                )
+            except Exception:
+                logger.exception(
+                    f"failed to restore join request batch: batch_id={batch_id}"
+                )
+                continue
+            await self._run_join_request_batch(batch)
+
+    def _on_join_request_lost(self, uuids: list[str]):
+        for uuid in uuids:
+            instance = self.join_request_store.remove(uuid)
+            self.scheduler.cancel(instance.schedule_key if instance else uuid)
+
+    @staticmethod
+    def update_type(update: types.Update) -> str:
+        for name in (
+            "message",
+            "edited_message",
+            "callback_query",
+            "chat_join_request",
+            "chat_member",
+            "my_chat_member",
+        ):
+            if getattr(update, name, None) is not None:
+                return name
+        return "update"
+
+    async def _process_update(self, update: types.Update):
+        with Tracer.trace(f"{self.update_type(update)} update_id={update.update_id}"):
+            if Coordinator.enabled:
+                with span("coordination.route"):
+                    if not await Coordinator.route(update):
+                        return
+            await self.bot.process_new_updates([update])
+
+    async def _poll_updates(self):
+        """
+        Long polling loop feeding the update dispatcher.
+        """
+        bot = self.bot
+        await bot.remove_webhook()
+        await bot.skip_updates()
+        offset = None
+        error_interval = 0.25
+        logger.success("✨ Bot 启动成功,开始轮询...")
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, allowed_updates=util.update_types, timeout=20
+                    )
+                    for update in updates:
+                        offset = update.update_id + 1
+                        await self.dispatcher.submit(update)
+                    error_interval = 0.25
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Polling error: {e}")
+                    await asyncio.sleep(error_interval)
+                    error_interval = min(error_interval * 2, 30)
+        finally:
+            await bot.close_session()
+
+    async def _serve_webhook(self):
+        server = WebhookServer(self.bot, self.dispatcher.submit)
+        await server.start()
+        logger.success("✨ Bot 启动成功,等待 Webhook 推送...")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            await self.bot.close_session()
 
     async def run(self):
         logger.info("🤖 Bot Start")
@@ -80,17 +404,36 @@ class BotRunner(object):
             asyncio_helper.proxy = BotSetting.proxy_address
             logger.info("🌐 Proxy tunnels are being used!")
 
+        await event.load_bot_identity(bot)
         await event.set_bot_commands(bot)
         logger.info("🤖 Bot commands set")
 
+        self.scheduler.start()
+        if Coordinator.enabled:
+            if not settings.get("webhook.enable", False):
+                logger.warning(
+                    "⚠️ coordination is enabled without webhook mode; "
+                    "only one instance may poll getUpdates"
+                )
+            await Coordinator.start(
+                store=self.join_request_store,
+                on_forward=self.dispatcher.submit,
+                on_adopt=self._adopt_join_request_sessions,
+                on_lost=self._on_join_request_lost,
+            )
+        await self._resume_join_request_sessions()
+        if Retention.enabled:
+            await Retention.start()
+
         @bot.message_handler(commands=["start", "help"], chat_types=["private"])
+        @track_handler("help_command")
         async def listen_help_command(message: types.Message):
             message_text = (message.text or "").strip()
             if message_text.startswith("/start jrres_"):
                 parts = message_text.split(" ", 1)
                 if len(parts) == 2 and parts[1].startswith("jrres_"):
                     request_uuid = parts[1][6:]
-                    instance = await self.join_request_store.get(request_uuid)
+                    instance = self.join_request_store.get(request_uuid)
                     if instance is None:
                         await bot.reply_to(message, "Expired")
                         return
@@ -99,151 +442,162 @@ class BotRunner(object):
             await event.listen_help_command(bot, message)
 
         @bot.message_handler(commands=["setting"], chat_types=["group", "supergroup"])
+        @track_handler("setting_command")
         async def listen_setting_command(message: types.Message):
             await open_settings(bot, message)
 
         @bot.message_handler(
             content_types=["pinned_message"], chat_types=["group", "supergroup"]
         )
+        @track_handler("pinned_service_message")
         async def listen_pinned_service_message(message: types.Message):
             await event.listen_pinned_service_message(bot, message)
 
-        @bot.callback_query_handler(func=lambda call: bool(call.data))
-        async def listen_callback_query(call: types.CallbackQuery):
-            if not call.data:
-                return
-
-            if call.data.startswith("setting "):
-                await handle_settings_callback(bot, call)
+        @bot.message_handler(
+            content_types=["new_chat_members", "left_chat_member"],
+            chat_types=["group", "supergroup"],
+        )
+        @track_handler("member_service_message")
+        async def listen_member_service_message(message: types.Message):
+            await event.listen_member_service_message(bot, message)
+
+        @bot.chat_member_handler()
+        @track_handler("chat_member")
+        async def listen_chat_member(update: types.ChatMemberUpdated):
+            await event.listen_chat_member_update(bot, update)
+
+        @bot.my_chat_member_handler()
+        @track_handler("my_chat_member")
+        async def listen_my_chat_member(update: types.ChatMemberUpdated):
+            await event.listen_chat_member_update(bot, update)
+
+        callbacks = CallbackRouter(bot)
+
+        @callbacks.register("setting")
+        async def on_setting_callback(call: types.CallbackQuery, data: CallbackData):
+            await handle_settings_callback(bot, call, data)
+
+        @callbacks.register("action")
+        async def on_action_callback(call: types.CallbackQuery, data: CallbackData):
+            instance = self.join_request_store.get(data.uuid)
+            if instance is None:
+                await bot.answer_callback_query(
+                    callback_query_id=call.id,
+                    text="Expired",
+                )
                 return
+            await instance.handle_action(call, data.option)
 
-            if call.data.startswith("jr "):
-                parts = call.data.split(" ")
-                if len(parts) != 3:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Invalid callback",
-                    )
-                    return
-                _, request_uuid, action = parts
-                instance = await self.join_request_store.get(request_uuid)
-                if instance is None:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Expired",
-                    )
-                    return
-                await instance.handle_action(call, action)
+        @callbacks.register("vote")
+        async def on_vote_callback(call: types.CallbackQuery, data: CallbackData):
+            instance = self.join_request_store.get(data.uuid)
+            if instance is None:
+                await bot.answer_callback_query(
+                    callback_query_id=call.id,
+                    text="Expired",
+                )
                 return
+            await instance.handle_vote(call, data.option)
 
-            if call.data.startswith("jrv "):
-                parts = call.data.split(" ")
-                if len(parts) != 3:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Invalid callback",
-                    )
-                    return
-                _, request_uuid, option = parts
-                instance = await self.join_request_store.get(request_uuid)
-                if instance is None:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Expired",
-                    )
-                    return
-                await instance.handle_vote(call, option)
+        @callbacks.register("status")
+        async def on_status_callback(call: types.CallbackQuery, data: CallbackData):
+            instance = self.join_request_store.get(data.uuid)
+            if instance is not None:
+                await instance.handle_status_query(call)
                 return
 
-            if call.data.startswith("jrs "):
-                parts = call.data.split(" ")
-                if len(parts) != 2:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Invalid callback",
-                    )
-                    return
-                _, request_uuid = parts
-                instance = await self.join_request_store.get(request_uuid)
-                if instance is not None:
-                    await instance.handle_status_query(call)
-                    return
-
-                status = await BotDatabase.get_join_request_status_by_uuid(request_uuid)
-                if status is None:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Expired",
-                    )
-                    return
-
-                if status.get("user_id") != call.from_user.id:
-                    await bot.answer_callback_query(
-                        callback_query_id=call.id,
-                        text="Insufficient permissions.",
-                        show_alert=True,
-                    )
-                    return
-
-                group_settings = await BotDatabase.get_group_settings(
-                    status["group_id"]
+            status = await BotDatabase.get_join_request_status_by_uuid(data.uuid)
+            if status is None:
+                await bot.answer_callback_query(
+                    callback_query_id=call.id,
+                    text="Expired",
                 )
-                language = normalize_language_code(group_settings.get("language"))
-                if status.get("waiting"):
-                    label = t(language, "jr_status_pending_label")
-                elif status.get("result") is True:
-                    label = t(language, "jr_status_approve_label")
-                else:
-                    label = t(language, "jr_status_reject_label")
+                return
 
+            if status.get("user_id") != call.from_user.id:
                 await bot.answer_callback_query(
                     callback_query_id=call.id,
-                    text=t(language, "jr_status_query", status=label),
+                    text="Insufficient permissions.",
                     show_alert=True,
                 )
                 return
 
+            group_settings = await BotDatabase.get_group_settings(status["group_id"])
+            language = normalize_language_code(group_settings.get("language"))
+            if status.get("waiting"):
+                label = t(language, "jr_status_pending_label")
+            elif status.get("result") is True:
+                label = t(language, "jr_status_approve_label")
+            else:
+                label = t(language, "jr_status_reject_label")
+
             await bot.answer_callback_query(
                 callback_query_id=call.id,
-                text="Unsupported callback",
+                text=t(language, "jr_status_query", status=label),
+                show_alert=True,
             )
 
+        @bot.callback_query_handler(func=lambda call: bool(call.data))
+        @track_handler("callback_query")
+        async def listen_callback_query(call: types.CallbackQuery):
+            await callbacks.dispatch(call)
+
         @bot.chat_join_request_handler()
+        @track_handler("chat_join_request")
         async def handle_join_request(request: types.ChatJoinRequest):
-            group_settings = await BotDatabase.get_group_settings(request.chat.id)
-            if not group_settings.get("vote_to_join", True):
-                return
-
-            waiting = await BotDatabase.has_waiting_join_request(
+            uuid = generate_uuid()
+            group_settings, waiting = await BotDatabase.open_join_request(
+                uuid=uuid,
                 group_id=request.chat.id,
                 user_id=request.from_user.id,
             )
+            if not group_settings.get("vote_to_join", True):
+                return
             if waiting:
                 return
 
-            uuid = generate_uuid()
-            await BotDatabase.create_join_request(
-                uuid=uuid,
-                group_id=request.chat.id,
-                user_id=request.from_user.id,
-            )
+            if self.join_request_batcher is not None:
+                await self.join_request_batcher.add(request, uuid, group_settings)
+                return
+            await self._start_single_join_request(request, uuid, group_settings)
 
-            join_request_vote = JoinRequestVote(
-                bot=bot,
-                request=request,
-                uuid=uuid,
-                group_settings=group_settings,
-            )
-            task = asyncio.create_task(join_request_vote.run())
-            await self.join_request_store.set(uuid, join_request_vote, task)
-            self._bind_join_task_cleanup(uuid, task)
+        metrics_server = None
+        if settings.get("metrics.enable", False):
+            metrics_server = MetricsServer()
+            await metrics_server.start()
 
+        self.dispatcher.start()
         try:
-            logger.success("✨ Bot 启动成功,开始轮询...")
-            await bot.polling(
-                non_stop=True, allowed_updates=util.update_types, skip_pending=True
-            )
+            if settings.get("webhook.enable", False):
+                await self._serve_webhook()
+                return
+            await self._poll_updates()
         except ApiTelegramException as e:
             logger.opt(exception=e).exception("ApiTelegramException")
         except Exception as e:
             logger.exception(e)
+        finally:
+            # No new deadlines fire from here on; callbacks already running
+            # get to finish so their writes are part of the final flush.
+            await self.scheduler.stop()
+            await self.dispatcher.stop()
+            try:
+                await asyncio.wait_for(
+                    self.scheduler.drain(),
+                    timeout=settings.get("dispatcher.drain_timeout", 10),
+                )
+            except asyncio.TimeoutError:
+                logger.warning("scheduled callbacks still running at shutdown")
+            try:
+                await BotDatabase.flush_pending_writes()
+            except Exception:
+                logger.exception("failed to flush pending writes on shutdown")
+            if Coordinator.enabled:
+                try:
+                    await Coordinator.stop()
+                except Exception:
+                    logger.exception("failed to release join request sessions")
+            if Retention.enabled:
+                await Retention.stop()
+            if metrics_server is not None:
+                await metrics_server.stop()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 16:10
+# @Author  : KimmyXYC
+# @File    : coordination.py
+# @Software: PyCharm
+import asyncio
+import json
+import os
+import secrets
+import socket
+from typing import Awaitable, Callable
+
+from loguru import logger
+from telebot import types
+
+from app.callback_data import decode_callback
+from app_conf import settings
+from utils.chat_member_cache import BotRights, MemberCache
+from utils.postgres import BotDatabase
+
+
+def join_request_uuid(update: types.Update) -> str | None:
+    """
+    Return the vote session uuid an update is addressed to, if any.
+    """
+    call = update.callback_query
+    if call is not None and call.data:
+        data = decode_callback(call.data)
+        return data.uuid if data is not None else None
+
+    message = update.message
+    if message is not None and message.text:
+        text = message.text.strip()
+        if text.startswith("/start jrres_"):
+            return text.split(" ", 1)[1][6:]
+    return None
+
+
+class InstanceCoordinator:
+    """
+    Share one bot token between several processes in webhook mode.
+    Every vote session is owned by one instance. Instances keep a heartbeat in
+    bot_instance; a session whose owner stops heartbeating for lease_timeout
+    seconds is taken over by whichever instance notices first. Updates for a
+    session owned by a live foreign instance are forwarded to it via NOTIFY,
+    and so are setting and chat member changes, which the others drop from
+    their caches.
+    """
+
+    CHANNEL = "join_request_coordination"
+    # NOTIFY payloads are limited to 8000 bytes.
+    MAX_PAYLOAD = 7900
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        instance_id: str | None = None,
+        heartbeat_interval: float = 5,
+        lease_timeout: float = 30,
+        orphan_grace: float = 300,
+    ):
+        self.enabled = enabled
+        self.instance_id = instance_id or (
+            f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+        )
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_timeout = lease_timeout
+        self.orphan_grace = orphan_grace
+        self.forwarded = 0
+        self.taken_over = 0
+        self._store = None
+        self._on_forward: Callable[[types.Update], Awaitable] | None = None
+        self._on_adopt: Callable[[list[dict]], Awaitable] | None = None
+        self._on_lost: Callable[[list[str]], None] | None = None
+        self._listener = None
+        self._received: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_settings(cls) -> "InstanceCoordinator":
+        return cls(
+            enabled=bool(settings.get("coordination.enable", False)),
+            instance_id=settings.get("coordination.instance_id", None) or None,
+            heartbeat_interval=float(
+                settings.get("coordination.heartbeat_interval", 5)
+            ),
+            lease_timeout=float(settings.get("coordination.lease_timeout", 30)),
+            orphan_grace=float(settings.get("coordination.orphan_grace", 300)),
+        )
+
+    async def start(
+        self,
+        store,
+        on_forward: Callable[[types.Update], Awaitable],
+        on_adopt: Callable[[list[dict]], Awaitable],
+        on_lost: Callable[[list[str]], None],
+    ):
+        self._store = store
+        self._on_forward = on_forward
+        self._on_adopt = on_adopt
+        self._on_lost = on_lost
+        await self._listen()
+        BotDatabase.on_settings_changed = self.announce_settings
+        await BotDatabase.heartbeat_instance(self.instance_id, self.lease_timeout)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"🤝 Coordination enabled, instance_id={self.instance_id}")
+
+    async def stop(self):
+        """
+        Release owned sessions so other instances pick them up immediately.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        BotDatabase.on_settings_changed = None
+        try:
+            released = await BotDatabase.remove_instance(self.instance_id)
+            await self._announce({"type": "released"})
+            logger.info(f"Released {released} join request sessions")
+        finally:
+            if self._listener is not None:
+                await self._listener.close()
+                self._listener = None
+
+    async def _listen(self):
+        self._listener = await BotDatabase.open_connection()
+        await self._listener.add_listener(self.CHANNEL, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+
+        if message.get("source") == self.instance_id:
+            return
+
+        if message.get("type") == "released":
+            self._wakeup.set()
+            return
+
+        if message.get("type") == "settings":
+            BotDatabase.settings_cache.invalidate(int(message["group_id"]))
+            return
+
+        if message.get("type") == "member":
+            chat_id, user_id = int(message["chat_id"]), int(message["user_id"])
+            MemberCache.invalidate(chat_id, user_id)
+            if user_id == BotRights.bot_id:
+                BotRights.invalidate(chat_id)
+            return
+
+        if message.get("type") != "forward":
+            return
+        if message.get("target") != self.instance_id:
+            return
+        update = types.Update.de_json(message["update"])
+        self._received.add(update.update_id)
+        task = asyncio.create_task(self._on_forward(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self.heartbeat_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._tick()
+            except Exception:
+                logger.exception("coordination heartbeat failed")
+
+    async def _tick(self):
+        if self._listener is None or self._listener.is_closed():
+            logger.warning("coordination listener lost, reconnecting")
+            await self._listen()
+            # Changes announced meanwhile were missed.
+            BotDatabase.settings_cache.invalidate()
+            BotRights.invalidate()
+
+        await BotDatabase.heartbeat_instance(self.instance_id, self.lease_timeout)
+
+        lost = await BotDatabase.find_lost_join_request_sessions(
+            self.instance_id, self._store.uuids()
+        )
+        if lost:
+            logger.warning(f"Lost ownership of {len(lost)} join request sessions")
+            self._on_lost(lost)
+
+        sessions = await self.claim_orphaned()
+        if sessions:
+            await self._on_adopt(sessions)
+
+    async def claim_orphaned(
+        self, uuid: str | None = None, include_own: bool = False
+    ) -> list[dict]:
+        """
+        Take over unowned or expired sessions and return their rows.
+        """
+        uuids = await BotDatabase.claim_join_request_sessions(
+            self.instance_id,
+            self.lease_timeout,
+            uuid=uuid,
+            include_own=include_own,
+        )
+        if not uuids:
+            return []
+        self.taken_over += len(uuids)
+        logger.info(f"Took over {len(uuids)} join request sessions")
+        return await BotDatabase.load_join_request_sessions(uuids)
+
+    async def fence(self, votes: list) -> bool:
+        """
+        Confirm right before a decision is published that this instance still
+        owns the sessions of votes (objects with uuid and lease_epoch) and has
+        not been taken over while it was stalled. Always True without
+        coordination; database errors propagate.
+        """
+        if not self.enabled:
+            return True
+        epochs = await BotDatabase.fence_join_request_sessions(
+            self.instance_id, {vote.uuid: vote.lease_epoch for vote in votes}
+        )
+        if not epochs:
+            return False
+        for vote in votes:
+            vote.lease_epoch = epochs[vote.uuid]
+        return True
+
+    async def route(self, update: types.Update) -> bool:
+        """
+        Decide where an update is handled. Returns True if this instance should
+        process it, False if it was forwarded to the owning instance.
+        """
+        if update.update_id in self._received:
+            self._received.discard(update.update_id)
+            return True
+
+        uuid = join_request_uuid(update)
+        if uuid is None or uuid in self._store:
+            return True
+
+        for _ in range(2):
+            owner = await BotDatabase.get_join_request_session_owner(
+                uuid, self.lease_timeout
+            )
+            if owner is None or owner["owner"] == self.instance_id:
+                return True
+            if owner["alive"]:
+                if await self._forward(owner["owner"], update):
+                    return False
+                return True
+            sessions = await self.claim_orphaned(uuid=uuid)
+            if sessions:
+                await self._on_adopt(sessions)
+                return True
+        return True
+
+    async def announce_settings(self, group_id: int):
+        """
+        Tell the other instances to drop their cached settings of group_id.
+        """
+        await self._announce({"type": "settings", "group_id": group_id})
+
+    async def announce_member(self, chat_id: int, user_id: int):
+        """
+        Tell the other instances that a chat member changed (the bot's own
+        rights included), since Telegram sends the update to one of them only.
+        """
+        await self._announce({"type": "member", "chat_id": chat_id, "user_id": user_id})
+
+    async def _announce(self, message: dict):
+        message["source"] = self.instance_id
+        await BotDatabase.notify(self.CHANNEL, json.dumps(message))
+
+    async def _forward(self, target: str, update: types.Update) -> bool:
+        payload = {"update_id": update.update_id}
+        if update.callback_query is not None:
+            payload["callback_query"] = dict(update.callback_query.json)
+        else:
+            payload["message"] = update.message.json
+
+        message = {"type": "forward", "target": target, "update": payload}
+        encoded = json.dumps(message, ensure_ascii=False)
+        if len(encoded.encode()) > self.MAX_PAYLOAD and "callback_query" in payload:
+            # Vote handlers never read the message a button is attached to.
+            payload["callback_query"].pop("message", None)
+            encoded = json.dumps(message, ensure_ascii=False)
+        if len(encoded.encode()) > self.MAX_PAYLOAD:
+            logger.warning(
+                f"update {update.update_id} too large to forward to {target}"
+            )
+            return False
+
+        await BotDatabase.notify(self.CHANNEL, encoded)
+        self.forwarded += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "instance_id": self.instance_id,
+            "forwarded": self.forwarded,
+            "taken_over": self.taken_over,
+        }
+
+
+Coordinator = InstanceCoordinator.from_settings()
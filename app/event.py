@@ -3,10 +3,14 @@
 # @Author  : KimmyXYC
 # @File    : event.py
 # @Software: PyCharm
+from loguru import logger
 from telebot import formatting, types
 
+from app.callback_data import CallbackData, decode_callback
+from app.coordination import Coordinator
 from app.settings_menu import handle_settings_callback, open_settings
 from setting.telegrambot import BotSetting
+from utils.chat_member_cache import BotRights, MemberCache
 from utils.postgres import BotDatabase
 
 
@@ -48,8 +52,17 @@ async def listen_setting_command(bot, message: types.Message):
     await open_settings(bot, message)
 
 
-async def listen_setting_callback(bot, call: types.CallbackQuery):
-    await handle_settings_callback(bot, call)
+async def listen_setting_callback(
+    bot, call: types.CallbackQuery, data: CallbackData | None = None
+):
+    if data is None:
+        data = decode_callback(call.data)
+    if data is None or data.kind != "setting":
+        await bot.answer_callback_query(
+            callback_query_id=call.id, text="Invalid callback"
+        )
+        return
+    await handle_settings_callback(bot, call, data)
 
 
 async def listen_pinned_service_message(bot, message: types.Message):
@@ -58,12 +71,7 @@ async def listen_pinned_service_message(bot, message: types.Message):
     if not message.from_user:
         return
 
-    bot_id = int(BotSetting.bot_id) if BotSetting.bot_id else None
-    if bot_id is None:
-        me = await bot.get_me()
-        bot_id = me.id
-
-    if message.from_user.id != bot_id:
+    if message.from_user.id != BotRights.bot_id:
         return
 
     group_settings = await BotDatabase.get_group_settings(message.chat.id)
@@ -74,3 +82,40 @@ async def listen_pinned_service_message(bot, message: types.Message):
         await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
     except Exception:
         return
+
+
+async def listen_chat_member_update(bot, update: types.ChatMemberUpdated):
+    MemberCache.update(
+        update.chat.id, update.new_chat_member.user.id, update.new_chat_member
+    )
+    if update.new_chat_member.user.id == BotRights.bot_id:
+        BotRights.update(update.chat.id, update.new_chat_member)
+    if Coordinator.enabled:
+        try:
+            await Coordinator.announce_member(
+                update.chat.id, update.new_chat_member.user.id
+            )
+        except Exception:
+            logger.exception("failed to announce chat member update")
+
+
+async def listen_member_service_message(bot, message: types.Message):
+    if message.new_chat_members:
+        for user in message.new_chat_members:
+            MemberCache.invalidate(message.chat.id, user.id)
+    if message.left_chat_member:
+        MemberCache.invalidate(message.chat.id, message.left_chat_member.id)
+
+
+async def load_bot_identity(bot):
+    """
+    Resolve the bot's own identity once at startup.
+    """
+    me = await bot.get_me()
+    BotSetting.bot_id = str(me.id)
+    BotSetting.bot_username = me.username
+    BotSetting.bot_link = f"https://t.me/{me.username}"
+    BotRights.bot_id = me.id
+    logger.success(
+        f"🍀TelegramBot Init Connection Success --bot_name {me.username} --bot_id {me.id}"
+    )
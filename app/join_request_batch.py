@@ -0,0 +1,847 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 17:30
+# @Author  : KimmyXYC
+# @File    : join_request_batch.py
+# @Software: PyCharm
+import asyncio
+import html
+import uuid as uuid_lib
+from collections import deque
+from typing import Awaitable, Callable
+
+from loguru import logger
+from telebot import types
+
+from app.callback_data import encode_action, encode_vote
+from app.coordination import Coordinator
+from app.join_request_vote import JoinRequestVote
+from app_conf import settings
+from utils.i18n import t
+from utils.postgres import BotDatabase
+from utils.scheduler import DeadlineScheduler
+from utils.tracing import span
+
+
+ADMIN_STATUS_KEYS = {
+    "approve": "jr_status_admin_approved",
+    "reject": "jr_status_admin_rejected",
+    "ban": "jr_status_admin_banned",
+}
+# Every status an applicant line of a batch message can end up with.
+LINE_STATUS_KEYS = (
+    "jr_status_not_enough_voters",
+    "jr_status_approved",
+    "jr_status_rejected",
+    "jr_status_tie",
+    *ADMIN_STATUS_KEYS.values(),
+)
+# Names are cut to this many characters, so that every line of a batch
+# message has a bounded length.
+NAME_WIDTH = 32
+
+
+def short_name(full_name: str) -> str:
+    if len(full_name) <= NAME_WIDTH:
+        return full_name
+    return full_name[: NAME_WIDTH - 1] + "…"
+
+
+class BatchedJoinRequestVote(JoinRequestVote):
+    """
+    One applicant of a JoinRequestBatch. Ballots, state and status queries are
+    per applicant; messages, the deadline and admin actions belong to the batch.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.advanced_vote_enabled = True
+        self.batch: "JoinRequestBatch | None" = None
+        self.index = 0
+        # Rendered outcome in the batch message and log entry once decided.
+        self.status_line: str | None = None
+        self.log_status: str | None = None
+
+    @property
+    def schedule_key(self) -> str:
+        return self.batch.batch_id
+
+    def _user_display(self, user: types.User) -> str:
+        if user.username:
+            return f"@{user.username}"
+        full_name = html.escape(short_name(user.full_name))
+        return f'<a href="tg://user?id={user.id}">{full_name}</a>'
+
+    def _user_full_name_link(self, user_id: int, full_name: str) -> str:
+        return super()._user_full_name_link(user_id, short_name(full_name))
+
+    def _admin_display(self, user: types.User) -> str:
+        if user.username:
+            return f"@{user.username}"
+        return html.escape(short_name(user.full_name))
+
+    async def start(self):
+        raise RuntimeError("batched votes are started by their JoinRequestBatch")
+
+    async def handle_action(self, call: types.CallbackQuery, action: str):
+        if action.endswith("_entry"):
+            await self.batch.handle_entry_action(
+                call, self, action.removesuffix("_entry")
+            )
+            return
+        await self.batch.handle_action(call, action)
+
+    def decide(self) -> tuple[str, bool]:
+        """
+        Return (status_key, approved) for the ballots collected so far.
+        """
+        yes_votes, no_votes = len(self._yes_voters), len(self._no_voters)
+        if yes_votes + no_votes < int(self.group_settings.get("mini_voters", 1)):
+            return "jr_status_not_enough_voters", False
+        if yes_votes > no_votes:
+            return "jr_status_approved", True
+        if yes_votes == no_votes:
+            return "jr_status_tie", False
+        return "jr_status_rejected", False
+
+
+class JoinRequestBatch:
+    """
+    A single vote message for several join requests of one group that arrived
+    in a burst: one message with per-applicant buttons, one pin, one log entry
+    and one deadline, while every applicant is still resolved on its own.
+    Admins can decide one applicant or all pending ones at once.
+    """
+
+    # Longest message text Telegram accepts.
+    MAX_TEXT_LENGTH = 4096
+
+    def __init__(
+        self,
+        bot,
+        entries: list[BatchedJoinRequestVote],
+        scheduler: DeadlineScheduler,
+        on_close: Callable[[str], None] | None = None,
+        batch_id: str | None = None,
+    ):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.on_close = on_close
+        self.batch_id = batch_id or str(uuid_lib.uuid4())
+        self.entries = sorted(
+            entries, key=lambda entry: (entry.request.date, entry.user_id)
+        )
+        for index, entry in enumerate(self.entries, start=1):
+            entry.batch = self
+            entry.index = index
+        first = self.entries[0]
+        self.chat = first.request.chat
+        self.group_settings = first.group_settings
+        self.language = first.language
+        self.vote_time = first.vote_time
+        self.message_id: int | None = first.message1_id
+        self.log_message_id: int | None = first.log_message_id
+        self.deadline: float | None = first.deadline
+        self.resumed = first.resumed
+        self.state = JoinRequestVote.PENDING
+        self._claimed: list[BatchedJoinRequestVote] = []
+        self._flush_failures = 0
+
+    @classmethod
+    def create(
+        cls,
+        bot,
+        requests: list[tuple[types.ChatJoinRequest, str]],
+        group_settings: dict,
+        scheduler: DeadlineScheduler,
+        on_close: Callable[[str], None] | None = None,
+    ) -> "JoinRequestBatch":
+        entries = [
+            BatchedJoinRequestVote(
+                bot=bot,
+                request=request,
+                uuid=uuid,
+                group_settings=group_settings,
+                scheduler=scheduler,
+                on_close=on_close,
+            )
+            for request, uuid in requests
+        ]
+        return cls(bot, entries, scheduler, on_close)
+
+    @classmethod
+    def from_sessions(
+        cls,
+        bot,
+        sessions: list[dict],
+        scheduler: DeadlineScheduler,
+        on_close: Callable[[str], None] | None = None,
+    ) -> "JoinRequestBatch":
+        """
+        Rebuild a batch from the join_request_session rows sharing its batch_id.
+        """
+        entries = [
+            BatchedJoinRequestVote.from_session(bot, session, scheduler, on_close)
+            for session in sessions
+        ]
+        batch = cls(
+            bot,
+            entries,
+            scheduler,
+            on_close,
+            batch_id=str(sessions[0]["batch_id"]),
+        )
+        if all(entry.state == JoinRequestVote.RESOLVED for entry in entries):
+            batch.state = JoinRequestVote.RESOLVED
+        return batch
+
+    @property
+    def chat_id(self) -> int:
+        return self.chat.id
+
+    @property
+    def uuids(self) -> list[str]:
+        return [entry.uuid for entry in self.entries]
+
+    def _applicant_line(self, entry: BatchedJoinRequestVote) -> str:
+        applicant = entry.request.from_user
+        user = entry._user_display(applicant)
+        return f"{entry.index}. {user} (ID: {applicant.id})"
+
+    def _resolved_line(self, entry: BatchedJoinRequestVote) -> str:
+        label = entry._status_label(waiting=False, result=entry.result)
+        return f"{self._applicant_line(entry)}: {label}"
+
+    def _entry_line(self, entry: BatchedJoinRequestVote) -> str:
+        if entry.status_line is not None:
+            return entry.status_line
+        if entry.state == JoinRequestVote.RESOLVED:
+            # Decided before a restart; only the result survived.
+            return self._resolved_line(entry)
+        return self._applicant_line(entry)
+
+    def _entry_log_line(self, entry: BatchedJoinRequestVote) -> str:
+        if entry.log_status is not None:
+            return f"{self._applicant_line(entry)}: {entry.log_status}"
+        if entry.state == JoinRequestVote.RESOLVED:
+            return self._resolved_line(entry)
+        return f"{self._applicant_line(entry)}: Pending"
+
+    def _pending_entries(self) -> list[BatchedJoinRequestVote]:
+        return [entry for entry in self.entries if entry.is_pending]
+
+    @staticmethod
+    def text_length(requests: list[types.ChatJoinRequest], language: str) -> int:
+        """
+        Upper bound of the length of a batch message for requests, as Telegram
+        counts it (after HTML parsing), whatever the applicants end up with.
+        """
+        length = len(t(language, "jr_batch_requesting", count=len(requests))) + 1
+        admin = "@" + "x" * NAME_WIDTH
+        for index, request in enumerate(requests, start=1):
+            applicant = request.from_user
+            name = (
+                f"@{applicant.username}"
+                if applicant.username
+                else short_name(applicant.full_name)
+            )
+            status = max(
+                len(t(language, key, user=name, user_id=applicant.id, admin=admin))
+                for key in LINE_STATUS_KEYS
+            )
+            # "<index>. <status> (<yes> : <no>)" on a line of its own.
+            length += len(f"\n{index}. ") + status + len(" (9999 : 9999)")
+        return length
+
+    def _build_text(self, lines: list[str]) -> str:
+        header = t(self.language, "jr_batch_requesting", count=len(self.entries))
+        return "\n".join([header, ""] + lines)
+
+    def _build_keyboard(self) -> types.InlineKeyboardMarkup:
+        keyboard = types.InlineKeyboardMarkup(row_width=2)
+        yes_label = t(self.language, "jr_poll_yes")
+        no_label = t(self.language, "jr_poll_no")
+        for entry in self._pending_entries():
+            keyboard.row(
+                types.InlineKeyboardButton(
+                    text=f"#{entry.index} {yes_label}",
+                    callback_data=encode_vote(entry.uuid, "yes"),
+                ),
+                types.InlineKeyboardButton(
+                    text=f"#{entry.index} {no_label}",
+                    callback_data=encode_vote(entry.uuid, "no"),
+                ),
+                types.InlineKeyboardButton(
+                    "✅", callback_data=encode_action(entry.uuid, "approve_entry")
+                ),
+                types.InlineKeyboardButton(
+                    "❌", callback_data=encode_action(entry.uuid, "reject_entry")
+                ),
+                types.InlineKeyboardButton(
+                    "🚫", callback_data=encode_action(entry.uuid, "ban_entry")
+                ),
+            )
+        first_uuid = self.entries[0].uuid
+        keyboard.row(
+            types.InlineKeyboardButton(
+                "Approve all", callback_data=encode_action(first_uuid, "approve")
+            ),
+            types.InlineKeyboardButton(
+                "Reject all", callback_data=encode_action(first_uuid, "reject")
+            ),
+            types.InlineKeyboardButton(
+                "Ban all", callback_data=encode_action(first_uuid, "ban")
+            ),
+        )
+        return keyboard
+
+    def _build_log_text(self, lines: list[str]) -> str:
+        return "\n".join(
+            [
+                f"<b>Chat:</b> {html.escape(self.chat.title or str(self.chat.id))}",
+                f"<b>Batch:</b> {len(self.entries)} users",
+            ]
+            + lines
+        )
+
+    async def _send_pending_log(self):
+        first = self.entries[0]
+        enabled, channel_id, thread_id = first._log_channel_config()
+        if not enabled or channel_id is None:
+            return
+
+        kwargs = {
+            "chat_id": channel_id,
+            "text": self._build_log_text(
+                [self._entry_log_line(entry) for entry in self.entries]
+            ),
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True,
+        }
+        if thread_id is not None and thread_id != 0:
+            kwargs["message_thread_id"] = thread_id
+        message = await self.bot.send_message(**kwargs)
+        self.log_message_id = message.message_id
+
+    async def _edit_log(self, lines: list[str]):
+        enabled, channel_id, _ = self.entries[0]._log_channel_config()
+        if not enabled or channel_id is None or self.log_message_id is None:
+            return
+        await self.bot.edit_message_text(
+            chat_id=channel_id,
+            message_id=self.log_message_id,
+            text=self._build_log_text(lines),
+            parse_mode="HTML",
+            disable_web_page_preview=True,
+        )
+
+    async def _edit_message(self, lines: list[str]):
+        await self.bot.edit_message_text(
+            chat_id=self.chat_id,
+            message_id=self.message_id,
+            text=self._build_text(lines),
+            parse_mode="HTML",
+            reply_markup=None,
+        )
+
+    async def _refresh_message(self):
+        """
+        Show the decisions made so far, with buttons for the pending entries.
+        """
+        await self.bot.edit_message_text(
+            chat_id=self.chat_id,
+            message_id=self.message_id,
+            text=self._build_text([self._entry_line(entry) for entry in self.entries]),
+            parse_mode="HTML",
+            reply_markup=self._build_keyboard(),
+        )
+
+    async def _unpin(self):
+        if self.group_settings.get("pin_msg", False):
+            await self.bot.unpin_chat_message(
+                chat_id=self.chat_id, message_id=self.message_id
+            )
+
+    async def _gather(self, *aws) -> list:
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(
+                    "join request batch call failed batch_id={}", self.batch_id
+                )
+        return results
+
+    async def start(self):
+        """
+        Send the batch message (or restore a resumed batch) and hand the
+        deadline over to the scheduler.
+        """
+        if not self.resumed:
+            if not await self._open():
+                return
+            self.deadline = self.scheduler.now() + self.vote_time
+            for entry in self.entries:
+                entry.message1_id = self.message_id
+                entry.log_message_id = self.log_message_id
+                entry.deadline = self.deadline
+            saved = await asyncio.gather(
+                *(entry._save_session(batch_id=self.batch_id) for entry in self.entries)
+            )
+            if not all(saved):
+                await self._close_failed()
+                return
+        self.scheduler.schedule(self.batch_id, self.deadline, self._on_deadline)
+
+    async def _open(self) -> bool:
+        # Stage 1: the batch message every applicant is voted on in.
+        # Stage 2: pin, log entry and one DM per applicant.
+        logger.debug(
+            "join request batch start batch_id={} chat_id={} size={}",
+            self.batch_id,
+            self.chat_id,
+            len(self.entries),
+        )
+        try:
+            with span("batch.open.message"):
+                message = await self.bot.send_message(
+                    chat_id=self.chat_id,
+                    text=self._build_text(
+                        [self._applicant_line(entry) for entry in self.entries]
+                    ),
+                    parse_mode="HTML",
+                    reply_markup=self._build_keyboard(),
+                    protect_content=True,
+                )
+        except Exception:
+            logger.exception(
+                "failed to send batch message batch_id={} chat_id={}",
+                self.batch_id,
+                self.chat_id,
+            )
+            await self._close_failed()
+            return False
+        self.message_id = message.message_id
+
+        stage2 = [self._send_pending_log()]
+        stage2.extend(entry._send_message3() for entry in self.entries)
+        if self.group_settings.get("pin_msg", False):
+            stage2.append(
+                self.bot.pin_chat_message(
+                    chat_id=self.chat_id,
+                    message_id=self.message_id,
+                    disable_notification=True,
+                )
+            )
+        with span("batch.open.notify"):
+            await self._gather(*stage2)
+        return True
+
+    async def _close_failed(self):
+        self.state = JoinRequestVote.RESOLVED
+        await BotDatabase.close_join_requests(
+            [
+                entry._close_args(False, yes_votes=0, no_votes=0)
+                for entry in self.entries
+            ]
+        )
+        for entry in self.entries:
+            entry._mark_resolved(False, "failed")
+        stage = [entry._apply_join_result(False) for entry in self.entries]
+        if self.message_id is not None:
+            # The batch message was sent but its sessions could not be saved.
+            lines = [self._resolved_line(entry) for entry in self.entries]
+            stage.extend(
+                [self._edit_message(lines), self._edit_log(lines), self._unpin()]
+            )
+        await self._gather(*stage)
+        await self._close()
+
+    def _begin_resolving(self) -> bool:
+        """
+        Claim the decision of every pending entry; entries decided on their
+        own keep their outcome. The claimed entries are kept in _claimed.
+        """
+        if self.state != JoinRequestVote.PENDING:
+            return False
+        self.state = JoinRequestVote.RESOLVING
+        self.scheduler.cancel(self.batch_id)
+        self._claimed = [entry for entry in self.entries if entry._begin_resolving()]
+        return True
+
+    async def _hold_lease(
+        self, entries: list[BatchedJoinRequestVote] | None = None
+    ) -> str:
+        """
+        The batch counterpart of JoinRequestVote._hold_lease for the claimed
+        entries (or the given ones). All sessions of a batch are taken over
+        together, so losing any of them drops the whole batch.
+        """
+        entries = self._claimed if entries is None else entries
+        try:
+            if not entries or await Coordinator.fence(entries):
+                return JoinRequestVote.LEASE_HELD
+        except Exception:
+            logger.exception(
+                "failed to fence join request batch batch_id={}", self.batch_id
+            )
+            for entry in entries:
+                entry.state = JoinRequestVote.PENDING
+            if self.state == JoinRequestVote.RESOLVING:
+                self.state = JoinRequestVote.PENDING
+                self.scheduler.schedule(
+                    self.batch_id,
+                    max(
+                        self.deadline,
+                        self.scheduler.now() + JoinRequestVote.VOTE_FLUSH_RETRY,
+                    ),
+                    self._on_deadline,
+                )
+            return JoinRequestVote.LEASE_UNCHECKED
+        logger.warning(
+            "join request batch batch_id={} was taken over by another instance",
+            self.batch_id,
+        )
+        self.state = JoinRequestVote.RESOLVED
+        self.scheduler.cancel(self.batch_id)
+        for entry in self.entries:
+            entry.state = JoinRequestVote.RESOLVED
+            if self.on_close is not None:
+                self.on_close(entry.uuid)
+        return JoinRequestVote.LEASE_LOST
+
+    async def _on_deadline(self):
+        if (
+            self.state == JoinRequestVote.PENDING
+            and not await self.entries[0]._flush_votes()
+        ):
+            self._flush_failures += 1
+            delay = JoinRequestVote.flush_retry_delay(self._flush_failures)
+            if delay is not None:
+                self.scheduler.schedule(
+                    self.batch_id, self.scheduler.now() + delay, self._on_deadline
+                )
+                return
+            logger.warning(
+                "ballots of join request batch batch_id={} still unwritten "
+                "after {} attempts, deciding from in-memory votes",
+                self.batch_id,
+                self._flush_failures,
+            )
+        if not self._begin_resolving():
+            await self._close()
+            return
+        if await self._hold_lease() != JoinRequestVote.LEASE_HELD:
+            return
+
+        closes = []
+        stage2 = []
+        for entry in self._claimed:
+            applicant = entry.request.from_user
+            status_key, approved = entry.decide()
+            yes_votes, no_votes = len(entry._yes_voters), len(entry._no_voters)
+            status = t(
+                self.language,
+                status_key,
+                user=entry._user_display(applicant),
+                user_id=applicant.id,
+            )
+            entry.status_line = f"{entry.index}. {status} ({yes_votes} : {no_votes})"
+            entry.log_status = (
+                f"{'Approved' if approved else 'Denied'} ({yes_votes} : {no_votes})"
+            )
+            closes.append(
+                entry._close_args(approved, yes_votes=yes_votes, no_votes=no_votes)
+            )
+            stage2.append(entry._apply_join_result(approved))
+            stage2.append(
+                entry._notify_applicant(
+                    "jr_private_approved" if approved else "jr_private_rejected"
+                )
+            )
+            entry._mark_resolved(approved, status_key.removeprefix("jr_status_"))
+
+        with span("batch.finalize.close"):
+            await BotDatabase.close_join_requests(closes)
+        with span("batch.finalize.publish"):
+            await self._gather(
+                self._edit_message([self._entry_line(entry) for entry in self.entries]),
+                self._edit_log([self._entry_log_line(entry) for entry in self.entries]),
+                self._unpin(),
+                *stage2,
+            )
+        self.state = JoinRequestVote.RESOLVED
+        await self._close()
+        logger.debug("join request batch completed batch_id={}", self.batch_id)
+
+    async def _check_action(self, call: types.CallbackQuery, action: str) -> bool:
+        """
+        Answer the callback and return False unless action is supported and
+        the clicking user may decide join requests.
+        """
+        if action not in {"approve", "reject", "ban"}:
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id,
+                text="Unsupported action",
+            )
+            return False
+
+        if self.state != JoinRequestVote.PENDING:
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id, text="Expired"
+            )
+            return False
+
+        with span("batch.action.check_permission"):
+            allowed = await self.entries[0]._check_invite_permission(call.from_user.id)
+        if not allowed:
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id,
+                text=t(self.language, "insufficient_permissions"),
+                show_alert=True,
+            )
+            return False
+        return True
+
+    def _resolve_by_admin(
+        self, entry: BatchedJoinRequestVote, call: types.CallbackQuery, action: str
+    ) -> tuple[dict, list]:
+        """
+        Record an admin decision for a claimed entry. Returns the arguments
+        closing its join_request row and the calls that publish it to the
+        applicant.
+        """
+        approved = action == "approve"
+        status_key = ADMIN_STATUS_KEYS[action]
+        applicant = entry.request.from_user
+        status = t(
+            self.language,
+            status_key,
+            user=entry._user_display(applicant),
+            user_id=applicant.id,
+            admin=entry._admin_display(call.from_user),
+        )
+        entry.status_line = f"{entry.index}. {status}"
+        admin_link = entry._user_full_name_link(
+            call.from_user.id, call.from_user.full_name
+        )
+        entry.log_status = f"{'Approved' if approved else 'Denied'} by {admin_link}"
+        entry._mark_resolved(approved, status_key.removeprefix("jr_status_"))
+        return entry._close_args(approved, admin=call.from_user.id), [
+            entry._apply_admin_action(action),
+            entry._notify_applicant(
+                "jr_private_approved" if approved else "jr_private_rejected"
+            ),
+        ]
+
+    async def _answer_lease(self, call: types.CallbackQuery, lease: str):
+        await self.bot.answer_callback_query(
+            callback_query_id=call.id,
+            text="Please try again"
+            if lease == JoinRequestVote.LEASE_UNCHECKED
+            else "Expired",
+        )
+
+    async def handle_action(self, call: types.CallbackQuery, action: str):
+        """
+        Decide every pending applicant of the batch at once.
+        """
+        if not await self._check_action(call, action):
+            return
+
+        lease = JoinRequestVote.LEASE_LOST
+        if self._begin_resolving():
+            lease = await self._hold_lease()
+        if lease != JoinRequestVote.LEASE_HELD:
+            await self._answer_lease(call, lease)
+            return
+
+        closes = []
+        stage2 = []
+        for entry in self._claimed:
+            close, calls = self._resolve_by_admin(entry, call, action)
+            closes.append(close)
+            stage2.extend(calls)
+
+        with span("batch.action.close"):
+            await BotDatabase.close_join_requests(closes)
+        with span("batch.action.publish"):
+            await self._gather(
+                self._edit_message([self._entry_line(entry) for entry in self.entries]),
+                self._edit_log([self._entry_log_line(entry) for entry in self.entries]),
+                self._unpin(),
+                self.entries[0]._flush_votes(),
+                self.bot.answer_callback_query(callback_query_id=call.id, text="Done"),
+                *stage2,
+            )
+        self.state = JoinRequestVote.RESOLVED
+        await self._close()
+
+    async def handle_entry_action(
+        self, call: types.CallbackQuery, entry: BatchedJoinRequestVote, action: str
+    ):
+        """
+        Decide one applicant; the others keep voting until the deadline, and
+        the batch is closed once nobody is left pending.
+        """
+        if not await self._check_action(call, action):
+            return
+
+        lease = JoinRequestVote.LEASE_LOST
+        if entry._begin_resolving():
+            lease = await self._hold_lease([entry])
+        if lease != JoinRequestVote.LEASE_HELD:
+            await self._answer_lease(call, lease)
+            return
+
+        close, stage2 = self._resolve_by_admin(entry, call, action)
+        with span("batch.entry_action.close"):
+            await BotDatabase.close_join_requests([close])
+        finished = not self._pending_entries() and self._begin_resolving()
+        if finished:
+            stage2.extend([self._unpin(), self.entries[0]._flush_votes()])
+            self.state = JoinRequestVote.RESOLVED
+        with span("batch.entry_action.publish"):
+            await self._gather(
+                self._edit_message([self._entry_line(entry) for entry in self.entries])
+                if finished
+                else self._refresh_message(),
+                self._edit_log([self._entry_log_line(entry) for entry in self.entries]),
+                self.bot.answer_callback_query(callback_query_id=call.id, text="Done"),
+                *stage2,
+            )
+        if finished:
+            await self._close()
+
+    async def _close(self):
+        self.scheduler.cancel(self.batch_id)
+        await self._gather(*(entry._delete_session() for entry in self.entries))
+        if self.on_close is not None:
+            for entry in self.entries:
+                self.on_close(entry.uuid)
+
+
+class JoinRequestBatcher:
+    """
+    Decide per incoming join request whether it gets its own vote or joins a
+    batch. A request starts its own vote unless min_size requests of the same
+    chat arrived within window seconds; then requests are collected for
+    collect seconds (or until max_size) and voted on in one JoinRequestBatch.
+    """
+
+    def __init__(
+        self,
+        scheduler: DeadlineScheduler,
+        start_single: Callable[[types.ChatJoinRequest, str, dict], Awaitable],
+        start_batch: Callable[[list[tuple], dict], Awaitable],
+        window: float = 60,
+        min_size: int = 5,
+        max_size: int = 15,
+        collect: float = 15,
+        clock: Callable[[], float] | None = None,
+    ):
+        self.scheduler = scheduler
+        self.start_single = start_single
+        self.start_batch = start_batch
+        self.window = window
+        self.min_size = max(int(min_size), 2)
+        # Five buttons per applicant plus the row of three batch actions must
+        # fit into 100 buttons.
+        self.max_size = min(max(int(max_size), self.min_size), 19)
+        self.collect = collect
+        self._clock = clock or scheduler.now
+        self._arrivals: dict[int, deque] = {}
+        self._next_sweep = 0.0
+        self._pending: dict[int, tuple[list[tuple], dict]] = {}
+
+    @classmethod
+    def from_settings(
+        cls,
+        scheduler: DeadlineScheduler,
+        start_single: Callable[[types.ChatJoinRequest, str, dict], Awaitable],
+        start_batch: Callable[[list[tuple], dict], Awaitable],
+    ) -> "JoinRequestBatcher":
+        return cls(
+            scheduler,
+            start_single,
+            start_batch,
+            window=float(settings.get("batch.window", 60)),
+            min_size=int(settings.get("batch.min_size", 5)),
+            max_size=int(settings.get("batch.max_size", 15)),
+            collect=float(settings.get("batch.collect", 15)),
+        )
+
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"batch:{chat_id}"
+
+    def _sweep_arrivals(self, now: float):
+        """
+        Forget chats without an arrival in the last window, at most once per
+        window, so that _arrivals only holds recently active chats.
+        """
+        for chat_id in [
+            chat_id
+            for chat_id, arrivals in self._arrivals.items()
+            if arrivals[-1] <= now - self.window
+        ]:
+            del self._arrivals[chat_id]
+        self._next_sweep = now + self.window
+
+    def _record_arrival(self, chat_id: int) -> int:
+        now = self._clock()
+        if now >= self._next_sweep:
+            self._sweep_arrivals(now)
+        arrivals = self._arrivals.setdefault(chat_id, deque())
+        arrivals.append(now)
+        while arrivals and arrivals[0] <= now - self.window:
+            arrivals.popleft()
+        return len(arrivals)
+
+    async def add(
+        self, request: types.ChatJoinRequest, uuid: str, group_settings: dict
+    ):
+        chat_id = request.chat.id
+        recent = self._record_arrival(chat_id)
+
+        pending = self._pending.get(chat_id)
+        if pending is not None:
+            requests = [pending_request for pending_request, _ in pending[0]]
+            length = JoinRequestBatch.text_length(
+                requests + [request], pending[1].get("language")
+            )
+            if length <= JoinRequestBatch.MAX_TEXT_LENGTH:
+                pending[0].append((request, uuid))
+                if len(pending[0]) >= self.max_size:
+                    await self.flush(chat_id)
+                return
+            # The batch message would get too long; this request opens the
+            # next batch.
+            await self.flush(chat_id)
+
+        if recent < self.min_size:
+            await self.start_single(request, uuid, group_settings)
+            return
+
+        self._pending[chat_id] = ([(request, uuid)], group_settings)
+        self.scheduler.schedule(
+            self._key(chat_id),
+            self._clock() + self.collect,
+            lambda: self.flush(chat_id),
+        )
+
+    async def flush(self, chat_id: int):
+        pending = self._pending.pop(chat_id, None)
+        self.scheduler.cancel(self._key(chat_id))
+        if pending is None:
+            return
+        requests, group_settings = pending
+        if len(requests) == 1:
+            request, uuid = requests[0]
+            await self.start_single(request, uuid, group_settings)
+            return
+        await self.start_batch(requests, group_settings)
+
+    def stats(self) -> dict:
+        return {
+            "collecting_chats": len(self._pending),
+            "collecting_requests": sum(len(p[0]) for p in self._pending.values()),
+        }
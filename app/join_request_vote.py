@@ -1,35 +1,118 @@
 import asyncio
 import html
+from datetime import datetime, timezone
+from typing import Callable
 
 from loguru import logger
 from telebot import types
 
+from app.callback_data import encode_action, encode_status, encode_vote
+from app.coordination import Coordinator
+from app.metrics import record_join_request_outcome
 from app_conf import settings
 from setting.telegrambot import BotSetting
+from utils.chat_member_cache import MemberCache
 from utils.i18n import t
 from utils.postgres import BotDatabase
+from utils.scheduler import DeadlineScheduler
+from utils.tracing import span
 
 
 class JoinRequestVote:
+    # Lifecycle of a vote. The live instance is the authority while it exists:
+    # pending accepts ballots and admin actions, resolving means a decision is
+    # being published, resolved means join_request has been closed.
+    PENDING = "pending"
+    RESOLVING = "resolving"
+    RESOLVED = "resolved"
+    # Outcomes of _hold_lease.
+    LEASE_HELD = "held"
+    LEASE_LOST = "lost"
+    LEASE_UNCHECKED = "unchecked"
+    # Seconds to push the deadline back when buffered ballots cannot be
+    # written, doubled on each failure up to VOTE_FLUSH_RETRY_MAX. After
+    # VOTE_FLUSH_ATTEMPTS failed flushes the vote is decided from memory.
+    VOTE_FLUSH_RETRY = 5
+    VOTE_FLUSH_RETRY_MAX = 60
+    VOTE_FLUSH_ATTEMPTS = 6
+    # Attempts to write a new session row before the vote is given up.
+    SESSION_SAVE_ATTEMPTS = 3
+
     def __init__(
-        self, bot, request: types.ChatJoinRequest, uuid: str, group_settings: dict
+        self,
+        bot,
+        request: types.ChatJoinRequest,
+        uuid: str,
+        group_settings: dict,
+        scheduler: DeadlineScheduler,
+        on_close: Callable[[str], None] | None = None,
     ):
         self.bot = bot
+        self.scheduler = scheduler
+        self.on_close = on_close
         self.request = request
         self.uuid = uuid
         self.group_settings = group_settings
         self.language = group_settings.get("language")
         self.vote_time = int(group_settings.get("vote_time", 600))
         self.advanced_vote_enabled = bool(group_settings.get("advanced_vote", False))
-        self.message1 = None
-        self.message2 = None
-        self.message3 = None
-        self.message4 = None
-        self._manual_resolved = asyncio.Event()
+        self.message1_id: int | None = None
+        self.message2_id: int | None = None
+        self.message3_id: int | None = None
+        self.message4_id: int | None = None
         self._vote_lock = asyncio.Lock()
         self._yes_voters: dict[int, str] = {}
         self._no_voters: dict[int, str] = {}
         self.log_message_id: int | None = None
+        self.deadline: float | None = None
+        self.cleanup_at: float | None = None
+        self.lease_epoch = 0
+        self._flush_failures = 0
+        self.resumed = False
+        self.state = self.PENDING
+        self.result: bool | None = None
+
+    @classmethod
+    def from_session(
+        cls,
+        bot,
+        session: dict,
+        scheduler: DeadlineScheduler,
+        on_close: Callable[[str], None] | None = None,
+    ) -> "JoinRequestVote":
+        """
+        Rebuild a vote from a persisted join_request_session row.
+        """
+        request = types.ChatJoinRequest.de_json(session["request"])
+        instance = cls(
+            bot=bot,
+            request=request,
+            uuid=str(session["uuid"]),
+            group_settings=session["group_settings"],
+            scheduler=scheduler,
+            on_close=on_close,
+        )
+        instance.advanced_vote_enabled = bool(session["advanced_vote"])
+        instance.message1_id = session["message1_id"]
+        instance.message2_id = session["message2_id"]
+        instance.message3_id = session["message3_id"]
+        instance.message4_id = session["message4_id"]
+        instance.log_message_id = session["log_message_id"]
+        instance.lease_epoch = session["lease_epoch"]
+        instance._yes_voters = {
+            int(user_id): name for user_id, name in session["yes_voters"].items()
+        }
+        instance._no_voters = {
+            int(user_id): name for user_id, name in session["no_voters"].items()
+        }
+        instance.deadline = session["deadline"].timestamp()
+        if session["cleanup_at"] is not None:
+            instance.cleanup_at = session["cleanup_at"].timestamp()
+        if not session["waiting"]:
+            instance.state = cls.RESOLVED
+            instance.result = session["result"]
+        instance.resumed = True
+        return instance
 
     @property
     def chat_id(self) -> int:
@@ -39,6 +122,84 @@ class JoinRequestVote:
     def user_id(self) -> int:
         return self.request.from_user.id
 
+    @property
+    def schedule_key(self) -> str:
+        return self.uuid
+
+    @property
+    def is_pending(self) -> bool:
+        return self.state == self.PENDING
+
+    @classmethod
+    def flush_retry_delay(cls, failures: int) -> float | None:
+        """
+        Seconds until the next deadline attempt after the given number of
+        failed ballot flushes, or None once the attempts are used up.
+        """
+        if failures >= cls.VOTE_FLUSH_ATTEMPTS:
+            return None
+        return min(cls.VOTE_FLUSH_RETRY * 2 ** (failures - 1), cls.VOTE_FLUSH_RETRY_MAX)
+
+    def _begin_resolving(self) -> bool:
+        """
+        Claim the decision for the caller. Only the first caller wins, so an
+        admin click and the deadline can never both publish a result.
+        """
+        if self.state != self.PENDING:
+            return False
+        self.state = self.RESOLVING
+        self.scheduler.cancel(self.uuid)
+        return True
+
+    async def _hold_lease(self) -> str:
+        """
+        Called after _begin_resolving: fence the decision with the session
+        lease before any side effect. Unless LEASE_HELD is returned nothing
+        may be published: on LEASE_LOST the vote was taken over by another
+        instance and dropped here, on LEASE_UNCHECKED the lease could not be
+        checked and the vote was handed back to its deadline.
+        """
+        try:
+            if await Coordinator.fence([self]):
+                return self.LEASE_HELD
+        except Exception:
+            logger.exception("failed to fence join request uuid={}", self.uuid)
+            self.state = self.PENDING
+            self.scheduler.schedule(
+                self.uuid,
+                max(self.deadline, self.scheduler.now() + self.VOTE_FLUSH_RETRY),
+                self._on_deadline,
+            )
+            return self.LEASE_UNCHECKED
+        logger.warning(
+            "join request uuid={} was taken over by another instance", self.uuid
+        )
+        self.state = self.RESOLVED
+        if self.on_close is not None:
+            self.on_close(self.uuid)
+        return self.LEASE_LOST
+
+    def _close_args(self, approved: bool, **fields) -> dict:
+        """
+        Arguments closing this vote's join_request row with a decision.
+        """
+        return {
+            "uuid": self.uuid,
+            "group_id": self.chat_id,
+            "user_id": self.user_id,
+            "result": approved,
+            **fields,
+        }
+
+    def _mark_resolved(self, approved: bool, outcome: str):
+        """
+        outcome is the jr_status_* key of the decision without its prefix,
+        or "failed" when the vote could not be opened.
+        """
+        self.state = self.RESOLVED
+        self.result = approved
+        record_join_request_outcome(self.chat_id, outcome)
+
     def _user_display(self, user: types.User) -> str:
         if user.username:
             return f"@{user.username}"
@@ -160,21 +321,22 @@ class JoinRequestVote:
     async def _safe_stop_poll(self):
         if self.advanced_vote_enabled:
             return None
-        if not self.message2:
+        if not self.message2_id:
             return None
         try:
             return await self.bot.stop_poll(
                 chat_id=self.chat_id,
-                message_id=self.message2.message_id,
+                message_id=self.message2_id,
             )
         except Exception:
             return None
 
     async def _close_failed_request(self):
+        self.state = self.RESOLVING
         applicant = self.request.from_user
         applicant_display = self._user_display(applicant)
 
-        if self.message1:
+        if self.message1_id:
             try:
                 await self._refresh_message1(
                     "jr_status_rejected",
@@ -184,20 +346,85 @@ class JoinRequestVote:
             except Exception:
                 pass
 
+        BotDatabase.queue_join_request_result(
+            uuid=self.uuid,
+            group_id=self.chat_id,
+            user_id=self.user_id,
+            result=False,
+            yes_votes=0,
+            no_votes=0,
+        )
+
         try:
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=False,
-                yes_votes=0,
-                no_votes=0,
-            )
+            await self._apply_join_result(False)
         except Exception:
             pass
 
+        self._mark_resolved(False, "failed")
+        await self._close()
+
+    def _request_payload(self) -> dict:
+        chat = self.request.chat
+        applicant = self.request.from_user
+        return {
+            "chat": {"id": chat.id, "type": chat.type, "title": chat.title},
+            "from": {
+                "id": applicant.id,
+                "is_bot": applicant.is_bot,
+                "first_name": applicant.first_name,
+                "last_name": applicant.last_name,
+                "username": applicant.username,
+            },
+            "user_chat_id": self.request.user_chat_id,
+            "date": self.request.date,
+        }
+
+    async def _save_session(self, **extra) -> bool:
+        """
+        Persist the session row, retrying briefly. Returns False if it could
+        not be written: the vote could not be resumed, and with coordination
+        a missing row reads as a takeover at decision time.
+        """
+        for attempt in range(1, self.SESSION_SAVE_ATTEMPTS + 1):
+            try:
+                await BotDatabase.save_join_request_session(
+                    uuid=self.uuid,
+                    chat_id=self.chat_id,
+                    user_id=self.user_id,
+                    request=self._request_payload(),
+                    group_settings=self.group_settings,
+                    advanced_vote=self.advanced_vote_enabled,
+                    message1_id=self.message1_id,
+                    message2_id=self.message2_id,
+                    message3_id=self.message3_id,
+                    log_message_id=self.log_message_id,
+                    deadline=datetime.fromtimestamp(self.deadline, tz=timezone.utc),
+                    owner=Coordinator.instance_id,
+                    **extra,
+                )
+                return True
+            except Exception:
+                logger.exception(
+                    "failed to persist join request session uuid={} attempt={}",
+                    self.uuid,
+                    attempt,
+                )
+            if attempt < self.SESSION_SAVE_ATTEMPTS:
+                await asyncio.sleep(attempt)
+        return False
+
+    async def _update_session(self, **fields):
+        if fields.get("cleanup_at") is not None:
+            fields["cleanup_at"] = datetime.fromtimestamp(
+                fields["cleanup_at"], tz=timezone.utc
+            )
         try:
-            await self._apply_join_result(False)
+            await BotDatabase.update_join_request_session(self.uuid, **fields)
         except Exception:
-            pass
+            logger.exception("failed to update join request session uuid={}", self.uuid)
+
+    async def _delete_session(self):
+        BotDatabase.queue_join_request_session_delete(self.uuid)
 
     async def _apply_join_result(self, approved: bool):
         if approved:
@@ -212,7 +439,7 @@ class JoinRequestVote:
             )
 
     async def _check_invite_permission(self, user_id: int) -> bool:
-        member = await self.bot.get_chat_member(chat_id=self.chat_id, user_id=user_id)
+        member = await MemberCache.get(self.bot, self.chat_id, user_id)
         if member.status == "creator":
             return True
         if member.status != "administrator":
@@ -220,29 +447,23 @@ class JoinRequestVote:
         return bool(getattr(member, "can_invite_users", False))
 
     async def _is_group_member(self, user_id: int) -> bool:
-        member = await self.bot.get_chat_member(chat_id=self.chat_id, user_id=user_id)
+        member = await MemberCache.get(self.bot, self.chat_id, user_id)
         return member.status not in {"left", "kicked"}
 
-    async def _get_bot_username(self) -> str:
-        if BotSetting.bot_username:
-            return BotSetting.bot_username
-        me = await self.bot.get_me()
-        return me.username
-
     def _has_voted(self, user_id: int) -> bool:
         return user_id in self._yes_voters or user_id in self._no_voters
 
     async def _build_advanced_vote_keyboard(self) -> types.InlineKeyboardMarkup:
-        bot_username = await self._get_bot_username()
+        bot_username = BotSetting.bot_username
         keyboard = types.InlineKeyboardMarkup(row_width=2)
         keyboard.add(
             types.InlineKeyboardButton(
                 text=t(self.language, "jr_poll_yes"),
-                callback_data=f"jrv {self.uuid} yes",
+                callback_data=encode_vote(self.uuid, "yes"),
             ),
             types.InlineKeyboardButton(
                 text=t(self.language, "jr_poll_no"),
-                callback_data=f"jrv {self.uuid} no",
+                callback_data=encode_vote(self.uuid, "no"),
             ),
         )
         keyboard.add(
@@ -254,24 +475,24 @@ class JoinRequestVote:
         return keyboard
 
     async def _refresh_message1(self, key: str, **kwargs):
-        if not self.message1:
+        if not self.message1_id:
             return
         await self.bot.edit_message_text(
             chat_id=self.chat_id,
-            message_id=self.message1.message_id,
+            message_id=self.message1_id,
             text=t(self.language, key, **kwargs),
             parse_mode="HTML",
             reply_markup=None,
         )
 
     async def _notify_applicant(self, text_key: str):
-        if not self.message3:
+        if not self.message3_id:
             return
         try:
             await self.bot.send_message(
                 chat_id=self.user_id,
                 text=t(self.language, text_key),
-                reply_to_message_id=self.message3.message_id,
+                reply_to_message_id=self.message3_id,
             )
         except Exception:
             return
@@ -283,153 +504,184 @@ class JoinRequestVote:
             return t(self.language, "jr_status_approve_label")
         return t(self.language, "jr_status_reject_label")
 
-    async def run(self):
-        applicant = self.request.from_user
-        applicant_display = self._user_display(applicant)
-        logger.debug(
-            "join request flow start uuid={} chat_id={} user_id={} advanced_vote={} anonymous_vote={}",
-            self.uuid,
-            self.chat_id,
-            self.user_id,
-            self.advanced_vote_enabled,
-            bool(self.group_settings.get("anonymous_vote", True)),
-        )
+    async def start(self):
+        """
+        Send the vote messages (or restore a resumed session) and hand the
+        deadline over to the scheduler. Returns once the vote is open.
+        """
+        if not self.resumed:
+            if not await self._open_vote():
+                return
+            self.deadline = self.scheduler.now() + self.vote_time
+            if not await self._save_session():
+                await self._gather(
+                    self._retire_message2(),
+                    self._edit_log_result(status="Denied", yes_votes=0, no_votes=0),
+                )
+                await self._close_failed_request()
+                return
+        elif self.cleanup_at is not None:
+            self.scheduler.schedule(self.uuid, self.cleanup_at, self._on_cleanup)
+            return
 
-        msg1_text = t(
-            self.language,
-            "jr_requesting",
-            user=applicant_display,
-            user_id=applicant.id,
-        )
-        keyboard = types.InlineKeyboardMarkup(row_width=3)
-        keyboard.add(
-            types.InlineKeyboardButton(
-                "Approve", callback_data=f"jr {self.uuid} approve"
-            ),
-            types.InlineKeyboardButton(
-                "Reject", callback_data=f"jr {self.uuid} reject"
-            ),
-            types.InlineKeyboardButton("Ban", callback_data=f"jr {self.uuid} ban"),
+        self.scheduler.schedule(self.uuid, self.deadline, self._on_deadline)
+
+    async def _on_deadline(self):
+        if (
+            self.advanced_vote_enabled
+            and self.is_pending
+            and not await self._flush_votes()
+        ):
+            self._flush_failures += 1
+            delay = self.flush_retry_delay(self._flush_failures)
+            if delay is not None:
+                # Give the database a chance to catch up with the ballots, so
+                # a resumed session would count the same votes.
+                self.scheduler.schedule(
+                    self.uuid, self.scheduler.now() + delay, self._on_deadline
+                )
+                return
+            logger.warning(
+                "ballots of join request uuid={} still unwritten after {} "
+                "attempts, deciding from in-memory votes",
+                self.uuid,
+                self._flush_failures,
+            )
+        if not self._begin_resolving():
+            logger.debug(
+                "join request already resolved before timeout uuid={}", self.uuid
+            )
+            await self._close()
+            return
+        if await self._hold_lease() != self.LEASE_HELD:
+            return
+        await self._finalize_by_votes()
+
+        self.cleanup_at = self.scheduler.now() + 60
+        await self._update_session(
+            message4_id=self.message4_id,
+            cleanup_at=self.cleanup_at,
         )
+        self.scheduler.schedule(self.uuid, self.cleanup_at, self._on_cleanup)
+
+    async def _on_cleanup(self):
+        if self.message2_id:
+            await self._safe_delete_message(self.chat_id, self.message2_id)
+        if self.message4_id:
+            await self._safe_delete_message(self.chat_id, self.message4_id)
+        await self._close()
+        logger.debug("join request flow completed uuid={}", self.uuid)
+
+    async def _close(self):
+        self.scheduler.cancel(self.uuid)
+        await self._delete_session()
+        if self.on_close is not None:
+            self.on_close(self.uuid)
+
+    async def _gather(self, *aws) -> list:
+        """
+        Run independent Telegram/DB calls of one stage concurrently.
+        Failures are logged and returned in place of the result.
+        """
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(
+                    "join request call failed uuid={}", self.uuid
+                )
+        return results
+
+    async def _send_message2(self) -> int:
+        if self.advanced_vote_enabled:
+            message2 = await self.bot.send_message(
+                chat_id=self.chat_id,
+                text=t(self.language, "jr_poll_question"),
+                reply_to_message_id=self.message1_id,
+                reply_markup=await self._build_advanced_vote_keyboard(),
+                protect_content=True,
+            )
+            logger.debug(
+                "advanced message2 sent uuid={} chat_id={} message_id={}",
+                self.uuid,
+                self.chat_id,
+                message2.message_id,
+            )
+            return message2.message_id
+
+        try:
+            message2 = await self.bot.send_poll(
+                chat_id=self.chat_id,
+                question=t(self.language, "jr_poll_question"),
+                options=[
+                    t(self.language, "jr_poll_yes"),
+                    t(self.language, "jr_poll_no"),
+                ],
+                is_anonymous=bool(self.group_settings.get("anonymous_vote", True)),
+                protect_content=True,
+                allows_multiple_answers=False,
+                reply_to_message_id=self.message1_id,
+            )
+            logger.debug(
+                "poll message2 sent uuid={} chat_id={} message_id={}",
+                self.uuid,
+                self.chat_id,
+                message2.message_id,
+            )
+            return message2.message_id
+        except Exception:
+            logger.exception(
+                "failed to send poll message2, fallback to advanced uuid={} chat_id={}",
+                self.uuid,
+                self.chat_id,
+            )
 
-        self.message1 = await self.bot.send_message(
+        self.advanced_vote_enabled = True
+        message2 = await self.bot.send_message(
             chat_id=self.chat_id,
-            text=msg1_text,
-            parse_mode="HTML",
-            reply_markup=keyboard,
+            text=t(self.language, "jr_poll_question"),
+            reply_to_message_id=self.message1_id,
+            reply_markup=await self._build_advanced_vote_keyboard(),
+            protect_content=True,
         )
-        logger.debug(
-            "message1 sent uuid={} chat_id={} message_id={}",
+        logger.warning(
+            "poll fallback activated, advanced message2 sent uuid={} chat_id={} message_id={}",
             self.uuid,
             self.chat_id,
-            self.message1.message_id,
+            message2.message_id,
         )
-        await self._send_pending_log()
-
-        if self.advanced_vote_enabled:
-            try:
-                self.message2 = await self.bot.send_message(
-                    chat_id=self.chat_id,
-                    text=t(self.language, "jr_poll_question"),
-                    reply_to_message_id=self.message1.message_id,
-                    reply_markup=await self._build_advanced_vote_keyboard(),
-                    protect_content=True,
-                )
-                logger.debug(
-                    "advanced message2 sent uuid={} chat_id={} message_id={}",
-                    self.uuid,
-                    self.chat_id,
-                    self.message2.message_id,
-                )
-            except Exception:
-                logger.exception(
-                    "failed to send advanced message2 uuid={} chat_id={}",
-                    self.uuid,
-                    self.chat_id,
-                )
-                await self._close_failed_request()
-                return
-        else:
-            try:
-                self.message2 = await self.bot.send_poll(
-                    chat_id=self.chat_id,
-                    question=t(self.language, "jr_poll_question"),
-                    options=[
-                        t(self.language, "jr_poll_yes"),
-                        t(self.language, "jr_poll_no"),
-                    ],
-                    is_anonymous=bool(self.group_settings.get("anonymous_vote", True)),
-                    protect_content=True,
-                    allows_multiple_answers=False,
-                    reply_to_message_id=self.message1.message_id,
-                )
-                logger.debug(
-                    "poll message2 sent uuid={} chat_id={} message_id={}",
-                    self.uuid,
-                    self.chat_id,
-                    self.message2.message_id,
-                )
-            except Exception:
-                logger.exception(
-                    "failed to send poll message2, fallback to advanced uuid={} chat_id={}",
-                    self.uuid,
-                    self.chat_id,
-                )
-                self.advanced_vote_enabled = True
-                try:
-                    self.message2 = await self.bot.send_message(
-                        chat_id=self.chat_id,
-                        text=t(self.language, "jr_poll_question"),
-                        reply_to_message_id=self.message1.message_id,
-                        reply_markup=await self._build_advanced_vote_keyboard(),
-                        protect_content=True,
-                    )
-                    logger.warning(
-                        "poll fallback activated, advanced message2 sent uuid={} chat_id={} message_id={}",
-                        self.uuid,
-                        self.chat_id,
-                        self.message2.message_id,
-                    )
-                except Exception:
-                    logger.exception(
-                        "failed to send fallback advanced message2 uuid={} chat_id={}",
-                        self.uuid,
-                        self.chat_id,
-                    )
-                    await self._close_failed_request()
-                    return
+        return message2.message_id
 
-        if self.group_settings.get("pin_msg", False):
-            try:
-                await self.bot.pin_chat_message(
-                    chat_id=self.chat_id,
-                    message_id=self.message2.message_id,
-                    disable_notification=True,
-                )
-                logger.debug(
-                    "message2 pinned uuid={} chat_id={} message_id={}",
-                    self.uuid,
-                    self.chat_id,
-                    self.message2.message_id,
-                )
-            except Exception:
-                logger.exception(
-                    "failed to pin message2 uuid={} chat_id={} message_id={}",
-                    self.uuid,
-                    self.chat_id,
-                    self.message2.message_id if self.message2 else None,
-                )
-                pass
+    async def _pin_message2(self):
+        try:
+            await self.bot.pin_chat_message(
+                chat_id=self.chat_id,
+                message_id=self.message2_id,
+                disable_notification=True,
+            )
+            logger.debug(
+                "message2 pinned uuid={} chat_id={} message_id={}",
+                self.uuid,
+                self.chat_id,
+                self.message2_id,
+            )
+        except Exception:
+            logger.exception(
+                "failed to pin message2 uuid={} chat_id={} message_id={}",
+                self.uuid,
+                self.chat_id,
+                self.message2_id,
+            )
 
+    async def _send_message3(self):
         try:
             status_keyboard = types.InlineKeyboardMarkup(row_width=1)
             status_keyboard.add(
                 types.InlineKeyboardButton(
                     text=t(self.language, "jr_check_status"),
-                    callback_data=f"jrs {self.uuid}",
+                    callback_data=encode_status(self.uuid),
                 )
             )
-            self.message3 = await self.bot.send_message(
+            message3 = await self.bot.send_message(
                 chat_id=self.user_id,
                 text=t(
                     self.language,
@@ -439,11 +691,12 @@ class JoinRequestVote:
                 ),
                 reply_markup=status_keyboard,
             )
+            self.message3_id = message3.message_id
             logger.debug(
                 "message3 sent to applicant uuid={} user_id={} message_id={}",
                 self.uuid,
                 self.user_id,
-                self.message3.message_id,
+                self.message3_id,
             )
         except Exception:
             logger.exception(
@@ -451,55 +704,136 @@ class JoinRequestVote:
                 self.uuid,
                 self.user_id,
             )
-            self.message3 = None
+            self.message3_id = None
 
-        try:
-            await asyncio.wait_for(self._manual_resolved.wait(), timeout=self.vote_time)
-            return
-        except asyncio.TimeoutError:
-            pass
+    async def _open_vote(self) -> bool:
+        # Stage 1: the request message every other group message replies to.
+        # Stage 2: the vote message and the log channel entry.
+        # Stage 3: pinning the vote message and the applicant DM.
+        applicant = self.request.from_user
+        applicant_display = self._user_display(applicant)
+        logger.debug(
+            "join request flow start uuid={} chat_id={} user_id={} advanced_vote={} anonymous_vote={}",
+            self.uuid,
+            self.chat_id,
+            self.user_id,
+            self.advanced_vote_enabled,
+            bool(self.group_settings.get("anonymous_vote", True)),
+        )
 
-        waiting = await BotDatabase.get_join_request_waiting_by_uuid(self.uuid)
-        if waiting is not True:
-            logger.debug(
-                "join request already resolved before timeout uuid={}", self.uuid
+        msg1_text = t(
+            self.language,
+            "jr_requesting",
+            user=applicant_display,
+            user_id=applicant.id,
+        )
+        keyboard = types.InlineKeyboardMarkup(row_width=3)
+        keyboard.add(
+            types.InlineKeyboardButton(
+                "Approve", callback_data=encode_action(self.uuid, "approve")
+            ),
+            types.InlineKeyboardButton(
+                "Reject", callback_data=encode_action(self.uuid, "reject")
+            ),
+            types.InlineKeyboardButton(
+                "Ban", callback_data=encode_action(self.uuid, "ban")
+            ),
+        )
+
+        with span("open_vote.message1"):
+            message1 = await self.bot.send_message(
+                chat_id=self.chat_id,
+                text=msg1_text,
+                parse_mode="HTML",
+                reply_markup=keyboard,
             )
-            return
+        self.message1_id = message1.message_id
+        logger.debug(
+            "message1 sent uuid={} chat_id={} message_id={}",
+            self.uuid,
+            self.chat_id,
+            self.message1_id,
+        )
+
+        with span("open_vote.message2"):
+            message2_id, _ = await asyncio.gather(
+                self._send_message2(),
+                self._send_pending_log(),
+                return_exceptions=True,
+            )
+        if isinstance(message2_id, Exception):
+            logger.opt(exception=message2_id).error(
+                "failed to send message2 uuid={} chat_id={}",
+                self.uuid,
+                self.chat_id,
+            )
+            await self._close_failed_request()
+            return False
+        self.message2_id = message2_id
+
+        stage3 = [self._send_message3()]
+        if self.group_settings.get("pin_msg", False):
+            stage3.append(self._pin_message2())
+        with span("open_vote.notify"):
+            await asyncio.gather(*stage3)
+        return True
 
-        yes_votes = 0
-        no_votes = 0
+    async def _flush_votes(self) -> bool:
+        try:
+            await BotDatabase.flush_join_request_votes()
+        except Exception:
+            logger.exception("failed to flush buffered votes uuid={}", self.uuid)
+            return False
+        return True
+
+    async def _collect_votes(self) -> tuple[int, int]:
+        # No ballots are accepted once the decision is claimed, so these are
+        # final; they include ballots cast while the deadline was deferred.
         if self.advanced_vote_enabled:
             async with self._vote_lock:
-                yes_votes = len(self._yes_voters)
-                no_votes = len(self._no_voters)
-            if self.message2:
-                try:
-                    await self.bot.edit_message_text(
-                        chat_id=self.chat_id,
-                        message_id=self.message2.message_id,
-                        text=t(
-                            self.language,
-                            "jr_final_votes",
-                            yes_votes=yes_votes,
-                            no_votes=no_votes,
-                        ),
-                    )
-                except Exception:
-                    pass
-        else:
-            poll_result = await self._safe_stop_poll()
-
-            if poll_result and poll_result.options and len(poll_result.options) >= 2:
-                yes_votes = int(poll_result.options[0].voter_count)
-                no_votes = int(poll_result.options[1].voter_count)
-            elif (
-                self.message2
-                and self.message2.poll
-                and len(self.message2.poll.options) >= 2
-            ):
-                yes_votes = int(self.message2.poll.options[0].voter_count)
-                no_votes = int(self.message2.poll.options[1].voter_count)
+                return len(self._yes_voters), len(self._no_voters)
+
+        poll_result = await self._safe_stop_poll()
+        if poll_result and poll_result.options and len(poll_result.options) >= 2:
+            return (
+                int(poll_result.options[0].voter_count),
+                int(poll_result.options[1].voter_count),
+            )
+        return 0, 0
+
+    async def _send_message4(self, key: str):
+        message4 = await self.bot.send_message(
+            chat_id=self.chat_id,
+            text=t(self.language, key),
+            reply_to_message_id=self.message1_id,
+        )
+        self.message4_id = message4.message_id
+
+    async def _edit_final_votes(self, yes_votes: int, no_votes: int):
+        if not self.advanced_vote_enabled or not self.message2_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message2_id,
+                text=t(
+                    self.language,
+                    "jr_final_votes",
+                    yes_votes=yes_votes,
+                    no_votes=no_votes,
+                ),
+            )
+        except Exception:
+            pass
+
+    async def _finalize_by_votes(self):
+        # Stage 1: collect the votes of the claimed decision.
+        # Stage 2: publish the decision everywhere at once.
+        applicant = self.request.from_user
+        applicant_display = self._user_display(applicant)
 
+        with span("finalize.collect_votes"):
+            yes_votes, no_votes = await self._collect_votes()
         total_votes = yes_votes + no_votes
         min_voters = int(self.group_settings.get("mini_voters", 1))
         logger.debug(
@@ -511,31 +845,14 @@ class JoinRequestVote:
             min_voters,
         )
 
+        unpin = False
         if total_votes < min_voters:
-            self.message4 = await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=t(self.language, "jr_not_enough_voters"),
-                reply_to_message_id=self.message1.message_id,
-            )
-            await self._refresh_message1(
-                "jr_status_not_enough_voters",
-                user=applicant_display,
-                user_id=applicant.id,
-            )
-            await self._notify_applicant("jr_no_votes_private")
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=False,
-                yes_votes=yes_votes,
-                no_votes=no_votes,
-            )
-            await self._apply_join_result(False)
-            await self._edit_log_result(
-                status="Denied",
-                yes_votes=yes_votes,
-                no_votes=no_votes,
-            )
+            status_key = "jr_status_not_enough_voters"
+            group_key = "jr_not_enough_voters"
+            private_key = "jr_no_votes_private"
+            approved = False
         else:
+            unpin = bool(self.group_settings.get("pin_msg", False))
             if yes_votes > no_votes:
                 status_key = "jr_status_approved"
                 group_key = "jr_group_approved"
@@ -552,50 +869,56 @@ class JoinRequestVote:
                 private_key = "jr_private_rejected"
                 approved = False
 
-            self.message4 = await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=t(self.language, group_key),
-                reply_to_message_id=self.message1.message_id,
+        # Written before anything is published; see close_join_requests.
+        with span("finalize.close"):
+            await BotDatabase.close_join_requests(
+                [self._close_args(approved, yes_votes=yes_votes, no_votes=no_votes)]
             )
-            await self._refresh_message1(
+        stage2 = [
+            self._send_message4(group_key),
+            self._refresh_message1(
                 status_key,
                 user=applicant_display,
                 user_id=applicant.id,
-            )
-            await self._notify_applicant(private_key)
-            if self.group_settings.get("pin_msg", False) and self.message2:
-                await self._safe_unpin_message(self.message2.message_id)
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=approved,
-                yes_votes=yes_votes,
-                no_votes=no_votes,
-            )
-            await self._apply_join_result(approved)
-            await self._edit_log_result(
+            ),
+            self._notify_applicant(private_key),
+            self._apply_join_result(approved),
+            self._edit_log_result(
                 status="Approved" if approved else "Denied",
                 yes_votes=yes_votes,
                 no_votes=no_votes,
-            )
+            ),
+            self._edit_final_votes(yes_votes, no_votes),
+        ]
+        if unpin and self.message2_id:
+            stage2.append(self._safe_unpin_message(self.message2_id))
+        with span("finalize.publish"):
+            await self._gather(*stage2)
+        self._mark_resolved(approved, status_key.removeprefix("jr_status_"))
+
+    async def _apply_admin_action(self, action: str):
+        await self._apply_join_result(action == "approve")
+        if action == "ban":
+            await self.bot.ban_chat_member(chat_id=self.chat_id, user_id=self.user_id)
 
-        await asyncio.sleep(60)
-        if self.message2:
-            await self._safe_delete_message(self.chat_id, self.message2.message_id)
-        if self.message4:
-            await self._safe_delete_message(self.chat_id, self.message4.message_id)
-        logger.debug("join request flow completed uuid={}", self.uuid)
+    async def _retire_message2(self):
+        await self._safe_stop_poll()
+        if self.group_settings.get("pin_msg", False) and self.message2_id:
+            await self._safe_unpin_message(self.message2_id)
+        if self.message2_id:
+            await self._safe_delete_message(self.chat_id, self.message2_id)
 
     async def handle_action(self, call: types.CallbackQuery, action: str):
-        if not await self._check_invite_permission(call.from_user.id):
+        # Stage 1: permission check, then claim the decision.
+        # Stage 2: queue the decision for the database and publish it in parallel.
+        if action not in {"approve", "reject", "ban"}:
             await self.bot.answer_callback_query(
                 callback_query_id=call.id,
-                text=t(self.language, "insufficient_permissions"),
-                show_alert=True,
+                text="Unsupported action",
             )
             return
 
-        waiting = await BotDatabase.get_join_request_waiting_by_uuid(self.uuid)
-        if not waiting:
+        if not self.is_pending:
             await self.bot.answer_callback_query(
                 callback_query_id=call.id,
                 text="Expired",
@@ -603,83 +926,64 @@ class JoinRequestVote:
             )
             return
 
-        admin_display = self._admin_display(call.from_user)
-        applicant = self.request.from_user
-        applicant_display = self._user_display(applicant)
-
-        if action == "approve":
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=True,
-                admin=call.from_user.id,
-            )
-            await self._refresh_message1(
-                "jr_status_admin_approved",
-                user=applicant_display,
-                user_id=applicant.id,
-                admin=admin_display,
-            )
-            await self._notify_applicant("jr_private_approved")
-            await self._apply_join_result(True)
-            await self._edit_log_result(
-                status="Approved",
-                admin_id=call.from_user.id,
-                admin_name=call.from_user.full_name,
-            )
-        elif action == "reject":
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=False,
-                admin=call.from_user.id,
-            )
-            await self._refresh_message1(
-                "jr_status_admin_rejected",
-                user=applicant_display,
-                user_id=applicant.id,
-                admin=admin_display,
-            )
-            await self._notify_applicant("jr_private_rejected")
-            await self._apply_join_result(False)
-            await self._edit_log_result(
-                status="Denied",
-                admin_id=call.from_user.id,
-                admin_name=call.from_user.full_name,
-            )
-        elif action == "ban":
-            await BotDatabase.update_join_request(
-                uuid=self.uuid,
-                result=False,
-                admin=call.from_user.id,
-            )
-            await self._refresh_message1(
-                "jr_status_admin_banned",
-                user=applicant_display,
-                user_id=applicant.id,
-                admin=admin_display,
-            )
-            await self._notify_applicant("jr_private_rejected")
-            await self._apply_join_result(False)
-            await self.bot.ban_chat_member(chat_id=self.chat_id, user_id=self.user_id)
-            await self._edit_log_result(
-                status="Denied",
-                admin_id=call.from_user.id,
-                admin_name=call.from_user.full_name,
-            )
-        else:
+        with span("action.check_permission"):
+            allowed = await self._check_invite_permission(call.from_user.id)
+        if not allowed:
             await self.bot.answer_callback_query(
                 callback_query_id=call.id,
-                text="Unsupported action",
+                text=t(self.language, "insufficient_permissions"),
+                show_alert=True,
             )
             return
 
-        self._manual_resolved.set()
-        await self._safe_stop_poll()
-        if self.group_settings.get("pin_msg", False) and self.message2:
-            await self._safe_unpin_message(self.message2.message_id)
-        if self.message2:
-            await self._safe_delete_message(self.chat_id, self.message2.message_id)
+        lease = self.LEASE_LOST
+        if self._begin_resolving():
+            lease = await self._hold_lease()
+        if lease != self.LEASE_HELD:
+            await self.bot.answer_callback_query(
+                callback_query_id=call.id,
+                text="Please try again" if lease == self.LEASE_UNCHECKED else "Expired",
+                show_alert=False,
+            )
+            return
 
-        await self.bot.answer_callback_query(callback_query_id=call.id, text="Done")
+        admin_display = self._admin_display(call.from_user)
+        applicant = self.request.from_user
+        applicant_display = self._user_display(applicant)
+        status_key = {
+            "approve": "jr_status_admin_approved",
+            "reject": "jr_status_admin_rejected",
+            "ban": "jr_status_admin_banned",
+        }[action]
+        approved = action == "approve"
+
+        with span("action.close"):
+            await BotDatabase.close_join_requests(
+                [self._close_args(approved, admin=call.from_user.id)]
+            )
+        with span("action.publish"):
+            await self._gather(
+                self._refresh_message1(
+                    status_key,
+                    user=applicant_display,
+                    user_id=applicant.id,
+                    admin=admin_display,
+                ),
+                self._notify_applicant(
+                    "jr_private_approved" if approved else "jr_private_rejected"
+                ),
+                self._apply_admin_action(action),
+                self._edit_log_result(
+                    status="Approved" if approved else "Denied",
+                    admin_id=call.from_user.id,
+                    admin_name=call.from_user.full_name,
+                ),
+                self._retire_message2(),
+                self._flush_votes(),
+                self.bot.answer_callback_query(callback_query_id=call.id, text="Done"),
+            )
+        self._mark_resolved(approved, status_key.removeprefix("jr_status_"))
+        await self._close()
 
     async def handle_vote(self, call: types.CallbackQuery, option: str):
         if not self.advanced_vote_enabled:
@@ -689,8 +993,7 @@ class JoinRequestVote:
             )
             return
 
-        waiting = await BotDatabase.get_join_request_waiting_by_uuid(self.uuid)
-        if waiting is not True:
+        if not self.is_pending:
             await self.bot.answer_callback_query(
                 callback_query_id=call.id,
                 text="Expired",
@@ -704,7 +1007,9 @@ class JoinRequestVote:
             )
             return
 
-        if not await self._is_group_member(call.from_user.id):
+        with span("vote.check_member"):
+            is_member = await self._is_group_member(call.from_user.id)
+        if not is_member:
             await self.bot.answer_callback_query(
                 callback_query_id=call.id,
                 text=t(self.language, "insufficient_permissions"),
@@ -713,6 +1018,13 @@ class JoinRequestVote:
             return
 
         async with self._vote_lock:
+            if not self.is_pending:
+                await self.bot.answer_callback_query(
+                    callback_query_id=call.id,
+                    text="Expired",
+                )
+                return
+
             if self._has_voted(call.from_user.id):
                 await self.bot.answer_callback_query(
                     callback_query_id=call.id,
@@ -727,14 +1039,20 @@ class JoinRequestVote:
             else:
                 self._no_voters[call.from_user.id] = full_name
 
+            BotDatabase.queue_join_request_vote(
+                uuid=self.uuid,
+                user_id=call.from_user.id,
+                full_name=full_name,
+                approve=option == "yes",
+            )
+
         await self.bot.answer_callback_query(
             callback_query_id=call.id,
             text=t(self.language, "jr_vote_recorded"),
         )
 
     async def handle_realtime_result_request(self, message: types.Message):
-        waiting = await BotDatabase.get_join_request_waiting_by_uuid(self.uuid)
-        if waiting is not True:
+        if not self.is_pending:
             await self.bot.reply_to(message, "Expired")
             return
 
@@ -786,17 +1104,9 @@ class JoinRequestVote:
             )
             return
 
-        status = await BotDatabase.get_join_request_status_by_uuid(self.uuid)
-        if status is None:
-            await self.bot.answer_callback_query(
-                callback_query_id=call.id,
-                text="Expired",
-            )
-            return
-
         label = self._status_label(
-            waiting=bool(status.get("waiting", False)),
-            result=status.get("result"),
+            waiting=self.state != self.RESOLVED,
+            result=self.result,
         )
         await self.bot.answer_callback_query(
             callback_query_id=call.id,
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 18:40
+# @Author  : KimmyXYC
+# @File    : metrics.py
+# @Software: PyCharm
+import functools
+import time
+
+from aiohttp import web
+from loguru import logger
+from telebot import asyncio_helper
+from telebot.asyncio_helper import ApiTelegramException
+
+from app_conf import settings
+from utils.metrics import Metrics
+from utils.tracing import span
+
+UPDATES_HANDLED = Metrics.counter(
+    "approvebypoll_updates_handled_total",
+    "Updates handled, by handler and outcome (ok or error).",
+    ["handler", "outcome"],
+)
+UPDATE_DURATION = Metrics.histogram(
+    "approvebypoll_update_handler_duration_seconds",
+    "Time spent in each update handler.",
+    ["handler"],
+)
+TELEGRAM_REQUESTS = Metrics.counter(
+    "approvebypoll_telegram_api_requests_total",
+    "Bot API requests, by method and outcome (ok, error or rate_limited).",
+    ["method", "outcome"],
+)
+TELEGRAM_DURATION = Metrics.histogram(
+    "approvebypoll_telegram_api_request_duration_seconds",
+    "Latency of Bot API requests, excluding time spent waiting for rate limits.",
+    ["method"],
+)
+JOIN_REQUEST_SESSIONS = Metrics.gauge(
+    "approvebypoll_join_request_sessions",
+    "Open join request vote sessions held by this instance.",
+)
+JOIN_REQUEST_OUTCOMES = Metrics.counter(
+    "approvebypoll_join_request_outcomes_total",
+    "Resolved join requests, by group and outcome.",
+    ["chat_id", "outcome"],
+)
+
+
+def track_handler(name: str):
+    """
+    Count and time every call of an update handler.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                with span(f"handler:{name}"):
+                    result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                UPDATE_DURATION.labels(name).observe(time.perf_counter() - started)
+                UPDATES_HANDLED.labels(name, outcome).inc()
+
+        return wrapper
+
+    return decorator
+
+
+def record_join_request_outcome(chat_id: int, outcome: str) -> None:
+    JOIN_REQUEST_OUTCOMES.labels(chat_id, outcome).inc()
+
+
+class TelegramApiMetrics:
+    """
+    Count and time every Bot API request at the HTTP layer. Installed below
+    the rate limiter, so each retry after a 429 is counted as its own request.
+    """
+
+    def __init__(self):
+        self._process_request = None
+
+    async def request(self, token, url, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            with span(f"api:{url}"):
+                result = await self._process_request(token, url, *args, **kwargs)
+            outcome = "ok"
+            return result
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                outcome = "rate_limited"
+            raise
+        finally:
+            TELEGRAM_DURATION.labels(url).observe(time.perf_counter() - started)
+            TELEGRAM_REQUESTS.labels(url, outcome).inc()
+
+    def install(self):
+        """
+        Route every asyncio_helper request through this layer. Must run before
+        OutboundLimiter.install() so the limiter wraps it.
+        """
+        if self._process_request is not None:
+            return
+        self._process_request = asyncio_helper._process_request
+        asyncio_helper._process_request = self.request
+
+
+class MetricsServer:
+    """
+    Serve every registered metric in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.listen = settings.get("metrics.listen", "127.0.0.1")
+        self.port = int(settings.get("metrics.port", 9464))
+        self.path = settings.get("metrics.path", "/metrics")
+        self._runner: web.AppRunner | None = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(self.path, self._handle_metrics)
+        return app
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=Metrics.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"📈 Metrics listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        await self._runner.cleanup()
+        self._runner = None
+
+
+ApiMetrics = TelegramApiMetrics()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 12:30
+# @Author  : KimmyXYC
+# @File    : rate_limit.py
+# @Software: PyCharm
+import asyncio
+import time
+
+from loguru import logger
+from telebot import asyncio_helper
+from telebot.asyncio_helper import ApiTelegramException
+
+from app_conf import settings
+from utils.tracing import span
+
+# Methods that post a new message into a chat and count towards per-chat limits.
+CHAT_LIMITED_METHODS = {
+    "sendMessage",
+    "sendPoll",
+    "sendPhoto",
+    "sendDocument",
+    "sendVideo",
+    "sendAnimation",
+    "sendSticker",
+    "forwardMessage",
+    "copyMessage",
+}
+# Methods that are never paced (long polling, webhook management, callback answers
+# which Telegram must receive within seconds).
+UNLIMITED_METHODS = {
+    "getUpdates",
+    "setWebhook",
+    "deleteWebhook",
+    "getWebhookInfo",
+    "answerCallbackQuery",
+}
+
+
+class TokenBucket:
+    """
+    Token bucket whose waiters are served in FIFO order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block_for(self, seconds: float):
+        """
+        Pause the bucket, e.g. for the retry_after of a 429 response.
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return (
+            self.tokens >= self.capacity
+            and not self._lock.locked()
+            and self.blocked_until <= time.monotonic()
+        )
+
+
+class TelegramRateLimiter:
+    """
+    Shared outbound layer for every Bot API request.
+    Requests wait for a global bucket and, for message sends, a per-chat bucket
+    (groups and private chats have different limits). 429 responses block the
+    affected bucket for retry_after seconds and the request is retried instead
+    of being dropped.
+    """
+
+    def __init__(
+        self,
+        global_per_second: float = 30,
+        private_per_second: float = 1,
+        group_per_minute: float = 20,
+        max_retries: int = 5,
+    ):
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.private_per_second = private_per_second
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._process_request = None
+
+    @classmethod
+    def from_settings(cls) -> "TelegramRateLimiter":
+        return cls(
+            global_per_second=float(settings.get("ratelimit.global_per_second", 30)),
+            private_per_second=float(settings.get("ratelimit.private_per_second", 1)),
+            group_per_minute=float(settings.get("ratelimit.group_per_minute", 20)),
+            max_retries=int(settings.get("ratelimit.max_retries", 5)),
+        )
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._prune_buckets()
+            if chat_id < 0:
+                rate = self.group_per_minute / 60
+                bucket = TokenBucket(rate, self.group_per_minute)
+            else:
+                bucket = TokenBucket(self.private_per_second, self.private_per_second)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        for chat_id in [k for k, v in self._chat_buckets.items() if v.is_idle()]:
+            del self._chat_buckets[chat_id]
+
+    @staticmethod
+    def _chat_id(params: dict | None) -> int | None:
+        if not params:
+            return None
+        try:
+            return int(params.get("chat_id"))
+        except (TypeError, ValueError):
+            return None
+
+    async def request(
+        self, token, url, method="get", params=None, files=None, **kwargs
+    ):
+        if url in UNLIMITED_METHODS:
+            return await self._process_request(
+                token, url, method=method, params=params, files=files, **kwargs
+            )
+
+        chat_id = self._chat_id(params)
+        chat_bucket = (
+            self._chat_bucket(chat_id)
+            if chat_id is not None and url in CHAT_LIMITED_METHODS
+            else None
+        )
+
+        attempt = 0
+        while True:
+            with span(f"ratelimit:{url}"):
+                if chat_bucket is not None:
+                    await chat_bucket.acquire()
+                await self.global_bucket.acquire()
+            try:
+                # _process_request pops keys from params, keep the original for retries.
+                return await self._process_request(
+                    token,
+                    url,
+                    method=method,
+                    params=dict(params) if params is not None else None,
+                    files=files,
+                    **kwargs,
+                )
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                retry_after = float(
+                    (e.result_json.get("parameters") or {}).get("retry_after", 1)
+                )
+                logger.warning(
+                    f"Telegram flood limit on {url} chat_id={chat_id}, retry in {retry_after}s (attempt {attempt})"
+                )
+                if chat_id is not None:
+                    # Flood limits are per chat: pause only that chat, and pace
+                    # the retry through its bucket even for edits and pins.
+                    chat_bucket = self._chat_bucket(chat_id)
+                    chat_bucket.block_for(retry_after)
+                else:
+                    self.global_bucket.block_for(retry_after)
+
+    def install(self):
+        """
+        Route every asyncio_helper request through this limiter.
+        """
+        if self._process_request is not None:
+            return
+        self._process_request = asyncio_helper._process_request
+        asyncio_helper._process_request = self.request
+
+
+OutboundLimiter = TelegramRateLimiter.from_settings()
@@ -2,16 +2,17 @@ import re
 
 from telebot import types
 
+from app.callback_data import (
+    LANGUAGES,
+    TOGGLE_SETTINGS,
+    CallbackData,
+    encode_setting,
+)
+from utils.chat_member_cache import BotRights, MemberCache
 from utils.i18n import LANGUAGE_LABELS, normalize_language_code, t
 from utils.postgres import BotDatabase
 
-TOGGLE_ITEMS = [
-    "vote_to_join",
-    "anonymous_vote",
-    "pin_msg",
-    "clean_pinned_message",
-    "advanced_vote",
-]
+TOGGLE_ITEMS = list(TOGGLE_SETTINGS)
 VOTE_TIME_OPTIONS = [60, 120, 300, 600, 900, 1200, 1800, 2700, 3600]
 MINI_VOTERS_OPTIONS = [1, 2, 3, 5, 10, 20, 50, 100, 200]
 
@@ -25,7 +26,7 @@ def _to_bool(value: str) -> bool | None:
 
 
 async def _can_change_group_info(bot, chat_id: int, user_id: int) -> bool:
-    member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+    member = await MemberCache.get(bot, chat_id, user_id)
     if member.status == "creator":
         return True
     if member.status != "administrator":
@@ -34,29 +35,11 @@ async def _can_change_group_info(bot, chat_id: int, user_id: int) -> bool:
 
 
 async def _bot_can_delete_messages(bot, chat_id: int) -> bool:
-    try:
-        me = await bot.get_me()
-        bot_member = await bot.get_chat_member(chat_id=chat_id, user_id=me.id)
-        if bot_member.status == "creator":
-            return True
-        if bot_member.status != "administrator":
-            return False
-        return bool(getattr(bot_member, "can_delete_messages", False))
-    except Exception:
-        return False
+    return await BotRights.can(bot, chat_id, "can_delete_messages")
 
 
 async def _bot_can_pin_messages(bot, chat_id: int) -> bool:
-    try:
-        me = await bot.get_me()
-        bot_member = await bot.get_chat_member(chat_id=chat_id, user_id=me.id)
-        if bot_member.status == "creator":
-            return True
-        if bot_member.status != "administrator":
-            return False
-        return bool(getattr(bot_member, "can_pin_messages", False))
-    except Exception:
-        return False
+    return await BotRights.can(bot, chat_id, "can_pin_messages")
 
 
 def _format_vote_time(language: str, seconds: int) -> str:
@@ -198,7 +181,9 @@ def build_main_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup:
     keyboard.add(
         types.InlineKeyboardButton(
             f"{vote_to_join_icon} {t(language, 'setting_vote_to_join')}",
-            callback_data=f"setting {group_id} vote_to_join {str(not vote_to_join).lower()}",
+            callback_data=encode_setting(
+                group_id, "vote_to_join", str(not vote_to_join).lower()
+            ),
         )
     )
 
@@ -211,7 +196,9 @@ def build_main_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup:
         two_column_buttons.append(
             types.InlineKeyboardButton(
                 f"{icon} {t(language, f'setting_{item}')}",
-                callback_data=f"setting {group_id} {item} {str(not current_value).lower()}",
+                callback_data=encode_setting(
+                    group_id, item, str(not current_value).lower()
+                ),
             )
         )
 
@@ -219,15 +206,15 @@ def build_main_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup:
         [
             types.InlineKeyboardButton(
                 f"⏱️ {t(language, 'setting_vote_time')}",
-                callback_data=f"setting {group_id} vote_time menu",
+                callback_data=encode_setting(group_id, "vote_time", "menu"),
             ),
             types.InlineKeyboardButton(
                 f"👥 {t(language, 'setting_mini_voters')}",
-                callback_data=f"setting {group_id} mini_voters menu",
+                callback_data=encode_setting(group_id, "mini_voters", "menu"),
             ),
             types.InlineKeyboardButton(
                 f"🌐 {t(language, 'setting_language')}",
-                callback_data=f"setting {group_id} language menu",
+                callback_data=encode_setting(group_id, "language", "menu"),
             ),
         ]
     )
@@ -237,7 +224,7 @@ def build_main_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup:
     keyboard.add(
         types.InlineKeyboardButton(
             f"✖️ {t(language, 'setting_close')}",
-            callback_data=f"setting {group_id} close true",
+            callback_data=encode_setting(group_id, "close", "true"),
         )
     )
     return keyboard
@@ -258,14 +245,14 @@ def build_vote_time_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup
         buttons.append(
             types.InlineKeyboardButton(
                 label,
-                callback_data=f"setting {group_id} vote_time {option}",
+                callback_data=encode_setting(group_id, "vote_time", str(option)),
             )
         )
     keyboard.add(*buttons)
     keyboard.add(
         types.InlineKeyboardButton(
             f"↩️ {t(language, 'setting_back')}",
-            callback_data=f"setting {group_id} back main",
+            callback_data=encode_setting(group_id, "back", "main"),
         )
     )
     return keyboard
@@ -277,20 +264,20 @@ def build_language_keyboard(group_settings: dict) -> types.InlineKeyboardMarkup:
     current_language = normalize_language_code(group_settings.get("language"))
 
     keyboard = types.InlineKeyboardMarkup(row_width=1)
-    for code in ["zh_CN", "zh_TW", "en_US"]:
+    for code in LANGUAGES:
         label = LANGUAGE_LABELS[code]
         if code == current_language:
             label = f"✅ {label}"
         keyboard.add(
             types.InlineKeyboardButton(
                 label,
-                callback_data=f"setting {group_id} language {code}",
+                callback_data=encode_setting(group_id, "language", code),
             )
         )
     keyboard.add(
         types.InlineKeyboardButton(
             f"↩️ {t(language, 'setting_back')}",
-            callback_data=f"setting {group_id} back main",
+            callback_data=encode_setting(group_id, "back", "main"),
         )
     )
     return keyboard
@@ -310,14 +297,14 @@ def build_mini_voters_keyboard(group_settings: dict) -> types.InlineKeyboardMark
         buttons.append(
             types.InlineKeyboardButton(
                 label,
-                callback_data=f"setting {group_id} mini_voters {option}",
+                callback_data=encode_setting(group_id, "mini_voters", str(option)),
             )
         )
     keyboard.add(*buttons)
     keyboard.add(
         types.InlineKeyboardButton(
             f"↩️ {t(language, 'setting_back')}",
-            callback_data=f"setting {group_id} back main",
+            callback_data=encode_setting(group_id, "back", "main"),
         )
     )
     return keyboard
@@ -382,17 +369,13 @@ async def open_settings(bot, message: types.Message):
     )
 
 
-async def handle_settings_callback(bot, call: types.CallbackQuery):
-    if not call.message or not call.data or not call.from_user:
-        return
-
-    parts = call.data.split(" ")
-    if len(parts) != 4 or parts[0] != "setting":
+async def handle_settings_callback(bot, call: types.CallbackQuery, data: CallbackData):
+    if not call.message or not call.from_user:
         return
 
-    group_id = int(parts[1])
-    item = parts[2]
-    status = parts[3]
+    group_id = data.group_id
+    item = data.item
+    status = data.value
 
     if call.message.chat.id != group_id:
         await bot.answer_callback_query(
@@ -16,6 +16,15 @@ def parse_command(command):
 
 
 def generate_uuid():
+    """
+    Time-ordered UUID (version 7): the first 48 bits hold the Unix time in
+    milliseconds, which lets join_request lookups by uuid skip old partitions.
+    """
+    import secrets
+    import time
     import uuid
 
-    return str(uuid.uuid4())
+    value = (time.time_ns() // 1_000_000) << 80
+    value |= 0x7 << 76 | secrets.randbits(12) << 64
+    value |= 0b10 << 62 | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
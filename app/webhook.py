@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 11:40
+# @Author  : KimmyXYC
+# @File    : webhook.py
+# @Software: PyCharm
+import hmac
+from typing import Awaitable, Callable
+
+from aiohttp import web
+from loguru import logger
+from telebot import types, util
+
+from app_conf import settings
+
+
+class WebhookServer:
+    """
+    Receive updates from Telegram over HTTP instead of long polling.
+    Each POST is acknowledged once on_update has accepted its update, so a full
+    dispatcher holds the response back and Telegram's max_connections limits
+    how many updates are in flight.
+    """
+
+    def __init__(self, bot, on_update: Callable[[types.Update], Awaitable]):
+        self.bot = bot
+        self.on_update = on_update
+        self.listen = settings.get("webhook.listen", "0.0.0.0")
+        self.port = int(settings.get("webhook.port", 8443))
+        self.path = settings.get("webhook.path", "/telegram/webhook")
+        self.url = settings.get("webhook.url", None)
+        self.secret_token = settings.get("webhook.secret_token", None) or None
+        # A restarting instance must not discard updates queued for the others.
+        self.drop_pending_updates = bool(
+            settings.get(
+                "webhook.drop_pending_updates",
+                not settings.get("coordination.enable", False),
+            )
+        )
+        self.max_connections = int(settings.get("webhook.max_connections", 40))
+        self._runner: web.AppRunner | None = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        return app
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(received, self.secret_token):
+                return web.Response(status=403)
+
+        try:
+            payload = await request.json()
+            update = types.Update.de_json(payload)
+        except Exception:
+            return web.Response(status=400)
+
+        try:
+            await self.on_update(update)
+        except Exception as e:
+            # Telegram redelivers on a non-2xx response.
+            logger.opt(exception=e).error("webhook update handling failed")
+            return web.Response(status=500)
+        return web.Response(status=200)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"🌐 Webhook listening on {self.listen}:{self.port}{self.path}")
+
+        if not self.url:
+            logger.warning("⚠️ webhook.url is empty, skip setWebhook")
+            return
+        await self.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=util.update_types,
+            drop_pending_updates=self.drop_pending_updates,
+            max_connections=self.max_connections,
+        )
+        logger.success(f"✨ Webhook registered: {self.url}")
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        await self._runner.cleanup()
+        self._runner = None
@@ -0,0 +1,654 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 21:20
+# @Author  : KimmyXYC
+# @File    : database.py
+# @Software: PyCharm
+"""
+Database benchmark and query plan regression suite.
+
+Seeds a dedicated database (created next to the configured one) with
+realistic volumes, checks the plan of every statement in utils/queries.py
+and times every AsyncPostgresDB method under concurrency:
+
+    python -m bench.database --groups 100000 --join-requests 50000000
+
+Seeding is incremental, so later runs only add what is missing. A statement
+whose plan (custom or generic) scans setting, join_request or
+join_request_vote sequentially fails the run with exit status 1.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+from loguru import logger
+
+from app.utils import generate_uuid
+from app_conf import settings
+
+# Tables that grow with usage; any sequential scan on them is a regression.
+LARGE_TABLES = {"setting", "join_request", "join_request_vote"}
+# Partitions of join_request (join_request_p202610, join_request_default).
+PARTITION = re.compile(r"^join_request_(p\d{6}|default)$")
+GROUP_BASE = -1_000_000_000_000
+WAITING_USER_BASE = 9_000_000_000
+SEED_CHUNK = 1_000_000
+INSTANCE_ID = "bench"
+# Time-ordered uuid (version 7) for a row's request_time, like generate_uuid().
+UUID_V7 = """(
+    lpad(to_hex((extract(epoch FROM request_time) * 1000)::bigint), 12, '0')
+    || '7' || substr(md5(random()::text), 1, 3)
+    || '8' || substr(md5(random()::text), 1, 15)
+)::uuid"""
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def connect_kwargs(dbname: str) -> dict:
+    return {
+        "host": settings.database.host,
+        "port": settings.database.port,
+        "user": settings.database.user,
+        "password": settings.database.password,
+        "database": dbname,
+    }
+
+
+async def create_database(name: str, home: str):
+    connection = await asyncpg.connect(**connect_kwargs(home))
+    try:
+        exists = await connection.fetchval(
+            "SELECT 1 FROM pg_database WHERE datname = $1", name
+        )
+        if not exists:
+            await connection.execute(f'CREATE DATABASE "{name}"')
+            print(f"created database {name}")
+    finally:
+        await connection.close()
+
+
+async def drop_database(name: str, home: str):
+    connection = await asyncpg.connect(**connect_kwargs(home))
+    try:
+        await connection.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+        print(f"dropped database {name}")
+    finally:
+        await connection.close()
+
+
+class Seeder:
+    """
+    Bring the benchmark database up to the requested row counts. What has been
+    seeded is recorded in bench_seed so that counting 50M rows is never needed.
+    """
+
+    def __init__(self, connection, args):
+        self.connection = connection
+        self.args = args
+
+    async def seeded(self, name: str) -> int:
+        return await self.connection.fetchval(
+            "SELECT COALESCE((SELECT rows FROM bench_seed WHERE name = $1), 0)", name
+        )
+
+    async def record(self, name: str, rows: int):
+        await self.connection.execute(
+            """
+            INSERT INTO bench_seed (name, rows) VALUES ($1, $2)
+            ON CONFLICT (name) DO UPDATE SET rows = EXCLUDED.rows
+            """,
+            name,
+            rows,
+        )
+
+    async def run(self):
+        await self.connection.execute("SET statement_timeout = 0")
+        await self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS bench_seed (name TEXT PRIMARY KEY, rows BIGINT)"
+        )
+        await self.create_partitions()
+        changed = await self.seed_groups()
+        changed |= await self.seed_join_requests()
+        changed |= await self.seed_waiting()
+        if changed:
+            started = time.perf_counter()
+            await self.connection.execute("VACUUM ANALYZE")
+            print(f"vacuum analyze in {time.perf_counter() - started:.1f}s")
+
+    async def create_partitions(self):
+        """
+        Monthly join_request partitions for the year of seeded history; the
+        migration and utils/retention.py only create them from now on.
+        """
+        await self.connection.execute(
+            """
+            DO $$
+            DECLARE
+                month DATE := date_trunc(
+                    'month', (NOW() - INTERVAL '366 days') AT TIME ZONE 'UTC'
+                )::date;
+            BEGIN
+                WHILE month <= NOW()::date LOOP
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF join_request '
+                        'FOR VALUES FROM (%L) TO (%L)',
+                        'join_request_p' || to_char(month, 'YYYYMM'),
+                        month::timestamp AT TIME ZONE 'UTC',
+                        (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+                    );
+                    month := (month + INTERVAL '1 month')::date;
+                END LOOP;
+            END
+            $$
+            """
+        )
+
+    async def seed_groups(self) -> bool:
+        have, want = await self.seeded("setting"), self.args.groups
+        if have >= want:
+            return False
+        await self.connection.execute(
+            """
+            INSERT INTO setting (
+                group_id, vote_to_join, vote_time, pin_msg, clean_pinned_message,
+                anonymous_vote, advanced_vote, language, mini_voters
+            )
+            SELECT $1 - g, random() < 0.95, 60 + (random() * 1800)::int,
+                   random() < 0.3, random() < 0.2, random() < 0.8,
+                   random() < 0.4, (ARRAY['en_US', 'zh_CN', 'zh_TW'])[1 + g % 3],
+                   1 + (random() * 9)::int
+            FROM generate_series($2::bigint, $3::bigint - 1) AS g
+            ON CONFLICT (group_id) DO NOTHING
+            """,
+            GROUP_BASE,
+            have,
+            want,
+        )
+        await self.record("setting", want)
+        print(f"seeded setting: {want - have} groups")
+        return True
+
+    async def seed_join_requests(self) -> bool:
+        """
+        Closed requests spread over the last year; one in fifty has ballots.
+        """
+        have, want = await self.seeded("join_request"), self.args.join_requests
+        if have >= want:
+            return False
+        groups = self.args.groups
+        while have < want:
+            chunk = min(SEED_CHUNK, want - have)
+            started = time.perf_counter()
+            await self.connection.execute(
+                f"""
+                WITH requests AS (
+                    INSERT INTO join_request (
+                        uuid, group_id, user_id, request_time, waiting, result,
+                        admin, yes_votes, no_votes
+                    )
+                    SELECT {UUID_V7}, group_id, user_id, request_time,
+                           FALSE, random() < 0.6, NULL,
+                           (random() * 10)::int, (random() * 10)::int
+                    FROM (
+                        SELECT $1 - (random() * ($2 - 1))::bigint AS group_id,
+                               1 + (random() * 2000000000)::bigint AS user_id,
+                               date_trunc(
+                                   'second', NOW() - random() * INTERVAL '365 days'
+                               ) AS request_time
+                        FROM generate_series(1, $3)
+                    ) AS generated
+                    RETURNING uuid, request_time
+                )
+                INSERT INTO join_request_vote (
+                    uuid, voter_id, full_name, approve, voted_at
+                )
+                SELECT uuid, voter, 'Voter ' || voter, random() < 0.5, request_time
+                FROM (SELECT * FROM requests WHERE random() < 0.02) AS voted,
+                     generate_series(1, 3) AS voter
+                """,
+                GROUP_BASE,
+                groups,
+                chunk,
+            )
+            have += chunk
+            await self.record("join_request", have)
+            print(
+                f"seeded join_request: {have}/{want}"
+                f" ({chunk / (time.perf_counter() - started):,.0f} rows/s)"
+            )
+        return True
+
+    async def seed_waiting(self) -> bool:
+        """
+        Open requests, each with a persisted vote session and a few ballots.
+        """
+        have, want = await self.seeded("waiting"), self.args.waiting
+        if have >= want:
+            return False
+        await self.connection.execute(
+            f"""
+            WITH requests AS (
+                INSERT INTO join_request (
+                    uuid, group_id, user_id, request_time, waiting
+                )
+                SELECT {UUID_V7}, group_id, user_id, request_time, TRUE
+                FROM (
+                    SELECT $1 - (i % $2) AS group_id, $3 + i AS user_id,
+                           date_trunc(
+                               'second', NOW() - random() * INTERVAL '10 minutes'
+                           ) AS request_time
+                    FROM generate_series($4::bigint, $5::bigint - 1) AS i
+                ) AS generated
+                RETURNING uuid, group_id, user_id, request_time
+            ),
+            claimed AS (
+                INSERT INTO join_request_waiting (group_id, user_id, uuid, request_time)
+                SELECT group_id, user_id, uuid, request_time
+                FROM requests
+            ),
+            sessions AS (
+                INSERT INTO join_request_session (
+                    uuid, chat_id, user_id, request, group_settings, advanced_vote,
+                    message1_id, message2_id, message3_id, deadline, owner
+                )
+                SELECT uuid, group_id, user_id, '{{}}', '{{}}', TRUE, 1, 2, 3,
+                       request_time + INTERVAL '10 minutes', $6
+                FROM requests
+            )
+            INSERT INTO join_request_vote (uuid, voter_id, full_name, approve)
+            SELECT uuid, voter, 'Voter ' || voter, random() < 0.5
+            FROM requests, generate_series(1, 5) AS voter
+            """,
+            GROUP_BASE,
+            self.args.groups,
+            WAITING_USER_BASE,
+            have,
+            want,
+            INSTANCE_ID,
+        )
+        await self.record("waiting", want)
+        print(f"seeded waiting join requests with sessions: {want - have}")
+        return True
+
+
+class Samples:
+    """
+    Existing keys to feed the statements and methods with.
+    """
+
+    def __init__(self, groups: int):
+        self.groups = groups
+        self.closed: list[str] = []
+        self.waiting: list[tuple[str, int, int]] = []
+
+    async def load(self, connection):
+        rows = await connection.fetch(
+            """
+            SELECT uuid::text FROM join_request TABLESAMPLE SYSTEM (1)
+            WHERE waiting = FALSE LIMIT 5000
+            """
+        )
+        self.closed = [row["uuid"] for row in rows]
+        rows = await connection.fetch(
+            """
+            SELECT request.uuid::text, request.group_id, request.user_id
+            FROM join_request_session AS session
+            JOIN join_request AS request ON request.uuid = session.uuid
+            WHERE request.waiting
+            LIMIT 5000
+            """
+        )
+        self.waiting = [(row["uuid"], row["group_id"], row["user_id"]) for row in rows]
+        if not self.closed or not self.waiting:
+            raise RuntimeError("benchmark database is not seeded")
+
+    def group(self) -> int:
+        return GROUP_BASE - random.randrange(self.groups)
+
+    def closed_uuid(self) -> str:
+        return random.choice(self.closed)
+
+    def waiting_row(self) -> tuple[str, int, int]:
+        return random.choice(self.waiting)
+
+    @staticmethod
+    def new_uuid() -> str:
+        return generate_uuid()
+
+    @staticmethod
+    def new_user() -> int:
+        return random.randrange(3_000_000_000, 8_000_000_000)
+
+
+SETTING_VALUES = {"vote_time": 600, "language": "en_US", "mini_voters": 3}
+DEFAULTS = (True, 600, False, False, True, False, "en_US", 3)
+
+
+def plan_cases(samples: Samples) -> dict[str, list[tuple]]:
+    """
+    Parameters to EXPLAIN every statement with, by query name.
+    """
+    from utils.queries import QUERIES, SETTING_FIELDS
+
+    waiting_uuid, group_id, user_id = samples.waiting_row()
+    now = datetime.now(timezone.utc)
+    cases = {
+        "select_group_settings": [(samples.group(),)],
+        "insert_group_settings": [(samples.group(), *DEFAULTS)],
+        "open_join_request": [
+            (samples.new_uuid(), samples.group(), samples.new_user(), *DEFAULTS, []),
+            (samples.new_uuid(), group_id, user_id, *DEFAULTS, [waiting_uuid]),
+        ],
+        "close_join_request": [(samples.closed_uuid(), True, None, 1, 0)],
+        "get_join_request_status": [(waiting_uuid,)],
+        **{
+            f"update_setting_{field}": [
+                (samples.group(), SETTING_VALUES.get(field, True))
+            ]
+            for field in SETTING_FIELDS
+        },
+        "save_join_request_session": [
+            (
+                waiting_uuid,
+                group_id,
+                user_id,
+                {},
+                {},
+                True,
+                1,
+                2,
+                3,
+                None,
+                now,
+                INSTANCE_ID,
+                None,
+            )
+        ],
+        "update_join_request_session": [(waiting_uuid, True, 4, True, now)],
+        "delete_join_request_session": [(waiting_uuid,)],
+        "insert_join_request_votes": [(waiting_uuid, 42, "Voter", True, now)],
+        "load_join_request_sessions": [([waiting_uuid],), (None,)],
+        "close_orphaned_join_requests": [(60.0,)],
+        "notify": [("bench", "payload")],
+        "heartbeat_instance": [(INSTANCE_ID, 30.0)],
+        "release_instance_sessions": [(INSTANCE_ID,)],
+        "delete_instance": [(INSTANCE_ID,)],
+        "get_join_request_session_owner": [(waiting_uuid, 30.0)],
+        "claim_join_request_sessions": [
+            (INSTANCE_ID, 30.0, waiting_uuid, False),
+            (INSTANCE_ID, 30.0, None, True),
+        ],
+        "fence_join_request_sessions": [([waiting_uuid], INSTANCE_ID, [1])],
+        "find_lost_join_request_sessions": [(INSTANCE_ID, [waiting_uuid])],
+    }
+    missing = set(QUERIES) - set(cases)
+    if missing:
+        raise RuntimeError(f"no plan case for queries: {sorted(missing)}")
+    return cases
+
+
+def table_name(relation: str | None) -> str | None:
+    """
+    Report scans of a join_request partition as scans of join_request.
+    """
+    if relation is not None and PARTITION.match(relation):
+        return "join_request"
+    return relation
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+async def check_plans(connection, samples: Samples) -> list[str]:
+    """
+    EXPLAIN every statement with a custom plan (the bound parameters) and a
+    generic plan (what a prepared statement may switch to after five runs).
+    """
+    from utils.queries import QUERIES
+
+    generic = connection.get_server_version().major >= 16
+    # Scanning an empty partition (a month yet to come) sequentially is free.
+    empty = {
+        row["relname"]
+        for row in await connection.fetch(
+            """
+            SELECT relname FROM pg_class
+            WHERE relname ~ '^join_request_(p[0-9]{6}|default)$' AND relpages = 0
+            """
+        )
+    }
+    failures = []
+    print(f"\n== plans ({'custom + generic' if generic else 'custom only'})")
+    for name, cases in plan_cases(samples).items():
+        for params in cases:
+            for option in ("", "GENERIC_PLAN, ") if generic else ("",):
+                explain = await connection.fetchval(
+                    f"EXPLAIN ({option}FORMAT JSON) {QUERIES[name]}", *params
+                )
+                plan = json.loads(explain)[0]["Plan"]
+                scans = sorted(
+                    {
+                        table_name(node["Relation Name"])
+                        for node in plan_nodes(plan)
+                        if node["Node Type"] == "Seq Scan"
+                        and node["Relation Name"] not in empty
+                        and table_name(node.get("Relation Name")) in LARGE_TABLES
+                    }
+                )
+                partitions = {
+                    node["Relation Name"]
+                    for node in plan_nodes(plan)
+                    if PARTITION.match(node.get("Relation Name", ""))
+                }
+                kind = "generic" if option else "custom"
+                status = "SEQ SCAN " + ", ".join(scans) if scans else "ok"
+                print(
+                    f"   {name:<36} {kind:<8} cost {plan['Total Cost']:>12.2f}"
+                    f"  partitions {len(partitions):>3}  {status}"
+                )
+                if scans:
+                    failures.append(f"{name} ({kind}): seq scan on {', '.join(scans)}")
+    return failures
+
+
+def method_cases(database, samples: Samples) -> dict:
+    """
+    One call of every AsyncPostgresDB method, by name.
+    """
+
+    async def queued_result():
+        database.queue_join_request_result(
+            samples.closed_uuid(), samples.group(), samples.new_user(), True, None, 2, 1
+        )
+        await database.flush_lifecycle_writes()
+
+    async def queued_votes():
+        waiting_uuid = samples.waiting_row()[0]
+        database.queue_join_request_vote(
+            waiting_uuid, samples.new_user(), "Voter", True
+        )
+        await database.flush_join_request_votes()
+
+    async def session_roundtrip():
+        request_uuid = samples.new_uuid()
+        await database.save_join_request_session(
+            uuid=request_uuid,
+            chat_id=samples.group(),
+            user_id=samples.new_user(),
+            request={},
+            group_settings={},
+            advanced_vote=True,
+            message1_id=1,
+            message2_id=2,
+            message3_id=3,
+            log_message_id=None,
+            deadline=datetime.now(timezone.utc) + timedelta(minutes=10),
+            owner=INSTANCE_ID,
+        )
+        await database.update_join_request_session(request_uuid, message4_id=4)
+        database.queue_join_request_session_delete(request_uuid)
+        await database.flush_lifecycle_writes()
+
+    return {
+        "get_group_settings": lambda: database.get_group_settings(samples.group()),
+        "open_join_request": lambda: database.open_join_request(
+            samples.new_uuid(), samples.group(), samples.new_user()
+        ),
+        "close_join_requests": lambda: database.close_join_requests(
+            [
+                {
+                    "uuid": samples.closed_uuid(),
+                    "group_id": samples.group(),
+                    "user_id": samples.new_user(),
+                    "result": True,
+                    "yes_votes": 2,
+                    "no_votes": 1,
+                }
+            ]
+        ),
+        "queue_join_request_result+flush": queued_result,
+        "get_join_request_status_by_uuid": (
+            lambda: database.get_join_request_status_by_uuid(samples.closed_uuid())
+        ),
+        "update_group_setting": lambda: database.update_group_setting(
+            samples.group(), "vote_time", random.randrange(60, 1800)
+        ),
+        "save/update/delete_join_request_session": session_roundtrip,
+        "queue_join_request_vote+flush": queued_votes,
+        "load_join_request_sessions(uuids)": lambda: (
+            database.load_join_request_sessions([samples.waiting_row()[0]])
+        ),
+        "close_orphaned_join_requests": (
+            # Sessions exist for every seeded waiting row, so nothing is closed.
+            lambda: database.close_orphaned_join_requests(grace=60)
+        ),
+        "notify": lambda: database.notify("bench", "payload"),
+        "heartbeat_instance": lambda: database.heartbeat_instance(INSTANCE_ID, 30),
+        "get_join_request_session_owner": (
+            lambda: database.get_join_request_session_owner(
+                samples.waiting_row()[0], 30
+            )
+        ),
+        "claim_join_request_sessions": lambda: database.claim_join_request_sessions(
+            INSTANCE_ID, 30, samples.waiting_row()[0], True
+        ),
+        "fence_join_request_sessions": (
+            lambda: database.fence_join_request_sessions(
+                INSTANCE_ID, {samples.waiting_row()[0]: 1}
+            )
+        ),
+        "find_lost_join_request_sessions": (
+            lambda: database.find_lost_join_request_sessions(
+                INSTANCE_ID, [samples.waiting_row()[0] for _ in range(20)]
+            )
+        ),
+    }
+
+
+async def time_method(call, iterations: int, concurrency: int) -> tuple:
+    latencies = []
+    remaining = iter(range(iterations))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    # Warm up: the first calls open pooled connections and prepare statements.
+    await asyncio.gather(*(call() for _ in range(concurrency)))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def time_methods(database, samples: Samples, args):
+    print(
+        f"\n== methods ({args.iterations} calls each, concurrency {args.concurrency})"
+    )
+    print(f"   {'method':<42} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, call in method_cases(database, samples).items():
+        if args.only and args.only not in name:
+            continue
+        latencies, elapsed = await time_method(call, args.iterations, args.concurrency)
+        print(
+            f"   {name:<42} {len(latencies) / elapsed:9.0f}"
+            f" {percentile(latencies, 0.5) * 1000:8.2f}"
+            f" {percentile(latencies, 0.99) * 1000:8.2f}"
+        )
+
+
+async def main(args) -> int:
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    # The configured database only hosts CREATE/DROP DATABASE.
+    home = settings.database.dbname
+    await create_database(args.database, home)
+    settings.set("database.dbname", args.database)
+    settings.set("database.pool_max_size", args.concurrency)
+    settings.set("database.pool_min_size", args.concurrency)
+    # Measure the database, not the in-process settings cache.
+    settings.set("database.settings_cache_size", 0)
+
+    from utils.postgres import BotDatabase
+
+    await BotDatabase.connect()
+    failures = []
+    try:
+        async with BotDatabase.conn.acquire() as connection:
+            await Seeder(connection, args).run()
+            samples = Samples(args.groups)
+            await samples.load(connection)
+            if not args.skip_plans:
+                failures = await check_plans(connection, samples)
+        if not args.skip_timing:
+            await time_methods(BotDatabase, samples, args)
+    finally:
+        await BotDatabase.close()
+        if args.drop:
+            await drop_database(args.database, home)
+
+    if failures:
+        print(f"\n{len(failures)} plan regressions:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("\nno sequential scans on large tables")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default="approvebypoll_bench")
+    parser.add_argument("--groups", type=int, default=100_000)
+    parser.add_argument("--join-requests", type=int, default=1_000_000)
+    parser.add_argument(
+        "--waiting", type=int, default=2000, help="open requests with sessions"
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", default="", help="time only matching methods")
+    parser.add_argument("--skip-plans", action="store_true")
+    parser.add_argument("--skip-timing", action="store_true")
+    parser.add_argument("--drop", action="store_true", help="drop the database after")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:45
+# @Author  : KimmyXYC
+# @File    : simulate.py
+# @Software: PyCharm
+"""
+Virtual-clock simulation of join request vote lifecycles.
+
+Drives JoinRequestVote through start, ballots, admin actions, deadlines and
+cleanup with a fake bot and an in-memory database. Time only moves when
+nothing is left to run, so hours of votes finish in seconds:
+
+    python -m bench.simulate --lifecycles 5000 --seed 1
+
+Every lifecycle's outcome, join_request row and session are checked against
+the scenario that produced it, and API and DB calls are reported per
+lifecycle. Exits with status 1 when any lifecycle ends up wrong.
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from loguru import logger
+from telebot import types
+
+import app.join_request_vote as join_request_vote
+from app.callback_data import encode_action, encode_vote
+from app.join_request_vote import JoinRequestVote
+from app_conf import settings
+from bench.virtual import FakeBot, MemoryDatabase, VirtualClock
+from utils.scheduler import DeadlineScheduler
+
+KINDS = {
+    # kind: weight
+    "votes": 40,
+    "admin": 20,
+    "late_admin": 5,
+    "poll_fallback": 10,
+    "flaky": 15,
+    "failed": 10,
+}
+ADMIN_OUTCOMES = {
+    "approve": "admin_approved",
+    "reject": "admin_rejected",
+    "ban": "admin_banned",
+}
+# Calls a flaky lifecycle loses; none of them may change its outcome.
+FLAKY_METHODS = {
+    "approve_chat_join_request",
+    "decline_chat_join_request",
+    "ban_chat_member",
+    "delete_message",
+    "edit_message_text",
+    "pin_chat_message",
+    "unpin_chat_message",
+}
+
+
+@dataclass
+class Lifecycle:
+    index: int
+    kind: str
+    arrival: float
+    vote_time: int
+    advanced: bool
+    mini_voters: int
+    pin: bool
+    # (offset, voter_id, yes); a voter may appear twice, the first ballot counts.
+    ballots: list[tuple[float, int, bool]]
+    action: tuple[float, str] | None = None
+    uuid: str = ""
+    vote: "SimulatedVote | None" = None
+    closed: bool = False
+    poll_voters: set[int] = field(default_factory=set)
+    api_calls: Counter = field(default_factory=Counter)
+    db_calls: Counter = field(default_factory=Counter)
+
+    @property
+    def chat_id(self) -> int:
+        return -1_000_000_000_000 - self.index
+
+    @property
+    def user_id(self) -> int:
+        return 10_000_000 + self.index
+
+    @property
+    def admin_id(self) -> int:
+        return 30_000_000 + self.index
+
+    @property
+    def group_settings(self) -> dict:
+        return {
+            "vote_to_join": True,
+            "vote_time": self.vote_time,
+            "mini_voters": self.mini_voters,
+            "advanced_vote": self.advanced,
+            "anonymous_vote": True,
+            "pin_msg": self.pin,
+            "clean_pinned_message": False,
+            "language": "en_US",
+        }
+
+    def counted_ballots(self) -> tuple[int, int]:
+        seen = {}
+        for offset, voter_id, yes in sorted(self.ballots):
+            if self.action is not None and offset >= self.action[0]:
+                continue
+            seen.setdefault(voter_id, yes)
+        yes_votes = sum(1 for yes in seen.values() if yes)
+        return yes_votes, len(seen) - yes_votes
+
+    def expected(self) -> tuple[str, bool]:
+        """
+        (outcome, approved) the lifecycle has to end with.
+        """
+        if self.kind == "failed":
+            return "failed", False
+        if self.action is not None and self.action[0] < self.vote_time:
+            action = self.action[1]
+            return ADMIN_OUTCOMES[action], action == "approve"
+        yes_votes, no_votes = self.counted_ballots()
+        if yes_votes + no_votes < self.mini_voters:
+            return "not_enough_voters", False
+        if yes_votes > no_votes:
+            return "approved", True
+        if yes_votes == no_votes:
+            return "tie", False
+        return "rejected", False
+
+
+class SimulatedVote(JoinRequestVote):
+    def _mark_resolved(self, approved: bool, outcome: str):
+        super()._mark_resolved(approved, outcome)
+        self.outcome = outcome
+
+
+def make_lifecycle(index: int, rng: random.Random, spread: float) -> Lifecycle:
+    kind = rng.choices(list(KINDS), weights=list(KINDS.values()))[0]
+    vote_time = rng.choice((60, 300, 600, 1800))
+    lifecycle = Lifecycle(
+        index=index,
+        kind=kind,
+        arrival=rng.uniform(0, spread),
+        vote_time=vote_time,
+        # poll_fallback lifecycles are configured for polls; sending the poll
+        # fails and the vote falls back to buttons.
+        advanced=kind != "poll_fallback" and rng.random() < 0.5,
+        mini_voters=rng.randint(1, 4),
+        pin=rng.random() < 0.3,
+        ballots=[],
+    )
+    if kind == "failed":
+        return lifecycle
+    voters = [20_000_000 + index * 100 + k for k in range(rng.randint(0, 8))]
+    for voter_id in voters:
+        yes = rng.random() < 0.55
+        lifecycle.ballots.append((rng.uniform(1, vote_time - 1), voter_id, yes))
+        if rng.random() < 0.1:
+            # Second click of the same voter, possibly changing sides.
+            lifecycle.ballots.append(
+                (rng.uniform(1, vote_time - 1), voter_id, rng.random() < 0.5)
+            )
+    if kind == "admin":
+        action = rng.choice(("approve", "reject", "ban"))
+        lifecycle.action = (rng.uniform(1, vote_time - 1), action)
+    elif kind == "late_admin":
+        # Between the deadline and the cleanup 60 seconds later.
+        lifecycle.action = (vote_time + rng.uniform(1, 59), "approve")
+    return lifecycle
+
+
+class Simulation:
+    def __init__(self, lifecycles: list[Lifecycle]):
+        self.lifecycles = lifecycles
+        self.clock = VirtualClock()
+        self.started = self.clock.now
+        self.scheduler = DeadlineScheduler(clock=self.clock)
+        self._by_chat = {lifecycle.chat_id: lifecycle for lifecycle in lifecycles}
+        self._by_user = {lifecycle.user_id: lifecycle for lifecycle in lifecycles}
+        self._by_uuid: dict[str, Lifecycle] = {}
+        self.bot = FakeBot(
+            admins={lifecycle.admin_id for lifecycle in lifecycles},
+            fail=self._fail,
+            on_call=self._on_api_call,
+        )
+        self.database = MemoryDatabase(
+            group_settings=lambda chat_id: self._by_chat[chat_id].group_settings,
+            on_call=self._on_db_call,
+        )
+        self.errors: list[str] = []
+        self._events: list[tuple[float, int, object]] = []
+        self._sequence = itertools.count()
+        self._callback_ids = itertools.count()
+
+    def _owner(self, kwargs: dict) -> Lifecycle | None:
+        chat_id = kwargs.get("chat_id")
+        if chat_id in self._by_chat:
+            return self._by_chat[chat_id]
+        if chat_id in self._by_user:
+            return self._by_user[chat_id]
+        callback_query_id = kwargs.get("callback_query_id")
+        if callback_query_id is not None:
+            return self.lifecycles[int(callback_query_id.split(":")[0])]
+        return None
+
+    def _fail(self, method: str, kwargs: dict) -> bool:
+        lifecycle = self._owner(kwargs)
+        if lifecycle is None:
+            return False
+        if lifecycle.kind == "flaky":
+            return method in FLAKY_METHODS
+        if lifecycle.kind == "poll_fallback":
+            return method == "send_poll"
+        if lifecycle.kind == "failed":
+            # Every attempt at the vote message (poll or buttons) fails.
+            return method == "send_poll" or (
+                method == "send_message" and "reply_to_message_id" in kwargs
+            )
+        return False
+
+    def _on_api_call(self, method: str, kwargs: dict):
+        lifecycle = self._owner(kwargs)
+        if lifecycle is not None:
+            lifecycle.api_calls[method] += 1
+
+    def _on_db_call(self, method: str, uuid: str | None):
+        lifecycle = self._by_uuid.get(uuid)
+        if lifecycle is not None:
+            lifecycle.db_calls[method] += 1
+
+    def _at(self, offset: float, callback):
+        heapq.heappush(
+            self._events, (self.started + offset, next(self._sequence), callback)
+        )
+
+    def _callback_query(self, lifecycle: Lifecycle, user_id: int, data: str):
+        return types.CallbackQuery.de_json(
+            {
+                "id": f"{lifecycle.index}:{next(self._callback_ids)}",
+                "from": {"id": user_id, "is_bot": False, "first_name": f"U{user_id}"},
+                "chat_instance": "simulation",
+                "data": data,
+            }
+        )
+
+    async def _arrive(self, lifecycle: Lifecycle):
+        lifecycle.uuid = f"00000000-0000-4000-8000-{lifecycle.index:012d}"
+        self._by_uuid[lifecycle.uuid] = lifecycle
+        request = types.ChatJoinRequest.de_json(
+            {
+                "chat": {"id": lifecycle.chat_id, "type": "supergroup", "title": "G"},
+                "from": {
+                    "id": lifecycle.user_id,
+                    "is_bot": False,
+                    "first_name": "Applicant",
+                },
+                "user_chat_id": lifecycle.user_id,
+                "date": int(self.clock.now),
+            }
+        )
+        group_settings, waiting = await self.database.open_join_request(
+            uuid=lifecycle.uuid,
+            group_id=lifecycle.chat_id,
+            user_id=lifecycle.user_id,
+        )
+        if waiting:
+            self.errors.append(f"#{lifecycle.index}: unexpected waiting request")
+            return
+
+        def on_close(uuid: str):
+            lifecycle.closed = True
+
+        lifecycle.vote = SimulatedVote(
+            bot=self.bot,
+            request=request,
+            uuid=lifecycle.uuid,
+            group_settings=group_settings,
+            scheduler=self.scheduler,
+            on_close=on_close,
+        )
+        await lifecycle.vote.start()
+        for offset, voter_id, yes in lifecycle.ballots:
+            self._at(
+                lifecycle.arrival + offset,
+                lambda voter_id=voter_id, yes=yes: self._ballot(
+                    lifecycle, voter_id, yes
+                ),
+            )
+        if lifecycle.action is not None:
+            offset, action = lifecycle.action
+            self._at(
+                lifecycle.arrival + offset,
+                lambda: lifecycle.vote.handle_action(
+                    self._callback_query(
+                        lifecycle,
+                        lifecycle.admin_id,
+                        encode_action(lifecycle.uuid, action),
+                    ),
+                    action,
+                ),
+            )
+
+    async def _ballot(self, lifecycle: Lifecycle, voter_id: int, yes: bool):
+        vote = lifecycle.vote
+        if vote.advanced_vote_enabled:
+            option = "yes" if yes else "no"
+            await vote.handle_vote(
+                self._callback_query(
+                    lifecycle, voter_id, encode_vote(lifecycle.uuid, option)
+                ),
+                option,
+            )
+            return
+        # Telegram keeps one answer per voter and rejects votes on closed polls.
+        if not vote.is_pending or voter_id in lifecycle.poll_voters:
+            return
+        lifecycle.poll_voters.add(voter_id)
+        self.bot.vote_poll(lifecycle.chat_id, vote.message2_id, 0 if yes else 1)
+
+    async def run(self):
+        for lifecycle in self.lifecycles:
+            self._at(
+                lifecycle.arrival, lambda lifecycle=lifecycle: self._arrive(lifecycle)
+            )
+
+        while True:
+            next_event = self._events[0][0] if self._events else None
+            next_deadline = self.scheduler.next_deadline()
+            if next_event is None and next_deadline is None:
+                break
+            self.clock.advance_to(
+                min(when for when in (next_event, next_deadline) if when is not None)
+            )
+            tasks = []
+            while self._events and self._events[0][0] <= self.clock.now:
+                _, _, callback = heapq.heappop(self._events)
+                tasks.append(asyncio.create_task(callback()))
+            self.scheduler.dispatch_due()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    self.errors.append(f"event failed: {result!r}")
+            await self.scheduler.drain()
+
+    def verify(self) -> list[str]:
+        errors = list(self.errors)
+        for lifecycle in self.lifecycles:
+            outcome, approved = lifecycle.expected()
+            vote = lifecycle.vote
+            row = self.database.join_requests.get(lifecycle.uuid)
+            prefix = f"#{lifecycle.index} {lifecycle.kind}"
+            actual = getattr(vote, "outcome", None)
+            if actual != outcome:
+                errors.append(f"{prefix}: outcome {actual}, expected {outcome}")
+            if vote is None or vote.result is not approved:
+                errors.append(f"{prefix}: result {vote and vote.result}")
+            if row is None or row["waiting"] or row["result"] is not approved:
+                errors.append(f"{prefix}: join_request row {row}")
+            elif outcome in {"approved", "rejected", "tie", "not_enough_voters"}:
+                expected_votes = lifecycle.counted_ballots()
+                if (row["yes_votes"], row["no_votes"]) != expected_votes:
+                    errors.append(
+                        f"{prefix}: votes {row['yes_votes']}:{row['no_votes']},"
+                        f" expected {expected_votes[0]}:{expected_votes[1]}"
+                    )
+            elif outcome.startswith("admin_") and row["admin"] != lifecycle.admin_id:
+                errors.append(f"{prefix}: admin {row['admin']}")
+            if not lifecycle.closed:
+                errors.append(f"{prefix}: never closed")
+            if lifecycle.uuid in self.database.sessions:
+                errors.append(f"{prefix}: session left behind")
+        if len(self.scheduler):
+            errors.append(f"{len(self.scheduler)} timers left in the scheduler")
+        return errors
+
+
+def print_calls(title: str, lifecycles: list[Lifecycle], attribute: str):
+    totals: Counter = Counter()
+    for lifecycle in lifecycles:
+        totals.update(getattr(lifecycle, attribute))
+    count = max(len(lifecycles), 1)
+    print(f"\n{title}: {sum(totals.values()) / count:.2f} per lifecycle")
+    for method, calls in totals.most_common():
+        print(f"   {method:<36} {calls / count:6.2f}")
+
+
+def report(simulation: Simulation, elapsed: float):
+    lifecycles = simulation.lifecycles
+    simulated = simulation.clock.now - simulation.started
+    print(
+        f"simulated {len(lifecycles)} lifecycles, {simulated / 3600:.1f}h of"
+        f" virtual time in {elapsed:.2f}s"
+    )
+    outcomes = Counter(
+        getattr(lifecycle.vote, "outcome", None) for lifecycle in lifecycles
+    )
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in outcomes.most_common()))
+
+    by_kind: dict[str, list[Lifecycle]] = defaultdict(list)
+    for lifecycle in lifecycles:
+        by_kind[lifecycle.kind].append(lifecycle)
+    print(f"\n{'kind':<14} {'count':>6} {'api/lc':>8} {'db/lc':>8}")
+    for kind, group in sorted(by_kind.items()):
+        api = sum(sum(lifecycle.api_calls.values()) for lifecycle in group)
+        db = sum(sum(lifecycle.db_calls.values()) for lifecycle in group)
+        print(
+            f"{kind:<14} {len(group):>6} {api / len(group):8.2f} {db / len(group):8.2f}"
+        )
+    print_calls("API calls", lifecycles, "api_calls")
+    print_calls("DB calls", lifecycles, "db_calls")
+    shared = simulation.database.calls["flush_join_request_votes"]
+    print(
+        f"   {'flush_join_request_votes (shared)':<36} {shared / len(lifecycles):6.2f}"
+    )
+
+
+async def main(args) -> int:
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    settings.set("logchannel.enable", False)
+
+    rng = random.Random(args.seed)
+    lifecycles = [
+        make_lifecycle(index, rng, args.spread) for index in range(args.lifecycles)
+    ]
+    simulation = Simulation(lifecycles)
+    join_request_vote.BotDatabase = simulation.database
+
+    started = time.perf_counter()
+    await simulation.run()
+    elapsed = time.perf_counter() - started
+
+    report(simulation, elapsed)
+    errors = simulation.verify()
+    if errors:
+        print(f"\n{len(errors)} lifecycle errors:")
+        for error in errors[:20]:
+            print(f"   {error}")
+        return 1
+    print("\nall lifecycles ended as expected")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lifecycles", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--spread", type=float, default=3600, help="arrival window in seconds"
+    )
+    parser.add_argument("--log-level", default="CRITICAL")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:40
+# @Author  : KimmyXYC
+# @File    : stub_api.py
+# @Software: PyCharm
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 1000,
+    "is_bot": True,
+    "first_name": "Bench",
+    "username": "bench_bot",
+}
+
+
+class BotApiStub:
+    """
+    Minimal local stand-in for the Telegram Bot API.
+    Serves /bot<token>/<method> with plausible results, hands out injected
+    updates through getUpdates long polling and counts every call per method.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.injected_at: dict[int, float] = {}
+        self._updates: deque[dict] = deque()
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.polling = asyncio.Event()
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def push_update(self, update: dict) -> int:
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        self.injected_at[update_id] = time.perf_counter()
+        self._updates.append(update)
+        self._new_updates.set()
+        return update_id
+
+    def outbound_calls(self) -> Counter:
+        """
+        Calls made by the bot, without getUpdates polling.
+        """
+        calls = Counter(self.calls)
+        calls.pop("getUpdates", None)
+        return calls
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._params(request)
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            self.calls[method] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            result = self._result(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        """
+        pyTelegramBotAPI sends form data in the body even for GET requests,
+        which request.post() ignores.
+        """
+        params = dict(request.query)
+        if not request.can_read_body:
+            return params
+        if request.content_type == "multipart/form-data":
+            reader = await request.multipart()
+            async for part in reader:
+                params[part.name] = await part.text()
+        else:
+            params.update(parse_qsl((await request.read()).decode()))
+        return params
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        if offset < 0:
+            # skip_updates(): nothing is pending before the benchmark starts.
+            return []
+        self.polling.set()
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(
+                    self._new_updates.wait(), timeout=float(params.get("timeout", 20))
+                )
+            except asyncio.TimeoutError:
+                return []
+        limit = int(params.get("limit") or 100)
+        return list(itertools.islice(self._updates, limit))
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {
+                "id": chat_id,
+                "type": "supergroup" if chat_id < 0 else "private",
+                "title": "Bench",
+            },
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+        message.update(extra)
+        return message
+
+    @staticmethod
+    def _poll(params: dict) -> dict:
+        options = json.loads(params.get("options", '["Yes", "No"]'))
+        return {
+            "id": "1",
+            "question": params.get("question", ""),
+            "options": [
+                {"text": option if isinstance(option, str) else option["text"]}
+                | {"voter_count": count}
+                for option, count in zip(options, (3, 1))
+            ],
+            "total_voter_count": 4,
+            "is_closed": True,
+            "is_anonymous": True,
+            "type": "regular",
+            "allows_multiple_answers": False,
+        }
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in {"sendMessage", "editMessageText", "copyMessage"}:
+            return self._message(params)
+        if method == "sendPoll":
+            return self._message(params, poll=self._poll(params))
+        if method == "stopPoll":
+            return self._poll({})
+        if method == "getChatMember":
+            user_id = int(params.get("user_id", 0))
+            return {
+                "user": {"id": user_id, "is_bot": False, "first_name": "Admin"},
+                "status": "administrator",
+                "can_be_edited": False,
+                "is_anonymous": False,
+                "can_manage_chat": True,
+                "can_delete_messages": True,
+                "can_manage_video_chats": True,
+                "can_restrict_members": True,
+                "can_promote_members": False,
+                "can_change_info": True,
+                "can_invite_users": True,
+                "can_post_stories": False,
+                "can_edit_stories": False,
+                "can_delete_stories": False,
+                "can_pin_messages": True,
+            }
+        if method == "getChat":
+            chat_id = int(params.get("chat_id", 0))
+            return {"id": chat_id, "type": "supergroup", "title": "Bench"}
+        return True
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:55
+# @Author  : KimmyXYC
+# @File    : throughput.py
+# @Software: PyCharm
+"""
+End-to-end throughput benchmark.
+
+Runs the real BotRunner (long polling, dispatcher, handlers, Postgres) against
+a local Bot API stub and injects chat_join_request, callback_query and
+/setting updates at fixed rates, then ramps join requests up to find the
+highest rate the bot sustains.
+
+    python -m bench.throughput --rate 50 --join-requests 500 --ramp 50,100,200,400
+
+The bot runs against its own database (approvebypoll_throughput by default),
+created on the configured server and dropped afterwards unless --keep is
+given; the configured database itself is never written to.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from loguru import logger
+
+from app.callback_data import encode_vote
+from app_conf import settings
+from bench.database import create_database, drop_database
+from bench.stub_api import BotApiStub
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """
+    Handler latency (dispatcher pick-up to done) and end-to-end latency
+    (injected into the stub to done) per update_id.
+    """
+
+    def __init__(self, stub: BotApiStub):
+        self.stub = stub
+        self.done: dict[int, tuple[float, float]] = {}
+        self._waiters: dict[int, asyncio.Future] = {}
+
+    def wrap(self, handle):
+        async def timed(update):
+            started = time.perf_counter()
+            try:
+                await handle(update)
+            finally:
+                self.done[update.update_id] = (started, time.perf_counter())
+                waiter = self._waiters.pop(update.update_id, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+
+        return timed
+
+    async def wait_for(self, update_ids: list[int], timeout: float) -> bool:
+        pending = []
+        for update_id in update_ids:
+            if update_id not in self.done:
+                future = asyncio.get_running_loop().create_future()
+                self._waiters[update_id] = future
+                pending.append(future)
+        if not pending:
+            return True
+        done, _ = await asyncio.wait(pending, timeout=timeout)
+        return len(done) == len(pending)
+
+    def latencies(self, update_ids: list[int]) -> tuple[list[float], list[float]]:
+        handler, end_to_end = [], []
+        for update_id in update_ids:
+            if update_id not in self.done:
+                continue
+            started, finished = self.done[update_id]
+            handler.append(finished - started)
+            end_to_end.append(finished - self.stub.injected_at[update_id])
+        return handler, end_to_end
+
+
+class LoadGenerator:
+    def __init__(self, stub: BotApiStub, groups: list[int]):
+        self.stub = stub
+        self.groups = groups
+        self._users = iter(range(7_000_000_000, 8_000_000_000))
+        self.admin_id = 6_999_999_999
+
+    def join_request(self, index: int) -> dict:
+        user_id = next(self._users)
+        chat_id = self.groups[index % len(self.groups)]
+        return {
+            "chat_join_request": {
+                "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Applicant"},
+                "user_chat_id": user_id,
+                "date": int(time.time()),
+            }
+        }
+
+    def vote(self, chat_id: int, message_id: int | None, uuid: str) -> dict:
+        voter_id = next(self._users)
+        update = {
+            "callback_query": {
+                "id": str(voter_id),
+                "from": {"id": voter_id, "is_bot": False, "first_name": "Voter"},
+                "chat_instance": "bench",
+                "data": encode_vote(uuid, random.choice(("yes", "no"))),
+            }
+        }
+        if message_id is not None:
+            update["callback_query"]["message"] = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+                "text": "vote",
+            }
+        return update
+
+    def setting_command(self, index: int) -> dict:
+        chat_id = self.groups[index % len(self.groups)]
+        return {
+            "message": {
+                "message_id": index + 1,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+                "from": {"id": self.admin_id, "is_bot": False, "first_name": "Admin"},
+                "text": "/setting",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 8}],
+            }
+        }
+
+    async def inject(self, updates, rate: float) -> list[int]:
+        """
+        Push updates into the stub at a fixed rate (per second).
+        """
+        update_ids = []
+        started = time.perf_counter()
+        for index, update in enumerate(updates):
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update_ids.append(self.stub.push_update(update))
+        return update_ids
+
+
+def print_phase(
+    name: str,
+    recorder: Recorder,
+    update_ids: list[int],
+    calls: Counter,
+    elapsed: float,
+):
+    handler, end_to_end = recorder.latencies(update_ids)
+    count = len(update_ids)
+    print(f"\n== {name}: {len(handler)}/{count} updates in {elapsed:.2f}s")
+    print(
+        f"   handler  p50 {percentile(handler, 0.5) * 1000:8.1f} ms"
+        f"   p99 {percentile(handler, 0.99) * 1000:8.1f} ms"
+        f"   max {max(handler, default=0) * 1000:8.1f} ms"
+    )
+    print(
+        f"   e2e      p50 {percentile(end_to_end, 0.5) * 1000:8.1f} ms"
+        f"   p99 {percentile(end_to_end, 0.99) * 1000:8.1f} ms"
+        f"   max {max(end_to_end, default=0) * 1000:8.1f} ms"
+    )
+    total = sum(calls.values())
+    print(f"   outbound calls per update: {total / max(count, 1):.2f}")
+    for method, calls_made in calls.most_common():
+        print(f"     {method:<28} {calls_made / max(count, 1):6.2f}")
+
+
+async def run_phase(recorder, generator, stub, name, updates, rate, drain):
+    before = stub.outbound_calls()
+    started = time.perf_counter()
+    update_ids = await generator.inject(updates, rate)
+    completed = await recorder.wait_for(update_ids, drain)
+    elapsed = time.perf_counter() - started
+    print_phase(name, recorder, update_ids, stub.outbound_calls() - before, elapsed)
+    return update_ids, completed, elapsed
+
+
+async def ramp(recorder, generator, stub, rates, step_seconds, slo, drain):
+    """
+    Inject join requests at increasing rates; a rate is sustained when every
+    update completes within the drain time and e2e p99 stays under slo.
+    """
+    sustained = 0.0
+    offset = 0
+    print("\n== ramp (join requests)")
+    for rate in rates:
+        count = max(int(rate * step_seconds), 1)
+        updates = [generator.join_request(offset + i) for i in range(count)]
+        offset += count
+        update_ids = await generator.inject(updates, rate)
+        completed = await recorder.wait_for(update_ids, drain)
+        _, end_to_end = recorder.latencies(update_ids)
+        p99 = percentile(end_to_end, 0.99)
+        ok = completed and p99 <= slo
+        print(
+            f"   {rate:8.1f}/s  done {len(end_to_end)}/{count}"
+            f"  e2e p99 {p99 * 1000:8.1f} ms  {'ok' if ok else 'FAIL'}"
+        )
+        if not ok:
+            break
+        sustained = rate
+    print(f"   max sustained: {sustained:.1f} join requests/s")
+    return sustained
+
+
+def configure(args, stub_url: str):
+    """
+    Point the bot at the stub. Must run before any app module is imported,
+    since their singletons read settings at import time.
+    """
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCH")
+    settings.set("botapi.enable", True)
+    settings.set("botapi.api_server", stub_url)
+    settings.set("webhook.enable", False)
+    settings.set("coordination.enable", False)
+    settings.set("logchannel.enable", False)
+    settings.set("batch.enable", args.batch)
+    settings.set("dispatcher.workers", args.workers)
+    settings.set("database.dbname", args.database)
+    if not args.rate_limits:
+        # The stub has no flood limits; measure the bot, not the pacing.
+        settings.set("ratelimit.global_per_second", 1_000_000)
+        settings.set("ratelimit.private_per_second", 1_000_000)
+        settings.set("ratelimit.group_per_minute", 1_000_000)
+
+
+async def main(args):
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    # The configured database only hosts CREATE/DROP DATABASE.
+    home = settings.database.dbname
+    if args.database == home:
+        raise SystemExit(
+            f"refusing to run against the configured database {home}, "
+            "pass another --database"
+        )
+    await create_database(args.database, home)
+
+    stub = BotApiStub(latency=args.api_latency / 1000)
+    await stub.start(port=args.port)
+    configure(args, stub.url)
+
+    from app.controller import BotRunner
+    from utils.postgres import BotDatabase
+
+    await BotDatabase.connect()
+    groups = [-(9_100_000_000 + i) for i in range(args.groups)]
+    for group_id in groups:
+        await BotDatabase.update_group_setting(group_id, "advanced_vote", True)
+
+    runner = BotRunner()
+    recorder = Recorder(stub)
+    runner.dispatcher._handle = recorder.wrap(runner.dispatcher._handle)
+    generator = LoadGenerator(stub, groups)
+    bot_task = asyncio.create_task(runner.run())
+    await asyncio.wait_for(stub.polling.wait(), timeout=30)
+
+    try:
+        updates = [generator.join_request(i) for i in range(args.join_requests)]
+        await run_phase(
+            recorder,
+            generator,
+            stub,
+            "chat_join_request",
+            updates,
+            args.rate,
+            args.drain,
+        )
+
+        sessions = [
+            runner.join_request_store.get(uuid)
+            for uuid in runner.join_request_store.uuids()
+        ]
+        sessions = [session for session in sessions if session is not None]
+        if sessions:
+            updates = []
+            for index in range(args.votes):
+                session = sessions[index % len(sessions)]
+                updates.append(
+                    generator.vote(
+                        session.chat_id,
+                        getattr(session, "message2_id", None),
+                        session.uuid,
+                    )
+                )
+            await run_phase(
+                recorder,
+                generator,
+                stub,
+                "callback_query",
+                updates,
+                args.rate,
+                args.drain,
+            )
+
+        updates = [generator.setting_command(i) for i in range(args.settings)]
+        await run_phase(
+            recorder, generator, stub, "/setting", updates, args.rate, args.drain
+        )
+
+        if args.ramp:
+            rates = [float(rate) for rate in args.ramp.split(",")]
+            await ramp(
+                recorder,
+                generator,
+                stub,
+                rates,
+                args.step_seconds,
+                args.slo / 1000,
+                args.drain,
+            )
+    finally:
+        bot_task.cancel()
+        try:
+            await bot_task
+        except asyncio.CancelledError:
+            pass
+        await BotDatabase.close()
+        await stub.stop()
+        if not args.keep:
+            await drop_database(args.database, home)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default="approvebypoll_throughput")
+    parser.add_argument("--rate", type=float, default=50, help="updates per second")
+    parser.add_argument("--join-requests", type=int, default=200)
+    parser.add_argument("--votes", type=int, default=400)
+    parser.add_argument("--settings", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument(
+        "--ramp", default="", help="comma separated join request rates to try"
+    )
+    parser.add_argument("--step-seconds", type=float, default=5)
+    parser.add_argument("--slo", type=float, default=1000, help="e2e p99 in ms")
+    parser.add_argument("--drain", type=float, default=30, help="seconds to wait")
+    parser.add_argument(
+        "--api-latency", type=float, default=20, help="stub latency in ms"
+    )
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch", action="store_true", help="enable batching")
+    parser.add_argument(
+        "--rate-limits", action="store_true", help="keep outbound rate limits"
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the database")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:30
+# @Author  : KimmyXYC
+# @File    : virtual.py
+# @Software: PyCharm
+import asyncio
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+from typing import Callable
+
+
+class VirtualClock:
+    """
+    Wall-clock stand-in for DeadlineScheduler that only moves when told to.
+    """
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, when: float):
+        self.now = max(self.now, when)
+
+
+class FakeBot:
+    """
+    In-process AsyncTeleBot stand-in. Every method call is counted and
+    answered with a plausible result; polls keep a tally that stop_poll
+    returns. fail(method, kwargs) decides which calls raise.
+    """
+
+    ADMIN_RIGHTS = {
+        "can_invite_users": True,
+        "can_delete_messages": True,
+        "can_pin_messages": True,
+        "can_restrict_members": True,
+        "can_change_info": True,
+    }
+
+    def __init__(
+        self,
+        admins: set[int] | None = None,
+        fail: Callable[[str, dict], bool] | None = None,
+        on_call: Callable[[str, dict], None] | None = None,
+    ):
+        self.admins = admins if admins is not None else set()
+        self.fail = fail
+        self.on_call = on_call
+        self.calls: Counter[str] = Counter()
+        self.polls: dict[tuple[int, int], list[int]] = {}
+        self._message_ids = itertools.count(1)
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        async def call(**kwargs):
+            self.calls[method] += 1
+            if self.on_call is not None:
+                self.on_call(method, kwargs)
+            # Yield like a real request would, without spending real time.
+            await asyncio.sleep(0)
+            if self.fail is not None and self.fail(method, kwargs):
+                raise RuntimeError(f"simulated {method} failure")
+            return self._result(method, kwargs)
+
+        return call
+
+    def vote_poll(self, chat_id: int, message_id: int, option: int):
+        self.polls[(chat_id, message_id)][option] += 1
+
+    def _result(self, method: str, kwargs: dict):
+        if method == "get_chat_member":
+            user_id = kwargs["user_id"]
+            if user_id in self.admins:
+                return SimpleNamespace(status="administrator", **self.ADMIN_RIGHTS)
+            return SimpleNamespace(status="member")
+        if method == "send_poll":
+            message_id = next(self._message_ids)
+            self.polls[(kwargs["chat_id"], message_id)] = [0, 0]
+            return SimpleNamespace(message_id=message_id)
+        if method == "stop_poll":
+            tally = self.polls.get((kwargs["chat_id"], kwargs["message_id"]), [0, 0])
+            return SimpleNamespace(
+                options=[SimpleNamespace(voter_count=count) for count in tally]
+            )
+        if method in {"send_message", "copy_message", "reply_to"}:
+            return SimpleNamespace(message_id=next(self._message_ids))
+        return True
+
+
+class MemoryDatabase:
+    """
+    In-memory stand-in for the BotDatabase methods used by a vote lifecycle.
+    Rows mirror join_request, join_request_session and join_request_vote;
+    every call is counted per method and reported to on_call(method, uuid).
+    """
+
+    def __init__(
+        self,
+        group_settings: Callable[[int], dict],
+        on_call: Callable[[str, str | None], None] | None = None,
+    ):
+        self.group_settings = group_settings
+        self.on_call = on_call
+        self.calls: Counter[str] = Counter()
+        self.join_requests: dict[str, dict] = {}
+        self.sessions: dict[str, dict] = {}
+        self.votes: dict[tuple[str, int], bool] = {}
+        self._vote_buffer: list[tuple[str, int, bool]] = []
+
+    def _count(self, method: str, uuid: str | None = None):
+        self.calls[method] += 1
+        if self.on_call is not None:
+            self.on_call(method, uuid)
+
+    async def open_join_request(
+        self, uuid: str, group_id: int, user_id: int
+    ) -> tuple[dict, bool]:
+        self._count("open_join_request", uuid)
+        await asyncio.sleep(0)
+        group_settings = self.group_settings(group_id)
+        waiting = any(
+            row["waiting"] and row["group_id"] == group_id and row["user_id"] == user_id
+            for row in self.join_requests.values()
+        )
+        if group_settings.get("vote_to_join", True) and not waiting:
+            self.join_requests[uuid] = {
+                "group_id": group_id,
+                "user_id": user_id,
+                "waiting": True,
+                "result": None,
+                "admin": None,
+                "yes_votes": None,
+                "no_votes": None,
+            }
+        return group_settings, waiting
+
+    def queue_join_request_result(
+        self,
+        uuid: str,
+        group_id: int,
+        user_id: int,
+        result: bool,
+        admin: int | None = None,
+        yes_votes: int | None = None,
+        no_votes: int | None = None,
+    ) -> None:
+        self._count("queue_join_request_result", uuid)
+        self._close_join_request(uuid, result, admin, yes_votes, no_votes)
+
+    def _close_join_request(
+        self,
+        uuid: str,
+        result: bool,
+        admin: int | None = None,
+        yes_votes: int | None = None,
+        no_votes: int | None = None,
+    ) -> None:
+        row = self.join_requests.get(uuid)
+        if row is None or not row["waiting"]:
+            return
+        row.update(waiting=False, result=result, admin=admin)
+        if yes_votes is not None:
+            row["yes_votes"] = yes_votes
+        if no_votes is not None:
+            row["no_votes"] = no_votes
+
+    async def close_join_requests(self, closes: list[dict]) -> None:
+        for close in closes:
+            self._count("close_join_requests", close["uuid"])
+        await asyncio.sleep(0)
+        for close in closes:
+            self._close_join_request(
+                close["uuid"],
+                close["result"],
+                close.get("admin"),
+                close.get("yes_votes"),
+                close.get("no_votes"),
+            )
+
+    async def save_join_request_session(self, uuid: str, **fields) -> None:
+        self._count("save_join_request_session", uuid)
+        await asyncio.sleep(0)
+        self.sessions[uuid] = dict(fields, message4_id=None, cleanup_at=None)
+
+    async def update_join_request_session(self, uuid: str, **fields) -> bool:
+        self._count("update_join_request_session", uuid)
+        await asyncio.sleep(0)
+        session = self.sessions.get(uuid)
+        if session is None:
+            return False
+        session.update(fields)
+        return True
+
+    def queue_join_request_session_delete(self, uuid: str) -> None:
+        self._count("queue_join_request_session_delete", uuid)
+        self.sessions.pop(uuid, None)
+
+    def queue_join_request_vote(
+        self, uuid: str, user_id: int, full_name: str, approve: bool
+    ) -> None:
+        self._count("queue_join_request_vote", uuid)
+        self._vote_buffer.append((uuid, user_id, approve))
+
+    async def flush_join_request_votes(self) -> int:
+        self._count("flush_join_request_votes")
+        await asyncio.sleep(0)
+        rows, self._vote_buffer = self._vote_buffer, []
+        for uuid, user_id, approve in rows:
+            self.votes.setdefault((uuid, user_id), approve)
+        return len(rows)
@@ -10,8 +10,31 @@ CREATE TABLE IF NOT EXISTS setting (
     mini_voters INTEGER NOT NULL DEFAULT 3 CHECK (mini_voters BETWEEN 1 AND 500)
 );
 
+-- Bounds of request_time for a version 7 uuid (see utils/migrations.py).
+CREATE OR REPLACE FUNCTION join_request_time_lower(request_uuid UUID)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE WHEN substr(request_uuid::text, 15, 1) = '7' THEN
+        to_timestamp((
+            'x' || substr(request_uuid::text, 1, 8)
+            || substr(request_uuid::text, 10, 4)
+        )::bit(48)::bigint / 1000.0 - 86400)
+    ELSE '-infinity'::timestamptz END
+$$;
+
+CREATE OR REPLACE FUNCTION join_request_time_upper(request_uuid UUID)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE WHEN substr(request_uuid::text, 15, 1) = '7' THEN
+        to_timestamp((
+            'x' || substr(request_uuid::text, 1, 8)
+            || substr(request_uuid::text, 10, 4)
+        )::bit(48)::bigint / 1000.0 + 86400)
+    ELSE 'infinity'::timestamptz END
+$$;
+
 CREATE TABLE IF NOT EXISTS join_request (
-    uuid UUID PRIMARY KEY,
+    uuid UUID NOT NULL,
     group_id BIGINT NOT NULL,
     user_id BIGINT NOT NULL,
     request_time TIMESTAMPTZ(0) NOT NULL,
@@ -19,5 +42,103 @@ CREATE TABLE IF NOT EXISTS join_request (
     result BOOLEAN NULL,
     admin BIGINT NULL,
     yes_votes INTEGER NULL,
-    no_votes INTEGER NULL
+    no_votes INTEGER NULL,
+    PRIMARY KEY (uuid, request_time)
+) PARTITION BY RANGE (request_time);
+
+CREATE INDEX IF NOT EXISTS join_request_group_id_request_time_idx
+ON join_request (group_id, request_time);
+
+CREATE INDEX IF NOT EXISTS join_request_waiting_idx
+ON join_request (uuid)
+WHERE waiting;
+
+-- Monthly partitions (UTC) up to two months ahead; the bot keeps creating
+-- them from then on (utils/retention.py).
+DO $$
+DECLARE
+    month DATE := date_trunc('month', NOW() AT TIME ZONE 'UTC')::date;
+BEGIN
+    WHILE month <= (date_trunc('month', NOW() AT TIME ZONE 'UTC')
+                    + INTERVAL '2 months')::date LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF join_request '
+            'FOR VALUES FROM (%L) TO (%L)',
+            'join_request_p' || to_char(month, 'YYYYMM'),
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+END
+$$;
+
+CREATE TABLE IF NOT EXISTS join_request_default PARTITION OF join_request DEFAULT;
+
+-- Exactly the waiting join requests: at most one per user and group.
+CREATE TABLE IF NOT EXISTS join_request_waiting (
+    group_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    uuid UUID NOT NULL UNIQUE,
+    request_time TIMESTAMPTZ(0) NOT NULL,
+    PRIMARY KEY (group_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS join_request_session (
+    uuid UUID PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    request JSONB NOT NULL,
+    group_settings JSONB NOT NULL,
+    advanced_vote BOOLEAN NOT NULL,
+    message1_id BIGINT NULL,
+    message2_id BIGINT NULL,
+    message3_id BIGINT NULL,
+    message4_id BIGINT NULL,
+    log_message_id BIGINT NULL,
+    deadline TIMESTAMPTZ NOT NULL,
+    cleanup_at TIMESTAMPTZ NULL,
+    owner TEXT NULL,
+    batch_id UUID NULL,
+    lease_epoch BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS join_request_session_owner_idx
+ON join_request_session (owner);
+
+CREATE INDEX IF NOT EXISTS join_request_session_batch_id_idx
+ON join_request_session (batch_id)
+WHERE batch_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS join_request_vote (
+    uuid UUID NOT NULL,
+    voter_id BIGINT NOT NULL,
+    full_name TEXT NOT NULL,
+    approve BOOLEAN NOT NULL,
+    voted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (uuid, voter_id)
+);
+
+CREATE TABLE IF NOT EXISTS bot_instance (
+    instance_id TEXT PRIMARY KEY,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
+
+-- This file matches migration 8, so the bot must not apply 1-8 again.
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO schema_migrations (version, name) VALUES
+    (1, 'create_base_tables'),
+    (2, 'join_request_indexes'),
+    (3, 'join_request_session'),
+    (4, 'join_request_vote'),
+    (5, 'instance_coordination'),
+    (6, 'join_request_session_batch'),
+    (7, 'partition_join_request'),
+    (8, 'join_request_session_lease_epoch')
+ON CONFLICT (version) DO NOTHING;
@@ -1,4 +1,5 @@
 import asyncio
+import signal
 import sys
 
 from dotenv import load_dotenv
@@ -29,7 +30,30 @@ logger.info("Log Is Secret, Please Don't Share It To Others")
 async def main():
     await BotDatabase.connect()
     await BotDatabase.ensure_tables_exist()
-    await asyncio.gather(BotRunner().run())
+    runner = asyncio.create_task(BotRunner().run())
+
+    # docker stop / systemctl stop send SIGTERM: cancel the runner so that its
+    # shutdown flushes queued ballots and lifecycle writes. A second signal
+    # gets the default behaviour and stops the process right away.
+    loop = asyncio.get_running_loop()
+    stop_signals = (signal.SIGTERM, signal.SIGINT)
+
+    def shutdown():
+        logger.info("Stopping, flushing queued writes...")
+        for stop_signal in stop_signals:
+            loop.remove_signal_handler(stop_signal)
+        runner.cancel()
+
+    for stop_signal in stop_signals:
+        try:
+            loop.add_signal_handler(stop_signal, shutdown)
+        except NotImplementedError:
+            # Windows event loops have no signal handlers.
+            break
+    try:
+        await runner
+    except asyncio.CancelledError:
+        pass
 
 
 if __name__ == "__main__":
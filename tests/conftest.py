@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 10:00
+# @Author  : KimmyXYC
+# @File    : conftest.py
+# @Software: PyCharm
+import os
+
+# Module-level singletons read settings at import time; the unit tests never
+# connect anywhere, so placeholders are enough when no config is present.
+os.environ.setdefault(
+    "DYNACONF_DATABASE",
+    '@json {"host": "127.0.0.1", "port": 5432, "user": "postgres",'
+    ' "password": "", "dbname": "postgres"}',
+)
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST")
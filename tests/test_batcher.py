@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 12:10
+# @Author  : KimmyXYC
+# @File    : test_batcher.py
+# @Software: PyCharm
+import asyncio
+from types import SimpleNamespace
+
+from app.join_request_batch import JoinRequestBatch, JoinRequestBatcher
+from utils.scheduler import DeadlineScheduler
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_batcher(clock: Clock, started: list) -> JoinRequestBatcher:
+    async def start_single(request, uuid, group_settings):
+        started.append(("single", uuid))
+
+    async def start_batch(requests, group_settings):
+        started.append(("batch", [uuid for _, uuid in requests]))
+
+    return JoinRequestBatcher(
+        DeadlineScheduler(clock=clock),
+        start_single,
+        start_batch,
+        window=60,
+        min_size=2,
+        max_size=3,
+        collect=15,
+    )
+
+
+def request(chat_id: int, full_name: str = "User") -> SimpleNamespace:
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id),
+        from_user=SimpleNamespace(id=7, username=None, full_name=full_name),
+    )
+
+
+def test_burst_is_batched_on_the_scheduler_clock():
+    async def scenario():
+        clock = Clock()
+        started = []
+        batcher = make_batcher(clock, started)
+        await batcher.add(request(-1), "a", {})
+        await batcher.add(request(-1), "b", {})
+        assert started == [("single", "a")]
+        assert batcher.scheduler.next_deadline() == clock.now + 15
+
+        await batcher.add(request(-1), "c", {})
+        await batcher.add(request(-1), "d", {})
+        assert started == [("single", "a"), ("batch", ["b", "c", "d"])]
+        assert len(batcher.scheduler) == 0
+
+    asyncio.run(scenario())
+
+
+def test_quiet_chats_are_forgotten():
+    async def scenario():
+        clock = Clock()
+        batcher = make_batcher(clock, [])
+        for chat_id in range(100):
+            await batcher.add(request(chat_id), str(chat_id), {})
+        assert len(batcher._arrivals) == 100
+
+        clock.now += 60
+        await batcher.add(request(-1), "e", {})
+        assert list(batcher._arrivals) == [-1]
+
+    asyncio.run(scenario())
+
+
+def test_batch_is_split_before_its_message_gets_too_long(monkeypatch):
+    async def scenario():
+        clock = Clock()
+        started = []
+        batcher = make_batcher(clock, started)
+        await batcher.add(request(-1), "a", {})
+        await batcher.add(request(-1, "x" * 200), "b", {})
+        limit = JoinRequestBatch.text_length([request(-1, "x" * 200)] * 2, "en_US")
+        monkeypatch.setattr(JoinRequestBatch, "MAX_TEXT_LENGTH", limit)
+
+        await batcher.add(request(-1, "y" * 500), "c", {})
+        await batcher.add(request(-1), "d", {})
+        assert started == [("single", "a"), ("batch", ["b", "c"])]
+        assert batcher.stats()["collecting_requests"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_long_names_do_not_lengthen_batch_lines():
+    short = JoinRequestBatch.text_length([request(-1, "x" * 40)], "en_US")
+    long = JoinRequestBatch.text_length([request(-1, "x" * 4000)], "en_US")
+    assert short == long
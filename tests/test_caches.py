@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 11:00
+# @Author  : KimmyXYC
+# @File    : test_caches.py
+# @Software: PyCharm
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import utils.chat_member_cache as chat_member_cache
+import utils.postgres as postgres
+from utils.chat_member_cache import BotRightsSnapshot, ChatMemberCache
+from utils.postgres import GroupSettingsCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(postgres.time, "monotonic", clock)
+    monkeypatch.setattr(chat_member_cache.time, "monotonic", clock)
+    return clock
+
+
+class MemberBot:
+    def __init__(self):
+        self.calls = 0
+        self.status = "member"
+        self.gate: asyncio.Event | None = None
+
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        return SimpleNamespace(status=self.status)
+
+
+def test_settings_cache_returns_copies(clock):
+    cache = GroupSettingsCache()
+    row = {"group_id": 1, "vote_time": 600}
+    cache.set(1, row)
+    row["vote_time"] = 60
+    cached = cache.get(1)
+    assert cached["vote_time"] == 600
+    cached["vote_time"] = 30
+    assert cache.get(1)["vote_time"] == 600
+
+
+def test_settings_cache_expires_and_evicts(clock):
+    cache = GroupSettingsCache(max_size=2, ttl=10)
+    cache.set(1, {"group_id": 1})
+    cache.set(2, {"group_id": 2})
+    assert cache.get(1) is not None
+    cache.set(3, {"group_id": 3})
+    # 2 was the least recently used entry.
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+
+    clock.now += 10
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 1
+
+
+def test_settings_cache_invalidation(clock):
+    cache = GroupSettingsCache()
+    cache.set(1, {"group_id": 1})
+    cache.set(2, {"group_id": 2})
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    cache.invalidate()
+    assert cache.get(2) is None
+
+
+def test_member_cache_shares_concurrent_lookups(clock):
+    async def scenario():
+        cache = ChatMemberCache(ttl=60)
+        bot = MemberBot()
+        bot.gate = asyncio.Event()
+        lookups = [asyncio.create_task(cache.get(bot, -1, 7)) for _ in range(5)]
+        await asyncio.sleep(0)
+        bot.gate.set()
+        members = await asyncio.gather(*lookups)
+        assert bot.calls == 1
+        assert all(member is members[0] for member in members)
+
+        await cache.get(bot, -1, 7)
+        assert bot.calls == 1
+        clock.now += 60
+        await cache.get(bot, -1, 7)
+        assert bot.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_member_cache_follows_chat_member_updates(clock):
+    async def scenario():
+        cache = ChatMemberCache(ttl=60)
+        bot = MemberBot()
+        assert (await cache.get(bot, -1, 7)).status == "member"
+
+        cache.update(-1, 7, SimpleNamespace(status="administrator"))
+        assert (await cache.get(bot, -1, 7)).status == "administrator"
+        assert bot.calls == 1
+
+        cache.invalidate(-1, 7)
+        bot.status = "left"
+        assert (await cache.get(bot, -1, 7)).status == "left"
+        assert bot.calls == 2
+
+        await cache.get(bot, -2, 7)
+        cache.invalidate(-1)
+        await cache.get(bot, -1, 7)
+        await cache.get(bot, -2, 7)
+        assert bot.calls == 4
+
+    asyncio.run(scenario())
+
+
+def test_member_cache_drops_a_lookup_invalidated_in_flight(clock):
+    async def scenario():
+        cache = ChatMemberCache(ttl=60)
+        bot = MemberBot()
+        bot.gate = asyncio.Event()
+        lookup = asyncio.create_task(cache.get(bot, -1, 7))
+        await asyncio.sleep(0)
+        cache.invalidate(-1, 7)
+        bot.gate.set()
+        await lookup
+        bot.gate = None
+        await cache.get(bot, -1, 7)
+        assert bot.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_bot_rights_refetch_after_invalidation():
+    async def scenario():
+        rights = BotRightsSnapshot()
+        rights.bot_id = 1
+        bot = MemberBot()
+        bot.status = "administrator"
+        assert (await rights.get(bot, -1)).status == "administrator"
+        await rights.get(bot, -1)
+        assert bot.calls == 1
+
+        bot.status = "member"
+        rights.invalidate(-1)
+        assert (await rights.get(bot, -1)).status == "member"
+        await rights.get(bot, -2)
+        rights.invalidate()
+        await rights.get(bot, -1)
+        await rights.get(bot, -2)
+        assert bot.calls == 5
+
+    asyncio.run(scenario())
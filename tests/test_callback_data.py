@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 13:10
+# @Author  : KimmyXYC
+# @File    : test_callback_data.py
+# @Software: PyCharm
+import asyncio
+import base64
+import struct
+from types import SimpleNamespace
+
+import pytest
+
+from app.callback_data import (
+    ACTIONS,
+    LANGUAGES,
+    SETTING_ITEMS,
+    TOGGLE_SETTINGS,
+    VOTE_OPTIONS,
+    CallbackData,
+    CallbackRouter,
+    decode_callback,
+    encode_action,
+    encode_setting,
+    encode_status,
+    encode_vote,
+)
+import app.event as event
+from app.utils import generate_uuid
+
+UUID = generate_uuid()
+GROUP_ID = -1001234567890
+
+
+def setting_cases():
+    for item in TOGGLE_SETTINGS:
+        yield item, "true"
+        yield item, "false"
+    for item in ("vote_time", "mini_voters"):
+        yield item, "menu"
+        yield item, "1"
+        yield item, "3600"
+    yield "language", "menu"
+    for language in LANGUAGES:
+        yield "language", language
+    yield "back", "main"
+    yield "close", "true"
+
+
+def test_join_request_payloads_round_trip():
+    for action in ACTIONS:
+        assert decode_callback(encode_action(UUID, action)) == CallbackData(
+            "action", uuid=UUID, option=action
+        )
+    for option in VOTE_OPTIONS:
+        assert decode_callback(encode_vote(UUID, option)) == CallbackData(
+            "vote", uuid=UUID, option=option
+        )
+    assert decode_callback(encode_status(UUID)) == CallbackData("status", uuid=UUID)
+
+
+def test_setting_payloads_round_trip():
+    for item, value in setting_cases():
+        assert decode_callback(encode_setting(GROUP_ID, item, value)) == CallbackData(
+            "setting", group_id=GROUP_ID, item=item, value=value
+        )
+
+
+def test_payloads_fit_telegram_limit():
+    payloads = [encode_action(UUID, "approve"), encode_vote(UUID, "yes")]
+    payloads.append(encode_status(UUID))
+    payloads += [
+        encode_setting(-(2**63), item, value) for item, value in setting_cases()
+    ]
+    for payload in payloads:
+        assert len(payload.encode()) <= 64
+    assert len(encode_vote(UUID, "no")) == 24
+
+
+def test_legacy_payloads_decode_like_compact_ones():
+    assert decode_callback(f"jr {UUID} ban") == decode_callback(
+        encode_action(UUID, "ban")
+    )
+    assert decode_callback(f"jrv {UUID} no") == decode_callback(encode_vote(UUID, "no"))
+    assert decode_callback(f"jrs {UUID}") == decode_callback(encode_status(UUID))
+    for item, value in setting_cases():
+        assert decode_callback(f"setting {GROUP_ID} {item} {value}") == (
+            decode_callback(encode_setting(GROUP_ID, item, value))
+        )
+    # Both forms normalize numbers the same way.
+    assert decode_callback(f"setting {GROUP_ID} vote_time 0600").value == "600"
+
+
+def test_zero_is_reserved_for_the_menu():
+    with pytest.raises(ValueError):
+        encode_setting(GROUP_ID, "vote_time", "0")
+    assert decode_callback(f"setting {GROUP_ID} vote_time 0") is None
+    assert decode_callback(f"setting {GROUP_ID} mini_voters 0") is None
+    assert decode_callback(encode_setting(GROUP_ID, "vote_time", "menu")).value == (
+        "menu"
+    )
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        None,
+        "",
+        "X",
+        "V",
+        "Vshort",
+        encode_vote(UUID, "yes") + "A",
+        "V" + "!" * 23,
+        f"jrv {UUID}",
+        f"jrv {UUID} maybe",
+        "jrv not-a-uuid yes",
+        f"jr {UUID} approve extra",
+        f"unknown {UUID} yes",
+        f"setting {GROUP_ID} pin_msg maybe",
+        f"setting {GROUP_ID} unknown true",
+        "setting group pin_msg true",
+        f"setting {GROUP_ID} vote_time 70000",
+        f"setting {2**63} pin_msg true",
+        f"setting {GROUP_ID} language xx_XX",
+        f"setting {GROUP_ID} back menu",
+    ],
+)
+def test_malformed_payloads_are_rejected(payload):
+    assert decode_callback(payload) is None
+
+
+def test_out_of_range_fields_are_rejected():
+    def pack(opcode: str, layout: str, *fields) -> str:
+        raw = struct.pack(layout, *fields)
+        return opcode + base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    uuid_bytes = bytes(16)
+    assert decode_callback(pack("V", ">16sB", uuid_bytes, len(VOTE_OPTIONS))) is None
+    assert decode_callback(pack("A", ">16sB", uuid_bytes, len(ACTIONS))) is None
+    assert decode_callback(pack("G", ">qBH", GROUP_ID, len(SETTING_ITEMS), 1)) is None
+    pin_msg = SETTING_ITEMS.index("pin_msg")
+    assert decode_callback(pack("G", ">qBH", GROUP_ID, pin_msg, 2)) is None
+    language = SETTING_ITEMS.index("language")
+    assert decode_callback(pack("G", ">qBH", GROUP_ID, language, 99)) is None
+
+
+class Bot:
+    def __init__(self):
+        self.answers = []
+
+    async def answer_callback_query(self, callback_query_id, text=None):
+        self.answers.append(text)
+
+
+def test_router_dispatches_by_kind():
+    async def scenario():
+        bot = Bot()
+        router = CallbackRouter(bot)
+        handled = []
+
+        @router.register("vote")
+        async def on_vote(call, data):
+            handled.append(data)
+
+        await router.dispatch(SimpleNamespace(id="1", data=encode_vote(UUID, "yes")))
+        await router.dispatch(SimpleNamespace(id="2", data="garbage"))
+        await router.dispatch(SimpleNamespace(id="3", data=encode_status(UUID)))
+        assert handled == [CallbackData("vote", uuid=UUID, option="yes")]
+        assert bot.answers == ["Invalid callback", "Unsupported callback"]
+        assert router.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_router_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        CallbackRouter(Bot()).register("poll")
+
+
+def test_setting_callback_listener_decodes_the_payload(monkeypatch):
+    async def scenario():
+        bot = Bot()
+        handled = []
+
+        async def handle_settings_callback(bot, call, data):
+            handled.append(data)
+
+        monkeypatch.setattr(event, "handle_settings_callback", handle_settings_callback)
+        payload = encode_setting(GROUP_ID, "pin_msg", "true")
+        await event.listen_setting_callback(bot, SimpleNamespace(id="1", data=payload))
+        await event.listen_setting_callback(
+            bot, SimpleNamespace(id="2", data=encode_vote(UUID, "yes"))
+        )
+        assert handled == [decode_callback(payload)]
+        assert bot.answers == ["Invalid callback"]
+
+    asyncio.run(scenario())
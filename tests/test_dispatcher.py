@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 10:30
+# @Author  : KimmyXYC
+# @File    : test_dispatcher.py
+# @Software: PyCharm
+import asyncio
+
+from telebot import types
+
+from app.controller import UpdateDispatcher
+
+GROUP = -1001
+
+
+def message(update_id: int, chat_id: int = GROUP) -> types.Update:
+    return types.Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "supergroup"},
+                "from": {"id": 7, "is_bot": False, "first_name": "User"},
+                "text": "hello",
+            },
+        }
+    )
+
+
+def callback(update_id: int, chat_id: int = GROUP) -> types.Update:
+    return types.Update.de_json(
+        {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": 7, "is_bot": False, "first_name": "User"},
+                "chat_instance": "test",
+                "data": "x",
+                "message": {
+                    "message_id": 1,
+                    "date": 0,
+                    "chat": {"id": chat_id, "type": "supergroup"},
+                    "text": "vote",
+                },
+            },
+        }
+    )
+
+
+def test_updates_of_one_chat_are_handled_in_order():
+    async def scenario():
+        handled = []
+
+        async def handle(update):
+            # Later updates finish faster; order must still hold per chat.
+            await asyncio.sleep(0.001 * (20 - update.update_id % 20))
+            handled.append(update)
+
+        dispatcher = UpdateDispatcher(handle, workers=4)
+        dispatcher.start()
+        try:
+            for update_id in range(40):
+                await dispatcher.submit(message(update_id, GROUP - update_id % 2))
+            while dispatcher.stats()["pending"]:
+                await asyncio.sleep(0.01)
+        finally:
+            await dispatcher.stop()
+
+        for chat_id in (GROUP, GROUP - 1):
+            ids = [u.update_id for u in handled if u.message.chat.id == chat_id]
+            assert ids == sorted(ids)
+        assert len(handled) == 40
+
+    asyncio.run(scenario())
+
+
+def test_callbacks_do_not_wait_behind_a_busy_chat():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handle(update):
+            if update.message is not None:
+                await release.wait()
+            handled.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(handle, workers=2)
+        dispatcher.start()
+        try:
+            await dispatcher.submit(message(1))
+            await dispatcher.submit(message(2))
+            await dispatcher.submit(callback(3))
+            await asyncio.sleep(0.05)
+            assert handled == [3]
+            release.set()
+            while dispatcher.stats()["pending"]:
+                await asyncio.sleep(0.01)
+            assert handled == [3, 1, 2]
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_submit_blocks_at_max_pending():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handle(update):
+            await release.wait()
+
+        dispatcher = UpdateDispatcher(handle, workers=1, max_pending=2)
+        dispatcher.start()
+        try:
+            await dispatcher.submit(message(1))
+            await dispatcher.submit(message(2))
+            blocked = asyncio.create_task(dispatcher.submit(message(3)))
+            await asyncio.sleep(0.05)
+            assert not blocked.done()
+            release.set()
+            await asyncio.wait_for(blocked, timeout=1)
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_handles_queued_updates():
+    async def scenario():
+        handled = []
+
+        async def handle(update):
+            await asyncio.sleep(0.01)
+            handled.append(update.update_id)
+
+        dispatcher = UpdateDispatcher(handle, workers=1)
+        dispatcher.start()
+        for update_id in range(5):
+            await dispatcher.submit(message(update_id))
+        await dispatcher.stop()
+        assert handled == [0, 1, 2, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_stop_gives_up_after_drain_timeout():
+    async def scenario():
+        started = []
+
+        async def handle(update):
+            started.append(update.update_id)
+            await asyncio.Event().wait()
+
+        dispatcher = UpdateDispatcher(handle, workers=1, drain_timeout=0.05)
+        dispatcher.start()
+        await dispatcher.submit(message(1))
+        await dispatcher.submit(message(2))
+        await asyncio.wait_for(dispatcher.stop(), timeout=1)
+        assert started == [1]
+
+    asyncio.run(scenario())
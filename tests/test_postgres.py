@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 12:40
+# @Author  : KimmyXYC
+# @File    : test_postgres.py
+# @Software: PyCharm
+from utils.metrics import Metrics
+from utils.postgres import AsyncPostgresDB
+
+
+def test_pool_gauges_before_connect():
+    database = AsyncPostgresDB()
+    assert database.conn is None
+    exposition = Metrics.render()
+    assert 'approvebypoll_db_pool_connections{state="size"} 0' in exposition
+    assert 'approvebypoll_db_pool_connections{state="idle"} 0' in exposition
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 10:45
+# @Author  : KimmyXYC
+# @File    : test_rate_limit.py
+# @Software: PyCharm
+import asyncio
+import time
+
+import pytest
+from telebot.asyncio_helper import ApiTelegramException
+
+from app.rate_limit import TelegramRateLimiter, TokenBucket
+
+
+def flood_error(retry_after: float) -> ApiTelegramException:
+    return ApiTelegramException(
+        "sendMessage",
+        None,
+        {
+            "ok": False,
+            "error_code": 429,
+            "description": "Too Many Requests",
+            "parameters": {"retry_after": retry_after},
+        },
+    )
+
+
+def test_bucket_allows_a_burst_then_paces():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        assert time.monotonic() - started < 0.02
+        for _ in range(5):
+            await bucket.acquire()
+        # Five more tokens at 50/s take about 0.1s.
+        assert time.monotonic() - started >= 0.08
+
+    asyncio.run(scenario())
+
+
+def test_blocked_bucket_waits_for_retry_after():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.block_for(0.1)
+        assert not bucket.is_idle()
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.09
+
+    asyncio.run(scenario())
+
+
+def limiter_with(responses: list) -> tuple[TelegramRateLimiter, list]:
+    limiter = TelegramRateLimiter(
+        global_per_second=1000, private_per_second=1000, group_per_minute=60000
+    )
+    calls = []
+
+    async def process_request(token, url, method="get", params=None, **kwargs):
+        calls.append((url, params))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    limiter._process_request = process_request
+    return limiter, calls
+
+
+def test_flood_limit_is_retried_after_retry_after():
+    async def scenario():
+        limiter, calls = limiter_with([flood_error(0.1), {"message_id": 1}])
+        started = time.monotonic()
+        result = await limiter.request(
+            "token", "sendMessage", params={"chat_id": -100, "text": "hi"}
+        )
+        assert result == {"message_id": 1}
+        assert len(calls) == 2
+        assert calls[1][1] == {"chat_id": -100, "text": "hi"}
+        assert time.monotonic() - started >= 0.09
+        # Only the flooded chat is paused.
+        assert limiter._chat_bucket(-100).blocked_until > 0
+        assert limiter._chat_bucket(-200).blocked_until == 0
+
+    asyncio.run(scenario())
+
+
+def test_flood_limit_gives_up_after_max_retries():
+    async def scenario():
+        limiter, calls = limiter_with([flood_error(0)] * 3)
+        limiter.max_retries = 2
+        with pytest.raises(ApiTelegramException):
+            await limiter.request("token", "sendMessage", params={"chat_id": 5})
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_other_errors_are_not_retried():
+    async def scenario():
+        error = ApiTelegramException(
+            "sendMessage",
+            None,
+            {"ok": False, "error_code": 400, "description": "Bad Request"},
+        )
+        limiter, calls = limiter_with([error])
+        with pytest.raises(ApiTelegramException):
+            await limiter.request("token", "sendMessage", params={"chat_id": 5})
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
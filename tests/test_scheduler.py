@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 10:00
+# @Author  : KimmyXYC
+# @File    : test_scheduler.py
+# @Software: PyCharm
+import asyncio
+
+from utils.scheduler import DeadlineScheduler
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_dispatches_due_callbacks_in_deadline_order():
+    async def scenario():
+        clock = Clock()
+        scheduler = DeadlineScheduler(clock=clock)
+        fired = []
+
+        def record(key):
+            async def callback():
+                fired.append(key)
+
+            return callback
+
+        scheduler.schedule("late", 1030, record("late"))
+        scheduler.schedule("early", 1010, record("early"))
+        scheduler.schedule("middle", 1020, record("middle"))
+
+        assert scheduler.dispatch_due() == 0
+        clock.now = 1020
+        assert scheduler.dispatch_due() == 2
+        await scheduler.drain()
+        assert fired == ["early", "middle"]
+        assert len(scheduler) == 1
+        assert scheduler.next_deadline() == 1030
+
+    run(scenario())
+
+
+def test_rescheduling_a_key_replaces_the_pending_callback():
+    async def scenario():
+        clock = Clock()
+        scheduler = DeadlineScheduler(clock=clock)
+        fired = []
+
+        async def first():
+            fired.append("first")
+
+        async def second():
+            fired.append("second")
+
+        scheduler.schedule("vote", 1010, first)
+        scheduler.schedule("vote", 1050, second)
+        assert len(scheduler) == 1
+
+        clock.now = 1020
+        assert scheduler.dispatch_due() == 0
+        clock.now = 1050
+        assert scheduler.dispatch_due() == 1
+        await scheduler.drain()
+        assert fired == ["second"]
+
+    run(scenario())
+
+
+def test_cancel_drops_the_callback():
+    async def scenario():
+        clock = Clock()
+        scheduler = DeadlineScheduler(clock=clock)
+
+        async def callback():
+            raise AssertionError("cancelled callback ran")
+
+        scheduler.schedule("vote", 1010, callback)
+        assert "vote" in scheduler
+        assert scheduler.cancel("vote") is True
+        assert scheduler.cancel("vote") is False
+        clock.now = 2000
+        assert scheduler.dispatch_due() == 0
+        assert scheduler.next_deadline() is None
+
+    run(scenario())
+
+
+def test_failing_callback_does_not_stop_others():
+    async def scenario():
+        clock = Clock()
+        scheduler = DeadlineScheduler(clock=clock)
+        fired = []
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def healthy():
+            fired.append("healthy")
+
+        scheduler.schedule("broken", 1000, broken)
+        scheduler.schedule("healthy", 1000, healthy)
+        assert scheduler.dispatch_due() == 2
+        await scheduler.drain()
+        assert fired == ["healthy"]
+
+    run(scenario())
+
+
+def test_background_task_wakes_up_for_a_new_earlier_deadline():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        done = asyncio.Event()
+
+        async def callback():
+            done.set()
+
+        scheduler.start()
+        try:
+            scheduler.schedule("far", scheduler.now() + 3600, callback)
+            await asyncio.sleep(0)
+            scheduler.schedule("near", scheduler.now() + 0.01, callback)
+            await asyncio.wait_for(done.wait(), timeout=2)
+            assert "far" in scheduler
+        finally:
+            await scheduler.stop()
+
+    run(scenario())
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 11:20
+# @Author  : KimmyXYC
+# @File    : test_write_behind.py
+# @Software: PyCharm
+import asyncio
+
+import pytest
+
+from utils.write_behind import WriteBehindBuffer
+
+
+class Writer:
+    def __init__(self, fail: int = 0):
+        self.batches: list[list] = []
+        self.fail = fail
+
+    async def __call__(self, batch: list):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("database unavailable")
+        self.batches.append(list(batch))
+
+
+def test_flush_writes_in_order_and_in_batches():
+    async def scenario():
+        writer = Writer()
+        buffer = WriteBehindBuffer("test", writer, max_batch=2)
+        for row in range(5):
+            buffer.add(row)
+        assert len(buffer) == 5
+        assert await buffer.flush() == 5
+        assert writer.batches == [[0, 1], [2, 3], [4]]
+        assert len(buffer) == 0
+        assert buffer.stats()["flushed"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_requeued_in_front():
+    async def scenario():
+        writer = Writer(fail=1)
+        buffer = WriteBehindBuffer("test", writer, max_batch=2)
+        for row in range(3):
+            buffer.add(row)
+        with pytest.raises(RuntimeError):
+            await buffer.flush()
+        buffer.add(3)
+        assert buffer.rows() == [0, 1, 2, 3]
+        assert buffer.stats()["failures"] == 1
+
+        await buffer.flush()
+        assert writer.batches == [[0, 1], [2, 3]]
+
+    asyncio.run(scenario())
+
+
+def test_rows_include_the_batch_being_written():
+    async def scenario():
+        gate = asyncio.Event()
+        seen = []
+
+        async def writer(batch):
+            seen.append(buffer.rows())
+            await gate.wait()
+
+        buffer = WriteBehindBuffer("test", writer)
+        buffer.add("a")
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0)
+        buffer.add("b")
+        assert buffer.rows() == ["a", "b"]
+        gate.set()
+        await flush
+        # Rows added during a write go out in the same flush, after it.
+        assert seen == [["a"], ["b"]]
+        assert buffer.rows() == []
+
+    asyncio.run(scenario())
+
+
+def test_background_flush_and_stop():
+    async def scenario():
+        writer = Writer()
+        buffer = WriteBehindBuffer("test", writer, interval=60, max_batch=2)
+        buffer.start()
+        buffer.add(0)
+        buffer.add(1)
+        # A full batch wakes the flusher before the interval elapses.
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert writer.batches == [[0, 1]]
+
+        buffer.add(2)
+        await buffer.stop()
+        assert writer.batches == [[0, 1], [2]]
+
+    asyncio.run(scenario())
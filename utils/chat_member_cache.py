@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 13:10
+# @Author  : KimmyXYC
+# @File    : chat_member_cache.py
+# @Software: PyCharm
+import asyncio
+import time
+from collections import OrderedDict
+
+from app_conf import settings
+
+
+class ChatMemberCache:
+    """
+    Short-lived cache of getChatMember results keyed by (chat_id, user_id).
+    Entries are filled on demand and replaced or dropped by chat_member /
+    my_chat_member updates. Concurrent lookups of the same member share one
+    API call.
+    """
+
+    def __init__(self, ttl: float = 60, max_size: int = 50000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[int, int], tuple[float, object]] = (
+            OrderedDict()
+        )
+        self._inflight: dict[tuple[int, int], asyncio.Future] = {}
+
+    def _get_cached(self, key: tuple[int, int]):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, member = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return member
+
+    def _store(self, key: tuple[int, int], member):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, bot, chat_id: int, user_id: int):
+        key = (chat_id, user_id)
+        member = self._get_cached(key)
+        if member is not None:
+            self.hits += 1
+            return member
+
+        self.misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting.
+            future.exception()
+            raise
+        else:
+            # A chat_member update may have invalidated the key meanwhile.
+            if self._inflight.get(key) is future:
+                self._store(key, member)
+            future.set_result(member)
+            return member
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def update(self, chat_id: int, user_id: int, member):
+        """
+        Replace an entry with the ChatMember carried by an update.
+        """
+        self._inflight.pop((chat_id, user_id), None)
+        self._store((chat_id, user_id), member)
+
+    def invalidate(self, chat_id: int, user_id: int | None = None):
+        if user_id is not None:
+            self._entries.pop((chat_id, user_id), None)
+            self._inflight.pop((chat_id, user_id), None)
+            return
+        for key in [key for key in self._entries if key[0] == chat_id]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class BotRightsSnapshot:
+    """
+    The bot's own ChatMember per chat, fetched once and then kept current from
+    my_chat_member updates instead of expiring. With several instances the
+    instance receiving the update announces it and the others invalidate.
+    """
+
+    def __init__(self):
+        self.bot_id: int | None = None
+        self._members: dict[int, object] = {}
+
+    async def get(self, bot, chat_id: int):
+        member = self._members.get(chat_id)
+        if member is None:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=self.bot_id)
+            self._members[chat_id] = member
+        return member
+
+    def update(self, chat_id: int, member):
+        self._members[chat_id] = member
+
+    def invalidate(self, chat_id: int | None = None):
+        if chat_id is None:
+            self._members.clear()
+            return
+        self._members.pop(chat_id, None)
+
+    async def can(self, bot, chat_id: int, right: str) -> bool:
+        try:
+            member = await self.get(bot, chat_id)
+        except Exception:
+            return False
+        if member.status == "creator":
+            return True
+        if member.status != "administrator":
+            return False
+        return bool(getattr(member, right, False))
+
+
+MemberCache = ChatMemberCache(
+    ttl=float(settings.get("cache.member_ttl", 60)),
+    max_size=int(settings.get("cache.member_max_size", 50000)),
+)
+BotRights = BotRightsSnapshot()
@@ -2,6 +2,7 @@ MESSAGES = {
     "help_title": "Help",
     "help_github": "GitHub",
     "jr_requesting": "{user} (ID: {user_id}) is requesting to join this group.",
+    "jr_batch_requesting": "{count} users are requesting to join this group. Vote for each applicant below:",
     "jr_poll_question": "Approve this user?",
     "jr_poll_yes": "Yes",
     "jr_poll_no": "No",
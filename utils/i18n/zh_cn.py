@@ -2,6 +2,7 @@ MESSAGES = {
     "help_title": "帮助",
     "help_github": "GitHub",
     "jr_requesting": "{user} (ID: {user_id}) 正在申请加入本群。",
+    "jr_batch_requesting": "{count} 位用户正在申请加入本群，请分别为每位申请人投票：",
     "jr_poll_question": "是否同意该用户入群？",
     "jr_poll_yes": "同意",
     "jr_poll_no": "拒绝",
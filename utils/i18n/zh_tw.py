@@ -2,6 +2,7 @@ MESSAGES = {
     "help_title": "幫助",
     "help_github": "GitHub",
     "jr_requesting": "{user} (ID: {user_id}) 正在申請加入本群。",
+    "jr_batch_requesting": "{count} 位用戶正在申請加入本群，請分別為每位申請人投票：",
     "jr_poll_question": "是否同意該用戶入群？",
     "jr_poll_yes": "同意",
     "jr_poll_no": "拒絕",
@@ -1,22 +1,69 @@
-import asyncio
+import time
+
+
+def _discard(index: dict[int, set[str]], key: int, uuid: str):
+    uuids = index.get(key)
+    if uuids is None:
+        return
+    uuids.discard(uuid)
+    if not uuids:
+        del index[key]
 
 
 class JoinRequestSessionStore:
+    """
+    Live JoinRequestVote instances keyed by uuid, with secondary indexes by
+    chat id and by applicant user id.
+    Every method is synchronous: all access happens on the event loop thread
+    and no operation awaits, so no lock is needed for reads or writes.
+    """
+
     def __init__(self):
         self._instances = {}
-        self._tasks = {}
-        self._lock = asyncio.Lock()
-
-    async def set(self, uuid: str, instance, task: asyncio.Task):
-        async with self._lock:
-            self._instances[uuid] = instance
-            self._tasks[uuid] = task
-
-    async def get(self, uuid: str):
-        async with self._lock:
-            return self._instances.get(uuid)
-
-    async def remove(self, uuid: str):
-        async with self._lock:
-            self._instances.pop(uuid, None)
-            self._tasks.pop(uuid, None)
+        self._created_at: dict[str, float] = {}
+        self._by_chat: dict[int, set[str]] = {}
+        self._by_user: dict[int, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._instances)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._instances
+
+    def set(self, uuid: str, instance):
+        self.remove(uuid)
+        self._instances[uuid] = instance
+        self._created_at[uuid] = time.monotonic()
+        self._by_chat.setdefault(instance.chat_id, set()).add(uuid)
+        self._by_user.setdefault(instance.user_id, set()).add(uuid)
+
+    def uuids(self) -> list[str]:
+        return list(self._instances)
+
+    def get(self, uuid: str):
+        return self._instances.get(uuid)
+
+    def remove(self, uuid: str):
+        instance = self._instances.pop(uuid, None)
+        if instance is None:
+            return None
+        self._created_at.pop(uuid, None)
+        _discard(self._by_chat, instance.chat_id, uuid)
+        _discard(self._by_user, instance.user_id, uuid)
+        return instance
+
+    def by_chat(self, chat_id: int) -> list:
+        return [self._instances[uuid] for uuid in self._by_chat.get(chat_id, ())]
+
+    def by_user(self, user_id: int) -> list:
+        return [self._instances[uuid] for uuid in self._by_user.get(user_id, ())]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        oldest = min(self._created_at.values(), default=None)
+        return {
+            "size": len(self._instances),
+            "chats": len(self._by_chat),
+            "applicants": len(self._by_user),
+            "oldest_age": 0.0 if oldest is None else now - oldest,
+        }
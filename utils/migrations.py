@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 10:20
+# @Author  : KimmyXYC
+# @File    : migrations.py
+# @Software: PyCharm
+from loguru import logger
+
+# Arbitrary key for pg_advisory_lock so that only one process migrates at a time.
+MIGRATION_LOCK_ID = 0x41425050
+
+# Ordered list of (version, name, statements).
+# Applied migrations are recorded in schema_migrations and never run again,
+# so existing entries must not be edited; append a new version instead.
+MIGRATIONS = [
+    (
+        1,
+        "create_base_tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS setting (
+                group_id BIGINT PRIMARY KEY,
+                vote_to_join BOOLEAN NOT NULL DEFAULT TRUE,
+                vote_time INTEGER NOT NULL DEFAULT 600 CHECK (vote_time BETWEEN 30 AND 3600),
+                pin_msg BOOLEAN NOT NULL DEFAULT FALSE,
+                clean_pinned_message BOOLEAN NOT NULL DEFAULT FALSE,
+                anonymous_vote BOOLEAN NOT NULL DEFAULT TRUE,
+                advanced_vote BOOLEAN NOT NULL DEFAULT FALSE,
+                language VARCHAR(16) NOT NULL DEFAULT 'en_US',
+                mini_voters INTEGER NOT NULL DEFAULT 3 CHECK (mini_voters BETWEEN 1 AND 500)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS join_request (
+                uuid UUID PRIMARY KEY,
+                group_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                request_time TIMESTAMPTZ(0) NOT NULL,
+                waiting BOOLEAN NOT NULL,
+                result BOOLEAN NULL,
+                admin BIGINT NULL,
+                yes_votes INTEGER NULL,
+                no_votes INTEGER NULL
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "join_request_indexes",
+        [
+            # Close duplicate waiting rows left by the old check-then-insert race,
+            # keeping the newest one, so the unique index below can be built.
+            """
+            UPDATE join_request
+            SET waiting = FALSE, result = FALSE
+            WHERE uuid IN (
+                SELECT uuid
+                FROM (
+                    SELECT uuid,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY group_id, user_id
+                               ORDER BY request_time DESC
+                           ) AS position
+                    FROM join_request
+                    WHERE waiting = TRUE
+                ) AS waiting_rows
+                WHERE position > 1
+            )
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS join_request_waiting_key
+            ON join_request (group_id, user_id)
+            WHERE waiting
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS join_request_request_time_idx
+            ON join_request (request_time)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS join_request_group_id_request_time_idx
+            ON join_request (group_id, request_time)
+            """,
+        ],
+    ),
+    (
+        3,
+        "join_request_session",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS join_request_session (
+                uuid UUID PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                request JSONB NOT NULL,
+                group_settings JSONB NOT NULL,
+                advanced_vote BOOLEAN NOT NULL,
+                message1_id BIGINT NULL,
+                message2_id BIGINT NULL,
+                message3_id BIGINT NULL,
+                message4_id BIGINT NULL,
+                log_message_id BIGINT NULL,
+                yes_voters JSONB NOT NULL DEFAULT '{}',
+                no_voters JSONB NOT NULL DEFAULT '{}',
+                deadline TIMESTAMPTZ NOT NULL,
+                cleanup_at TIMESTAMPTZ NULL
+            )
+            """,
+        ],
+    ),
+    (
+        4,
+        "join_request_vote",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS join_request_vote (
+                uuid UUID NOT NULL,
+                voter_id BIGINT NOT NULL,
+                full_name TEXT NOT NULL,
+                approve BOOLEAN NOT NULL,
+                voted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (uuid, voter_id)
+            )
+            """,
+            """
+            INSERT INTO join_request_vote (uuid, voter_id, full_name, approve)
+            SELECT uuid, voter.key::BIGINT, voter.value, TRUE
+            FROM join_request_session, jsonb_each_text(yes_voters) AS voter
+            UNION ALL
+            SELECT uuid, voter.key::BIGINT, voter.value, FALSE
+            FROM join_request_session, jsonb_each_text(no_voters) AS voter
+            ON CONFLICT (uuid, voter_id) DO NOTHING
+            """,
+            """
+            ALTER TABLE join_request_session
+            DROP COLUMN IF EXISTS yes_voters,
+            DROP COLUMN IF EXISTS no_voters
+            """,
+        ],
+    ),
+    (
+        5,
+        "instance_coordination",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS bot_instance (
+                instance_id TEXT PRIMARY KEY,
+                started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """,
+            """
+            ALTER TABLE join_request_session
+            ADD COLUMN IF NOT EXISTS owner TEXT NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS join_request_session_owner_idx
+            ON join_request_session (owner)
+            """,
+        ],
+    ),
+    (
+        6,
+        "join_request_session_batch",
+        [
+            """
+            ALTER TABLE join_request_session
+            ADD COLUMN IF NOT EXISTS batch_id UUID NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS join_request_session_batch_id_idx
+            ON join_request_session (batch_id)
+            WHERE batch_id IS NOT NULL
+            """,
+        ],
+    ),
+    (
+        7,
+        "partition_join_request",
+        [
+            # join_request becomes range partitioned by month on request_time.
+            # A unique index on a partitioned table has to contain request_time,
+            # so "one waiting request per user and group" moves to the small
+            # join_request_waiting table, which holds exactly the waiting rows.
+            """
+            ALTER TABLE join_request RENAME TO join_request_unpartitioned
+            """,
+            """
+            ALTER TABLE join_request_unpartitioned
+            RENAME CONSTRAINT join_request_pkey TO join_request_unpartitioned_pkey
+            """,
+            """
+            DROP INDEX IF EXISTS join_request_waiting_key,
+                join_request_request_time_idx,
+                join_request_group_id_request_time_idx
+            """,
+            # Bounds of request_time for a uuid from generate_uuid() (version 7,
+            # millisecond timestamp in the first 48 bits) with a day of slack for
+            # clock skew between bot and database; unbounded for other uuids.
+            """
+            CREATE OR REPLACE FUNCTION join_request_time_lower(request_uuid UUID)
+            RETURNS TIMESTAMPTZ
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                SELECT CASE WHEN substr(request_uuid::text, 15, 1) = '7' THEN
+                    to_timestamp((
+                        'x' || substr(request_uuid::text, 1, 8)
+                        || substr(request_uuid::text, 10, 4)
+                    )::bit(48)::bigint / 1000.0 - 86400)
+                ELSE '-infinity'::timestamptz END
+            $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION join_request_time_upper(request_uuid UUID)
+            RETURNS TIMESTAMPTZ
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                SELECT CASE WHEN substr(request_uuid::text, 15, 1) = '7' THEN
+                    to_timestamp((
+                        'x' || substr(request_uuid::text, 1, 8)
+                        || substr(request_uuid::text, 10, 4)
+                    )::bit(48)::bigint / 1000.0 + 86400)
+                ELSE 'infinity'::timestamptz END
+            $$
+            """,
+            """
+            CREATE TABLE join_request (
+                uuid UUID NOT NULL,
+                group_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                request_time TIMESTAMPTZ(0) NOT NULL,
+                waiting BOOLEAN NOT NULL,
+                result BOOLEAN NULL,
+                admin BIGINT NULL,
+                yes_votes INTEGER NULL,
+                no_votes INTEGER NULL,
+                PRIMARY KEY (uuid, request_time)
+            ) PARTITION BY RANGE (request_time)
+            """,
+            """
+            CREATE INDEX join_request_group_id_request_time_idx
+            ON join_request (group_id, request_time)
+            """,
+            """
+            CREATE INDEX join_request_waiting_idx
+            ON join_request (uuid)
+            WHERE waiting
+            """,
+            # Monthly partitions (UTC) from the oldest row to two months ahead;
+            # utils/retention.py keeps creating them from then on.
+            """
+            DO $$
+            DECLARE
+                month DATE := date_trunc('month', COALESCE(
+                    (SELECT MIN(request_time) FROM join_request_unpartitioned),
+                    NOW()
+                ) AT TIME ZONE 'UTC')::date;
+            BEGIN
+                WHILE month <= (date_trunc('month', NOW() AT TIME ZONE 'UTC')
+                                + INTERVAL '2 months')::date LOOP
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF join_request '
+                        'FOR VALUES FROM (%L) TO (%L)',
+                        'join_request_p' || to_char(month, 'YYYYMM'),
+                        month::timestamp AT TIME ZONE 'UTC',
+                        (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+                    );
+                    month := (month + INTERVAL '1 month')::date;
+                END LOOP;
+            END
+            $$
+            """,
+            """
+            CREATE TABLE join_request_default PARTITION OF join_request DEFAULT
+            """,
+            """
+            INSERT INTO join_request (
+                uuid, group_id, user_id, request_time, waiting, result, admin,
+                yes_votes, no_votes
+            )
+            SELECT uuid, group_id, user_id, request_time, waiting, result, admin,
+                   yes_votes, no_votes
+            FROM join_request_unpartitioned
+            """,
+            """
+            DROP TABLE join_request_unpartitioned
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS join_request_waiting (
+                group_id BIGINT NOT NULL,
+                user_id BIGINT NOT NULL,
+                uuid UUID NOT NULL UNIQUE,
+                request_time TIMESTAMPTZ(0) NOT NULL,
+                PRIMARY KEY (group_id, user_id)
+            )
+            """,
+            """
+            INSERT INTO join_request_waiting (group_id, user_id, uuid, request_time)
+            SELECT group_id, user_id, uuid, request_time
+            FROM join_request
+            WHERE waiting
+            ON CONFLICT DO NOTHING
+            """,
+        ],
+    ),
+    (
+        8,
+        "join_request_session_lease_epoch",
+        [
+            # Raised on every takeover, so a decision can be fenced against an
+            # instance that lost the session while it was stalled.
+            """
+            ALTER TABLE join_request_session
+            ADD COLUMN IF NOT EXISTS lease_epoch BIGINT NOT NULL DEFAULT 0
+            """,
+        ],
+    ),
+]
+
+
+async def run_migrations(connection) -> list[int]:
+    """
+    Apply all pending migrations in version order.
+    Each migration runs in its own transaction and is recorded in schema_migrations.
+    A session-level advisory lock serializes concurrent starts of several processes.
+    Returns the list of newly applied versions.
+    """
+    applied_now = []
+    # Lock before creating schema_migrations: two concurrent CREATE TABLE IF
+    # NOT EXISTS can both pass the check and collide in the catalog.
+    await connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await connection.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        rows = await connection.fetch("SELECT version FROM schema_migrations")
+        applied = {row["version"] for row in rows}
+
+        for version, name, statements in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in applied:
+                continue
+            async with connection.transaction():
+                for statement in statements:
+                    await connection.execute(statement)
+                await connection.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                    version,
+                    name,
+                )
+            applied_now.append(version)
+            logger.info(f"Applied database migration {version}: {name}")
+    finally:
+        await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+    return applied_now
@@ -3,9 +3,192 @@
 # @Author  : KimmyXYC
 # @File    : postgres.py
 # @Software: PyCharm
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
 import asyncpg
 from loguru import logger
 from app_conf import settings
+from utils.metrics import Metrics
+from utils.migrations import run_migrations
+from utils.queries import QUERIES, SETTING_FIELDS
+from utils.tracing import span
+from utils.write_behind import WriteBehindBuffer
+
+
+class GroupSettingsCache:
+    """
+    Bounded LRU cache with TTL for rows of the setting table.
+    Entries are stored as copies so callers can never mutate cached rows.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+
+    def get(self, group_id: int) -> dict | None:
+        entry = self._entries.get(group_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, row = entry
+        if expires_at <= time.monotonic():
+            del self._entries[group_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(group_id)
+        self.hits += 1
+        return dict(row)
+
+    def set(self, group_id: int, row: dict) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[group_id] = (time.monotonic() + self.ttl, dict(row))
+        self._entries.move_to_end(group_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, group_id: int | None = None) -> None:
+        if group_id is None:
+            self._entries.clear()
+            return
+        self._entries.pop(group_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+DB_QUERY_DURATION = Metrics.histogram(
+    "approvebypoll_db_query_duration_seconds",
+    "Latency of BotDatabase queries.",
+    ["query"],
+)
+DB_QUERY_ERRORS = Metrics.counter(
+    "approvebypoll_db_query_errors_total",
+    "BotDatabase queries that raised.",
+    ["query"],
+)
+DB_ACQUIRE_WAIT = Metrics.histogram(
+    "approvebypoll_db_pool_acquire_wait_seconds",
+    "Time spent waiting for a pooled connection.",
+)
+DB_ACQUIRE_TIMEOUTS = Metrics.counter(
+    "approvebypoll_db_pool_acquire_timeouts_total",
+    "Pool acquires that hit database.acquire_timeout.",
+)
+DB_POOL_CONNECTIONS = Metrics.gauge(
+    "approvebypoll_db_pool_connections",
+    "Pool connections by state (size, idle, in_use, waiting for one).",
+    ["state"],
+)
+
+
+class PoolStats:
+    """
+    Counters for connection acquires and per-query latency, in seconds.
+    Acquire wait is the time spent waiting for a free pooled connection, so a
+    growing wait with fast queries points at pool starvation, not at Postgres.
+    """
+
+    def __init__(self):
+        self.acquires = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.waiting = 0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.queries: dict[str, dict] = {}
+
+    def acquired(self, wait: float) -> None:
+        DB_ACQUIRE_WAIT.observe(wait)
+        self.acquires += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+        self.in_use += 1
+        self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def released(self) -> None:
+        self.in_use -= 1
+
+    def acquire_timed_out(self) -> None:
+        DB_ACQUIRE_TIMEOUTS.inc()
+        self.acquire_timeouts += 1
+
+    def observe_query(self, name: str, elapsed: float, failed: bool) -> None:
+        DB_QUERY_DURATION.labels(name).observe(elapsed)
+        if failed:
+            DB_QUERY_ERRORS.labels(name).inc()
+        query = self.queries.get(name)
+        if query is None:
+            query = self.queries[name] = {
+                "calls": 0,
+                "errors": 0,
+                "total": 0.0,
+                "max": 0.0,
+            }
+        query["calls"] += 1
+        query["errors"] += int(failed)
+        query["total"] += elapsed
+        query["max"] = max(query["max"], elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "acquires": self.acquires,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_total": self.acquire_wait_total,
+            "acquire_wait_avg": self.acquire_wait_total / self.acquires
+            if self.acquires
+            else 0.0,
+            "acquire_wait_max": self.acquire_wait_max,
+            "waiting": self.waiting,
+            "in_use": self.in_use,
+            "in_use_peak": self.in_use_peak,
+            "queries": {
+                name: dict(query, avg=query["total"] / query["calls"])
+                for name, query in self.queries.items()
+            },
+        }
+
+
+class PreparedConnection(asyncpg.Connection):
+    """
+    Pooled connection that can fill its statement cache up front.
+    asyncpg invalidates PreparedStatement objects whenever a connection goes
+    back to the pool, but statements in the connection's own cache live as
+    long as the connection and are reused by execute()/fetch*() on the same
+    query text.
+    """
+
+    async def prepare_cached(self, queries) -> None:
+        # asyncpg has no public API to fill the statement cache: prepare()
+        # bypasses it. _get_statement() is the method execute()/fetch*() go
+        # through (asyncpg 0.21 up to at least 0.32); if a release drops it,
+        # statements are prepared on first use instead.
+        get_statement = getattr(self, "_get_statement", None)
+        if get_statement is None:
+            logger.warning(
+                "asyncpg.Connection._get_statement is missing, "
+                "statements are prepared on first use"
+            )
+            return
+        for query in queries:
+            await get_statement(query, None)
 
 
 class AsyncPostgresDB:
@@ -20,37 +203,167 @@ class AsyncPostgresDB:
         "mini_voters": 3,
     }
 
+    # open_join_request retries while a concurrently inserted setting row is
+    # not yet visible to its snapshot.
+    OPEN_JOIN_REQUEST_ATTEMPTS = 3
+
+    # Statements of the lifecycle write queue, executed in this order per batch.
+    LIFECYCLE_STATEMENTS = ("close_join_request", "delete_join_request_session")
+
     def __init__(self):
         self.host = settings.database.host
         self.port = settings.database.port
         self.dbname = settings.database.dbname
         self.user = settings.database.user
         self.password = settings.database.password
+        self.pool_min_size = int(settings.get("database.pool_min_size", 1))
+        self.pool_max_size = int(settings.get("database.pool_max_size", 5))
+        self.acquire_timeout = float(settings.get("database.acquire_timeout", 10))
+        self.statement_timeout = float(settings.get("database.statement_timeout", 30))
+        self.statement_cache_size = int(
+            settings.get("database.statement_cache_size", 100)
+        )
         self.conn = None
+        self.stats = PoolStats()
+        DB_POOL_CONNECTIONS.labels("in_use").set_function(lambda: self.stats.in_use)
+        DB_POOL_CONNECTIONS.labels("waiting").set_function(lambda: self.stats.waiting)
+        # The pool only exists after connect(); report 0 until then.
+        DB_POOL_CONNECTIONS.labels("size").set_function(
+            lambda: self.conn.get_size() if self.conn is not None else 0
+        )
+        DB_POOL_CONNECTIONS.labels("idle").set_function(
+            lambda: self.conn.get_idle_size() if self.conn is not None else 0
+        )
+        self._schema_ready = False
+        self.settings_cache = GroupSettingsCache(
+            max_size=int(settings.get("database.settings_cache_size", 10000)),
+            ttl=float(settings.get("database.settings_cache_ttl", 300)),
+        )
+        # Called with the group id after a setting changed, so that other
+        # instances can drop their cached copy (see app/coordination.py).
+        self.on_settings_changed: Callable[[int], Awaitable] | None = None
+        self.vote_buffer = WriteBehindBuffer(
+            name="join_request_vote",
+            writer=self._write_join_request_votes,
+            interval=float(settings.get("database.vote_flush_interval", 1.0)),
+            max_batch=int(settings.get("database.vote_flush_batch", 500)),
+        )
+        self.lifecycle_buffer = WriteBehindBuffer(
+            name="join_request_lifecycle",
+            writer=self._write_lifecycle,
+            interval=float(settings.get("database.lifecycle_flush_interval", 0.5)),
+            max_batch=int(settings.get("database.lifecycle_flush_batch", 200)),
+        )
+
+    def _connect_kwargs(self) -> dict:
+        server_settings = {}
+        if self.statement_timeout > 0:
+            server_settings["statement_timeout"] = str(
+                int(self.statement_timeout * 1000)
+            )
+        return {
+            "host": self.host,
+            "port": self.port,
+            "user": self.user,
+            "password": self.password,
+            "database": self.dbname,
+            "statement_cache_size": self.statement_cache_size,
+            "server_settings": server_settings,
+        }
 
     async def connect(self):
         """
         Connect to the PostgreSQL database using asyncpg.
         This method creates a connection pool for efficient database access.
         """
+        if 0 < self.statement_cache_size < len(QUERIES):
+            logger.warning(
+                f"database.statement_cache_size={self.statement_cache_size} is smaller "
+                f"than the {len(QUERIES)} prepared statements; some will be re-prepared"
+            )
         try:
             self.conn = await asyncpg.create_pool(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.dbname,
-                min_size=1,
-                max_size=5,
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                init=self._init_connection,
+                connection_class=PreparedConnection,
+                **self._connect_kwargs(),
             )
             logger.success(
                 f"Successfully connected to PostgreSQL database at {self.host}:{self.port}/{self.dbname}"
             )
             await self.ensure_tables_exist()
+            self._schema_ready = True
+            # Connections opened before the migrations ran have nothing prepared.
+            await self.conn.expire_connections()
+            self.vote_buffer.start()
+            self.lifecycle_buffer.start()
         except Exception as e:
             logger.error(f"Failed to connect to PostgreSQL database: {str(e)}")
             raise
 
+    @staticmethod
+    async def _register_codecs(connection):
+        """
+        Decode/encode JSONB columns as Python objects.
+        """
+        await connection.set_type_codec(
+            "jsonb",
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog",
+        )
+
+    async def _init_connection(self, connection):
+        """
+        Per-connection setup: register codecs and, once the schema is up to
+        date, prepare every statement in QUERIES.
+        Preparing is skipped with statement_cache_size = 0, which is meant for
+        poolers that do not support prepared statements (e.g. PgBouncer in
+        transaction mode).
+        """
+        await self._register_codecs(connection)
+        if not self._schema_ready or self.statement_cache_size <= 0:
+            return
+        await connection.prepare_cached(QUERIES.values())
+
+    @asynccontextmanager
+    async def _acquire(self):
+        """
+        Acquire a pooled connection, recording the wait and the in-use count.
+        """
+        started = time.perf_counter()
+        self.stats.waiting += 1
+        try:
+            with span("db.acquire"):
+                connection = await self.conn.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats.acquire_timed_out()
+            raise
+        finally:
+            self.stats.waiting -= 1
+        self.stats.acquired(time.perf_counter() - started)
+        try:
+            yield connection
+        finally:
+            self.stats.released()
+            await self.conn.release(connection)
+
+    async def _query(self, connection, method: str, name: str, *args):
+        """
+        Run the statement QUERIES[name] with execute, executemany, fetch,
+        fetchrow or fetchval and record its latency.
+        """
+        started = time.perf_counter()
+        failed = True
+        try:
+            with span(f"db:{name}"):
+                result = await getattr(connection, method)(QUERIES[name], *args)
+            failed = False
+            return result
+        finally:
+            self.stats.observe_query(name, time.perf_counter() - started, failed)
+
     async def close(self):
         """
         Close the connection pool to the PostgreSQL database.
@@ -59,6 +372,8 @@ class AsyncPostgresDB:
         :return: None
         """
         try:
+            await self.vote_buffer.stop()
+            await self.lifecycle_buffer.stop()
             await self.conn.close()
             logger.info("PostgreSQL database connection closed successfully")
         except Exception as e:
@@ -67,42 +382,19 @@ class AsyncPostgresDB:
 
     async def ensure_tables_exist(self):
         """
-        Check if required tables exist and create them if they don't.
+        Bring the schema up to date by applying pending migrations.
         This method is called after the database connection is established.
         """
         try:
-            async with self.conn.acquire() as connection:
-                # Create setting table if it doesn't exist
-                await connection.execute("""
-                    CREATE TABLE IF NOT EXISTS setting (
-                        group_id BIGINT PRIMARY KEY,
-                        vote_to_join BOOLEAN NOT NULL DEFAULT TRUE,
-                        vote_time INTEGER NOT NULL DEFAULT 600 CHECK (vote_time BETWEEN 30 AND 3600),
-                        pin_msg BOOLEAN NOT NULL DEFAULT FALSE,
-                        clean_pinned_message BOOLEAN NOT NULL DEFAULT FALSE,
-                        anonymous_vote BOOLEAN NOT NULL DEFAULT TRUE,
-                        advanced_vote BOOLEAN NOT NULL DEFAULT FALSE,
-                        language VARCHAR(16) NOT NULL DEFAULT 'en_US',
-                        mini_voters INTEGER NOT NULL DEFAULT 3 CHECK (mini_voters BETWEEN 1 AND 500)
-                    )
-                """)
-
-                # Create join_request table if it doesn't exist
-                await connection.execute("""
-                    CREATE TABLE IF NOT EXISTS join_request (
-                        uuid UUID PRIMARY KEY,
-                        group_id BIGINT NOT NULL,
-                        user_id BIGINT NOT NULL,
-                        request_time TIMESTAMPTZ(0) NOT NULL,
-                        waiting BOOLEAN NOT NULL,
-                        result BOOLEAN NULL,
-                        admin BIGINT NULL,
-                        yes_votes INTEGER NULL,
-                        no_votes INTEGER NULL
-                    )
-                """)
+            async with self._acquire() as connection:
+                # Migrations may rewrite large tables; reset on release.
+                await connection.execute("SET statement_timeout = 0")
+                applied = await run_migrations(connection)
 
-            logger.success("Database tables checked and created if needed")
+            if applied:
+                logger.success(f"Database migrations applied: {applied}")
+            else:
+                logger.success("Database schema is up to date")
         except Exception as e:
             logger.error(f"Error ensuring tables exist: {str(e)}")
             raise
@@ -111,31 +403,27 @@ class AsyncPostgresDB:
         """
         Get settings for a group as a dictionary.
         If the group does not exist, create it with default settings and return defaults.
+        Rows are served from the in-process settings cache when possible.
         """
+        cached = self.settings_cache.get(group_id)
+        if cached is not None:
+            return cached
+
         try:
-            async with self.conn.acquire() as connection:
-                row = await connection.fetchrow(
-                    """
-                    SELECT group_id, vote_to_join, vote_time,
-                           pin_msg, clean_pinned_message, anonymous_vote, advanced_vote, language, mini_voters
-                    FROM setting
-                    WHERE group_id = $1
-                    """,
-                    group_id,
+            async with self._acquire() as connection:
+                row = await self._query(
+                    connection, "fetchrow", "select_group_settings", group_id
                 )
 
                 if row:
+                    self.settings_cache.set(group_id, dict(row))
                     return dict(row)
 
                 defaults = self.DEFAULT_GROUP_SETTINGS
-                await connection.execute(
-                    """
-                    INSERT INTO setting (
-                        group_id, vote_to_join, vote_time, pin_msg,
-                        clean_pinned_message, anonymous_vote, advanced_vote, language, mini_voters
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                    ON CONFLICT (group_id) DO NOTHING
-                    """,
+                await self._query(
+                    connection,
+                    "execute",
+                    "insert_group_settings",
                     group_id,
                     defaults["vote_to_join"],
                     defaults["vote_time"],
@@ -147,15 +435,10 @@ class AsyncPostgresDB:
                     defaults["mini_voters"],
                 )
 
-                inserted_or_existing = await connection.fetchrow(
-                    """
-                    SELECT group_id, vote_to_join, vote_time,
-                           pin_msg, clean_pinned_message, anonymous_vote, advanced_vote, language, mini_voters
-                    FROM setting
-                    WHERE group_id = $1
-                    """,
-                    group_id,
+                inserted_or_existing = await self._query(
+                    connection, "fetchrow", "select_group_settings", group_id
                 )
+                self.settings_cache.set(group_id, dict(inserted_or_existing))
                 return dict(inserted_or_existing)
         except Exception as e:
             logger.error(
@@ -163,135 +446,200 @@ class AsyncPostgresDB:
             )
             raise
 
-    async def create_join_request(self, uuid: str, group_id: int, user_id: int) -> None:
+    async def open_join_request(
+        self, uuid: str, group_id: int, user_id: int
+    ) -> tuple[dict, bool]:
         """
-        Create a new join_request row.
-        request_time uses DB current time and waiting is True.
+        Load (or create) group settings, check for an existing waiting join_request
+        and insert a new waiting row, all in a single statement.
+        The row is only inserted when vote_to_join is enabled and the user has no
+        waiting request in the group; the join_request_waiting primary key
+        turns a concurrent duplicate insert into already_waiting=True.
+        Requests of the user whose close is still queued do not count as waiting.
+        Returns (group_settings, already_waiting).
         """
-        try:
-            async with self.conn.acquire() as connection:
-                await connection.execute(
-                    """
-                    INSERT INTO join_request (
-                        uuid, group_id, user_id, request_time, waiting, result, admin
-                    ) VALUES ($1, $2, $3, NOW(), TRUE, NULL, NULL)
-                    """,
-                    uuid,
-                    group_id,
-                    user_id,
+        cached = self.settings_cache.get(group_id)
+        if cached is not None and not cached.get("vote_to_join", True):
+            return cached, False
+
+        closing = self._queued_closes(group_id, user_id)
+        defaults = self.DEFAULT_GROUP_SETTINGS
+        for _ in range(self.OPEN_JOIN_REQUEST_ATTEMPTS):
+            try:
+                async with self._acquire() as connection:
+                    row = await self._query(
+                        connection,
+                        "fetchrow",
+                        "open_join_request",
+                        uuid,
+                        group_id,
+                        user_id,
+                        defaults["vote_to_join"],
+                        defaults["vote_time"],
+                        defaults["pin_msg"],
+                        defaults["clean_pinned_message"],
+                        defaults["anonymous_vote"],
+                        defaults["advanced_vote"],
+                        defaults["language"],
+                        defaults["mini_voters"],
+                        closing,
+                    )
+            except Exception as e:
+                logger.error(
+                    f"Error opening join_request for group_id={group_id}, user_id={user_id}: {str(e)}"
                 )
-        except Exception as e:
-            logger.error(f"Error creating join_request for uuid={uuid}: {str(e)}")
-            raise
+                raise
+            if row is not None:
+                break
+            # The setting row was created by a concurrent transaction that is
+            # not visible to this statement's snapshot; the retry will see it.
+        else:
+            logger.error(
+                f"Error opening join_request for group_id={group_id}, user_id={user_id}: "
+                f"setting row not visible after {self.OPEN_JOIN_REQUEST_ATTEMPTS} attempts"
+            )
+            raise RuntimeError(f"could not load group settings for {group_id}")
 
-    async def update_join_request(
+        group_settings = dict(row)
+        already_waiting = bool(group_settings.pop("already_waiting"))
+        self.settings_cache.set(group_id, group_settings)
+        return dict(group_settings), already_waiting
+
+    def queue_join_request_result(
         self,
         uuid: str,
+        group_id: int,
+        user_id: int,
         result: bool,
         admin: int | None = None,
         yes_votes: int | None = None,
         no_votes: int | None = None,
-    ) -> bool:
+    ) -> None:
         """
-        Update join_request by uuid and set waiting to False.
-        yes_votes/no_votes are optional and only updated when provided.
-        Returns True if at least one row is updated.
+        Queue the close of a join_request row (like close_join_requests)
+        for the lifecycle write queue. group_id/user_id let the waiting checks
+        see the close before it is written.
         """
-        try:
-            async with self.conn.acquire() as connection:
-                if yes_votes is None and no_votes is None:
-                    execute_result = await connection.execute(
-                        """
-                        UPDATE join_request
-                        SET result = $2, admin = $3, waiting = FALSE
-                        WHERE uuid = $1
-                        """,
-                        uuid,
-                        result,
-                        admin,
-                    )
-                else:
-                    execute_result = await connection.execute(
-                        """
-                        UPDATE join_request
-                        SET result = $2, admin = $3, waiting = FALSE,
-                            yes_votes = COALESCE($4, yes_votes),
-                            no_votes = COALESCE($5, no_votes)
-                        WHERE uuid = $1
-                        """,
-                        uuid,
-                        result,
-                        admin,
-                        yes_votes,
-                        no_votes,
-                    )
-                return execute_result.endswith("1")
-        except Exception as e:
-            logger.error(f"Error updating join_request for uuid={uuid}: {str(e)}")
-            raise
+        self.lifecycle_buffer.add(
+            (
+                "close_join_request",
+                (uuid, result, admin, yes_votes, no_votes),
+                (group_id, user_id),
+            )
+        )
 
-    async def has_waiting_join_request(self, group_id: int, user_id: int) -> bool:
+    async def close_join_requests(self, closes: list[dict]) -> None:
         """
-        Return True only if there is a row matching group_id/user_id with waiting=True.
+        Close join_request rows right away; every dict holds the keyword
+        arguments of queue_join_request_result. Decisions are written before
+        they are published, so a crash in between cannot leave a decided
+        request waiting to be resumed and voted on again. Closes that cannot
+        be written now go through the lifecycle write queue instead.
         """
+        if not closes:
+            return
         try:
-            async with self.conn.acquire() as connection:
-                exists = await connection.fetchval(
-                    """
-                    SELECT EXISTS (
-                        SELECT 1
-                        FROM join_request
-                        WHERE group_id = $1 AND user_id = $2 AND waiting = TRUE
-                    )
-                    """,
-                    group_id,
-                    user_id,
+            async with self._acquire() as connection:
+                await self._query(
+                    connection,
+                    "executemany",
+                    "close_join_request",
+                    [
+                        (
+                            close["uuid"],
+                            close["result"],
+                            close.get("admin"),
+                            close.get("yes_votes"),
+                            close.get("no_votes"),
+                        )
+                        for close in closes
+                    ],
                 )
-                return bool(exists)
         except Exception as e:
             logger.error(
-                f"Error checking waiting join_request for group_id={group_id}, user_id={user_id}: {str(e)}"
+                f"Error closing {len(closes)} join_request rows, queued for retry: {str(e)}"
             )
-            raise
+            for close in closes:
+                self.queue_join_request_result(**close)
 
-    async def get_join_request_waiting_by_uuid(self, uuid: str) -> bool | None:
+    def queue_join_request_session_delete(self, uuid: str) -> None:
         """
-        Query join_request by uuid and return waiting status.
-        Returns None if the row does not exist.
+        Queue the removal of a persisted vote session; it is written after
+        every lifecycle write queued before it.
+        """
+        self.lifecycle_buffer.add(("delete_join_request_session", (uuid,), None))
+
+    async def flush_lifecycle_writes(self) -> int:
+        """
+        Write every queued lifecycle write now and return how many were written.
+        """
+        if not len(self.lifecycle_buffer):
+            return 0
+        return await self.lifecycle_buffer.flush()
+
+    async def flush_pending_writes(self) -> None:
+        """
+        Flush buffered ballots and queued lifecycle writes.
+        """
+        await self.flush_join_request_votes()
+        await self.flush_lifecycle_writes()
+
+    def _queued_close(self, uuid: str) -> tuple | None:
+        for kind, args, _ in reversed(self.lifecycle_buffer.rows()):
+            if kind == "close_join_request" and str(args[0]) == str(uuid):
+                return args
+        return None
+
+    def _queued_closes(self, group_id: int, user_id: int) -> list[str]:
+        """
+        uuids of the user's requests in the group whose close is queued.
         """
+        return [
+            str(args[0])
+            for kind, args, key in self.lifecycle_buffer.rows()
+            if kind == "close_join_request" and key == (group_id, user_id)
+        ]
+
+    async def _write_lifecycle(self, rows: list[tuple]) -> None:
+        # One executemany per kind, in LIFECYCLE_STATEMENTS order, inside one
+        # transaction. Rows keep their queue order within a kind, and a session
+        # delete can never land before the close of its own join_request.
         try:
-            async with self.conn.acquire() as connection:
-                waiting = await connection.fetchval(
-                    """
-                    SELECT waiting
-                    FROM join_request
-                    WHERE uuid = $1
-                    """,
-                    uuid,
-                )
-                return waiting
+            async with self._acquire() as connection:
+                async with connection.transaction():
+                    for kind in self.LIFECYCLE_STATEMENTS:
+                        args = [
+                            row_args
+                            for row_kind, row_args, _ in rows
+                            if row_kind == kind
+                        ]
+                        if args:
+                            await self._query(connection, "executemany", kind, args)
         except Exception as e:
-            logger.error(f"Error querying waiting status for uuid={uuid}: {str(e)}")
+            logger.error(
+                f"Error writing {len(rows)} join_request lifecycle rows: {str(e)}"
+            )
             raise
 
     async def get_join_request_status_by_uuid(self, uuid: str) -> dict | None:
         """
         Query join_request by uuid and return basic status info.
         Returns None if the row does not exist.
+        A queued close for the uuid is applied on top of the stored row.
         """
+        queued = self._queued_close(uuid)
         try:
-            async with self.conn.acquire() as connection:
-                row = await connection.fetchrow(
-                    """
-                    SELECT uuid, group_id, user_id, waiting, result
-                    FROM join_request
-                    WHERE uuid = $1
-                    """,
-                    uuid,
+            async with self._acquire() as connection:
+                row = await self._query(
+                    connection, "fetchrow", "get_join_request_status", uuid
                 )
                 if row is None:
                     return None
-                return dict(row)
+                status = dict(row)
+                if queued is not None:
+                    status["waiting"] = False
+                    status["result"] = queued[1]
+                return status
         except Exception as e:
             logger.error(
                 f"Error querying join request status for uuid={uuid}: {str(e)}"
@@ -301,35 +649,349 @@ class AsyncPostgresDB:
     async def update_group_setting(self, group_id: int, item: str, value) -> bool:
         """
         Update one allowed group setting field.
+        The updated row is written through to the settings cache and
+        on_settings_changed is announced.
         Returns True if one row is updated.
         """
-        allowed_fields = {
-            "vote_to_join",
-            "vote_time",
-            "pin_msg",
-            "clean_pinned_message",
-            "anonymous_vote",
-            "advanced_vote",
-            "language",
-            "mini_voters",
-        }
-        if item not in allowed_fields:
+        if item not in SETTING_FIELDS:
             raise ValueError(f"Unsupported setting field: {item}")
 
         try:
             await self.get_group_settings(group_id)
-            async with self.conn.acquire() as connection:
-                execute_result = await connection.execute(
-                    f"UPDATE setting SET {item} = $2 WHERE group_id = $1",
-                    group_id,
-                    value,
+            async with self._acquire() as connection:
+                row = await self._query(
+                    connection, "fetchrow", f"update_setting_{item}", group_id, value
                 )
-                return execute_result.endswith("1")
+            if row is None:
+                self.settings_cache.invalidate(group_id)
+                return False
+            self.settings_cache.set(group_id, dict(row))
         except Exception as e:
+            self.settings_cache.invalidate(group_id)
             logger.error(
                 f"Error updating group setting for group_id={group_id}, item={item}: {str(e)}"
             )
             raise
 
+        if self.on_settings_changed is not None:
+            try:
+                await self.on_settings_changed(group_id)
+            except Exception as e:
+                # Other instances fall back to the cache TTL.
+                logger.error(
+                    f"Error announcing setting change for group_id={group_id}: {str(e)}"
+                )
+        return True
+
+    async def save_join_request_session(
+        self,
+        uuid: str,
+        chat_id: int,
+        user_id: int,
+        request: dict,
+        group_settings: dict,
+        advanced_vote: bool,
+        message1_id: int | None,
+        message2_id: int | None,
+        message3_id: int | None,
+        log_message_id: int | None,
+        deadline: datetime,
+        owner: str | None = None,
+        batch_id: str | None = None,
+    ) -> None:
+        """
+        Persist the state of an open vote so it can be resumed after a restart.
+        """
+        try:
+            async with self._acquire() as connection:
+                await self._query(
+                    connection,
+                    "execute",
+                    "save_join_request_session",
+                    uuid,
+                    chat_id,
+                    user_id,
+                    request,
+                    group_settings,
+                    advanced_vote,
+                    message1_id,
+                    message2_id,
+                    message3_id,
+                    log_message_id,
+                    deadline,
+                    owner,
+                    batch_id,
+                )
+        except Exception as e:
+            logger.error(f"Error saving join_request_session for uuid={uuid}: {str(e)}")
+            raise
+
+    async def update_join_request_session(self, uuid: str, **fields) -> bool:
+        """
+        Update allowed fields of a persisted vote session.
+        Returns True if one row is updated.
+        """
+        allowed_fields = {"message4_id", "cleanup_at"}
+        unsupported = set(fields) - allowed_fields
+        if unsupported:
+            raise ValueError(f"Unsupported session fields: {sorted(unsupported)}")
+        if not fields:
+            return False
+
+        try:
+            async with self._acquire() as connection:
+                execute_result = await self._query(
+                    connection,
+                    "execute",
+                    "update_join_request_session",
+                    uuid,
+                    "message4_id" in fields,
+                    fields.get("message4_id"),
+                    "cleanup_at" in fields,
+                    fields.get("cleanup_at"),
+                )
+                return execute_result.endswith("1")
+        except Exception as e:
+            logger.error(
+                f"Error updating join_request_session for uuid={uuid}: {str(e)}"
+            )
+            raise
+
+    def queue_join_request_vote(
+        self, uuid: str, user_id: int, full_name: str, approve: bool
+    ) -> None:
+        """
+        Buffer one advanced-mode ballot; it is written by the next vote flush.
+        """
+        self.vote_buffer.add(
+            (uuid, user_id, full_name, approve, datetime.now(timezone.utc))
+        )
+
+    async def flush_join_request_votes(self) -> int:
+        """
+        Write every buffered ballot now and return how many were written.
+        """
+        return await self.vote_buffer.flush()
+
+    async def _write_join_request_votes(self, rows: list[tuple]) -> None:
+        try:
+            async with self._acquire() as connection:
+                await self._query(
+                    connection, "executemany", "insert_join_request_votes", rows
+                )
+        except Exception as e:
+            logger.error(f"Error writing {len(rows)} join_request votes: {str(e)}")
+            raise
+
+    async def load_join_request_sessions(
+        self, uuids: list[str] | None = None
+    ) -> list[dict]:
+        """
+        Return persisted vote sessions (all, or only the given uuids), oldest
+        deadline first, with their recorded ballots as yes_voters/no_voters maps
+        and the waiting/result state of their join_request rows.
+        Queued lifecycle writes are flushed first.
+        """
+        await self.flush_lifecycle_writes()
+        try:
+            async with self._acquire() as connection:
+                rows = await self._query(
+                    connection, "fetch", "load_join_request_sessions", uuids
+                )
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error loading join_request_sessions: {str(e)}")
+            raise
+
+    async def close_orphaned_join_requests(self, grace: float = 0) -> list[dict]:
+        """
+        Close waiting join_request rows that have no persisted vote session,
+        e.g. because the process died before the vote messages were sent.
+        Rows younger than grace seconds are left alone, since another instance
+        may still be sending their vote messages.
+        Returns the closed rows (uuid, group_id, user_id).
+        """
+        await self.flush_lifecycle_writes()
+        try:
+            async with self._acquire() as connection:
+                rows = await self._query(
+                    connection, "fetch", "close_orphaned_join_requests", float(grace)
+                )
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error closing orphaned join_requests: {str(e)}")
+            raise
+
+    async def open_connection(self):
+        """
+        Open a dedicated connection outside the pool, e.g. for LISTEN.
+        """
+        connection = await asyncpg.connect(**self._connect_kwargs())
+        await self._register_codecs(connection)
+        return connection
+
+    async def notify(self, channel: str, payload: str) -> None:
+        """
+        Send a NOTIFY to every instance listening on channel.
+        """
+        try:
+            async with self._acquire() as connection:
+                await self._query(connection, "execute", "notify", channel, payload)
+        except Exception as e:
+            logger.error(f"Error sending notification on {channel}: {str(e)}")
+            raise
+
+    async def heartbeat_instance(self, instance_id: str, lease_timeout: float) -> None:
+        """
+        Mark an instance as alive and forget instances silent for ten lease periods.
+        """
+        try:
+            async with self._acquire() as connection:
+                await self._query(
+                    connection,
+                    "execute",
+                    "heartbeat_instance",
+                    instance_id,
+                    float(lease_timeout),
+                )
+        except Exception as e:
+            logger.error(f"Error sending heartbeat for {instance_id}: {str(e)}")
+            raise
+
+    async def remove_instance(self, instance_id: str) -> int:
+        """
+        Drop an instance and release its vote sessions for other instances.
+        Returns the number of released sessions.
+        """
+        try:
+            async with self._acquire() as connection:
+                async with connection.transaction():
+                    released = await self._query(
+                        connection, "execute", "release_instance_sessions", instance_id
+                    )
+                    await self._query(
+                        connection, "execute", "delete_instance", instance_id
+                    )
+                return int(released.split()[-1])
+        except Exception as e:
+            logger.error(f"Error removing instance {instance_id}: {str(e)}")
+            raise
+
+    async def get_join_request_session_owner(
+        self, uuid: str, lease_timeout: float
+    ) -> dict | None:
+        """
+        Return the owner of a vote session and whether its lease is still alive.
+        Returns None if the session does not exist.
+        """
+        try:
+            async with self._acquire() as connection:
+                row = await self._query(
+                    connection,
+                    "fetchrow",
+                    "get_join_request_session_owner",
+                    uuid,
+                    float(lease_timeout),
+                )
+                if row is None:
+                    return None
+                return dict(row)
+        except Exception as e:
+            logger.error(f"Error querying session owner for uuid={uuid}: {str(e)}")
+            raise
+
+    async def claim_join_request_sessions(
+        self,
+        owner: str,
+        lease_timeout: float,
+        uuid: str | None = None,
+        include_own: bool = False,
+    ) -> list[str]:
+        """
+        Take over vote sessions that have no owner or whose owner's lease expired
+        (optionally only one uuid and the rest of its batch, optionally also
+        sessions already owned by owner).
+        Returns the claimed uuids.
+        """
+        try:
+            async with self._acquire() as connection:
+                rows = await self._query(
+                    connection,
+                    "fetch",
+                    "claim_join_request_sessions",
+                    owner,
+                    float(lease_timeout),
+                    uuid,
+                    include_own,
+                )
+                return [row["uuid"] for row in rows]
+        except Exception as e:
+            logger.error(f"Error claiming join_request_sessions for {owner}: {str(e)}")
+            raise
+
+    async def fence_join_request_sessions(
+        self, owner: str, lease_epochs: dict[str, int]
+    ) -> dict[str, int]:
+        """
+        Check that owner still holds the given sessions at the given lease
+        epochs and raise the epochs. Returns the new epoch of every session,
+        or an empty dict if any of them was taken over.
+        """
+        try:
+            async with self._acquire() as connection:
+                rows = await self._query(
+                    connection,
+                    "fetch",
+                    "fence_join_request_sessions",
+                    list(lease_epochs),
+                    owner,
+                    list(lease_epochs.values()),
+                )
+                return {row["uuid"]: row["lease_epoch"] for row in rows}
+        except Exception as e:
+            logger.error(f"Error fencing join_request_sessions for {owner}: {str(e)}")
+            raise
+
+    async def find_lost_join_request_sessions(
+        self, owner: str, uuids: list[str]
+    ) -> list[str]:
+        """
+        Return the uuids among the given ones whose session is now owned by
+        another instance.
+        """
+        if not uuids:
+            return []
+        try:
+            async with self._acquire() as connection:
+                rows = await self._query(
+                    connection,
+                    "fetch",
+                    "find_lost_join_request_sessions",
+                    owner,
+                    uuids,
+                )
+                return [row["uuid"] for row in rows]
+        except Exception as e:
+            logger.error(f"Error checking session ownership for {owner}: {str(e)}")
+            raise
+
+    def settings_cache_stats(self) -> dict:
+        """
+        Return size and hit/miss counters of the group settings cache.
+        """
+        return self.settings_cache.stats()
+
+    def pool_stats(self) -> dict:
+        """
+        Return pool sizing, acquire wait/in-use counters and per-query latency.
+        """
+        stats = self.stats.stats()
+        stats["min_size"] = self.pool_min_size
+        stats["max_size"] = self.pool_max_size
+        if self.conn is not None:
+            stats["size"] = self.conn.get_size()
+            stats["idle"] = self.conn.get_idle_size()
+        return stats
+
 
 BotDatabase = AsyncPostgresDB()
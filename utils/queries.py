@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 17:30
+# @Author  : KimmyXYC
+# @File    : queries.py
+# @Software: PyCharm
+"""
+Every statement AsyncPostgresDB issues, by name.
+Pooled connections prepare all of them once when they are opened.
+"""
+
+SETTING_COLUMNS = (
+    "group_id, vote_to_join, vote_time, pin_msg, clean_pinned_message, "
+    "anonymous_vote, advanced_vote, language, mini_voters"
+)
+
+# Group settings that can be changed from the settings menu.
+SETTING_FIELDS = (
+    "vote_to_join",
+    "vote_time",
+    "pin_msg",
+    "clean_pinned_message",
+    "anonymous_vote",
+    "advanced_vote",
+    "language",
+    "mini_voters",
+)
+
+QUERIES = {
+    "select_group_settings": f"""
+        SELECT {SETTING_COLUMNS}
+        FROM setting
+        WHERE group_id = $1
+    """,
+    "insert_group_settings": """
+        INSERT INTO setting (
+            group_id, vote_to_join, vote_time, pin_msg,
+            clean_pinned_message, anonymous_vote, advanced_vote, language, mini_voters
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        ON CONFLICT (group_id) DO NOTHING
+    """,
+    "open_join_request": f"""
+        WITH inserted_setting AS (
+            INSERT INTO setting (
+                group_id, vote_to_join, vote_time, pin_msg,
+                clean_pinned_message, anonymous_vote, advanced_vote, language, mini_voters
+            ) VALUES ($2, $4, $5, $6, $7, $8, $9, $10, $11)
+            ON CONFLICT (group_id) DO NOTHING
+            RETURNING {SETTING_COLUMNS}
+        ),
+        group_setting AS (
+            SELECT * FROM inserted_setting
+            UNION ALL
+            SELECT {SETTING_COLUMNS}
+            FROM setting
+            WHERE group_id = $2
+        ),
+        -- $12 are earlier requests of the user whose close is still queued
+        -- in the bot; their join_request_waiting row is taken over.
+        claimed AS (
+            INSERT INTO join_request_waiting (group_id, user_id, uuid, request_time)
+            SELECT $2, $3, $1, NOW()
+            FROM group_setting
+            WHERE group_setting.vote_to_join
+            ON CONFLICT (group_id, user_id) DO UPDATE
+            SET uuid = EXCLUDED.uuid, request_time = EXCLUDED.request_time
+            WHERE join_request_waiting.uuid = ANY($12::uuid[])
+            RETURNING uuid, request_time
+        ),
+        inserted_request AS (
+            INSERT INTO join_request (
+                uuid, group_id, user_id, request_time, waiting, result, admin
+            )
+            SELECT uuid, $2, $3, request_time, TRUE, NULL, NULL
+            FROM claimed
+            RETURNING uuid
+        )
+        SELECT group_setting.*,
+               group_setting.vote_to_join
+               AND NOT EXISTS (SELECT 1 FROM inserted_request) AS already_waiting
+        FROM group_setting
+    """,
+    # join_request is partitioned by request_time; the bounds derived from the
+    # uuid limit every lookup by uuid to the partitions it can live in.
+    "close_join_request": """
+        WITH released AS (
+            DELETE FROM join_request_waiting WHERE uuid = $1
+        )
+        UPDATE join_request
+        SET result = $2, admin = $3, waiting = FALSE,
+            yes_votes = COALESCE($4, yes_votes),
+            no_votes = COALESCE($5, no_votes)
+        WHERE uuid = $1
+          AND request_time BETWEEN join_request_time_lower($1)
+                               AND join_request_time_upper($1)
+    """,
+    "get_join_request_status": """
+        SELECT uuid, group_id, user_id, waiting, result
+        FROM join_request
+        WHERE uuid = $1
+          AND request_time BETWEEN join_request_time_lower($1)
+                               AND join_request_time_upper($1)
+    """,
+    **{
+        f"update_setting_{field}": f"""
+            UPDATE setting SET {field} = $2 WHERE group_id = $1
+            RETURNING {SETTING_COLUMNS}
+        """
+        for field in SETTING_FIELDS
+    },
+    "save_join_request_session": """
+        INSERT INTO join_request_session (
+            uuid, chat_id, user_id, request, group_settings, advanced_vote,
+            message1_id, message2_id, message3_id, log_message_id, deadline, owner,
+            batch_id
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+        ON CONFLICT (uuid) DO UPDATE SET
+            advanced_vote = EXCLUDED.advanced_vote,
+            message1_id = EXCLUDED.message1_id,
+            message2_id = EXCLUDED.message2_id,
+            message3_id = EXCLUDED.message3_id,
+            log_message_id = EXCLUDED.log_message_id,
+            deadline = EXCLUDED.deadline,
+            owner = EXCLUDED.owner,
+            batch_id = EXCLUDED.batch_id
+    """,
+    # Each field is only assigned when its flag parameter is true.
+    "update_join_request_session": """
+        UPDATE join_request_session
+        SET message4_id = CASE WHEN $2 THEN $3::bigint ELSE message4_id END,
+            cleanup_at = CASE WHEN $4 THEN $5::timestamptz ELSE cleanup_at END
+        WHERE uuid = $1
+    """,
+    "delete_join_request_session": """
+        DELETE FROM join_request_session WHERE uuid = $1
+    """,
+    "insert_join_request_votes": """
+        INSERT INTO join_request_vote (uuid, voter_id, full_name, approve, voted_at)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (uuid, voter_id) DO NOTHING
+    """,
+    # Ballots are aggregated per session so that join_request_vote is only
+    # read through its primary key, however many sessions are loaded.
+    "load_join_request_sessions": """
+        SELECT session.uuid, session.chat_id, session.user_id, session.request,
+               session.group_settings, session.advanced_vote,
+               session.message1_id, session.message2_id, session.message3_id,
+               session.message4_id, session.log_message_id, session.batch_id,
+               session.lease_epoch,
+               ballots.yes_voters, ballots.no_voters,
+               session.deadline, session.cleanup_at,
+               COALESCE(request.waiting, FALSE) AS waiting,
+               request.result
+        FROM join_request_session AS session
+        LEFT JOIN LATERAL (
+            -- LIMIT keeps this a per-session lookup, pruned to one partition.
+            SELECT waiting, result
+            FROM join_request
+            WHERE join_request.uuid = session.uuid
+              AND join_request.request_time
+                  BETWEEN join_request_time_lower(session.uuid)
+                      AND join_request_time_upper(session.uuid)
+            LIMIT 1
+        ) AS request ON TRUE
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(
+                       jsonb_object_agg(vote.voter_id::text, vote.full_name)
+                           FILTER (WHERE vote.approve),
+                       '{}'
+                   ) AS yes_voters,
+                   COALESCE(
+                       jsonb_object_agg(vote.voter_id::text, vote.full_name)
+                           FILTER (WHERE NOT vote.approve),
+                       '{}'
+                   ) AS no_voters
+            FROM join_request_vote AS vote
+            WHERE vote.uuid = session.uuid
+        ) AS ballots
+        WHERE $1::uuid[] IS NULL OR session.uuid = ANY($1::uuid[])
+        ORDER BY session.deadline
+    """,
+    "close_orphaned_join_requests": """
+        WITH orphaned AS (
+            DELETE FROM join_request_waiting
+            WHERE request_time < NOW() - make_interval(secs => $1)
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM join_request_session
+                  WHERE join_request_session.uuid = join_request_waiting.uuid
+              )
+            RETURNING uuid, request_time
+        )
+        UPDATE join_request
+        SET waiting = FALSE, result = FALSE
+        FROM orphaned
+        WHERE join_request.waiting = TRUE
+          AND join_request.uuid = orphaned.uuid
+          AND join_request.request_time = orphaned.request_time
+        RETURNING join_request.uuid, join_request.group_id, join_request.user_id
+    """,
+    "notify": "SELECT pg_notify($1, $2)",
+    "heartbeat_instance": """
+        WITH forgotten AS (
+            DELETE FROM bot_instance
+            WHERE heartbeat_at < NOW() - make_interval(secs => $2 * 10)
+        )
+        INSERT INTO bot_instance (instance_id, started_at, heartbeat_at)
+        VALUES ($1, NOW(), NOW())
+        ON CONFLICT (instance_id) DO UPDATE SET heartbeat_at = NOW()
+    """,
+    "release_instance_sessions": """
+        UPDATE join_request_session SET owner = NULL WHERE owner = $1
+    """,
+    "delete_instance": """
+        DELETE FROM bot_instance WHERE instance_id = $1
+    """,
+    "get_join_request_session_owner": """
+        SELECT session.owner,
+               COALESCE(
+                   instance.heartbeat_at > NOW() - make_interval(secs => $2),
+                   FALSE
+               ) AS alive
+        FROM join_request_session AS session
+        LEFT JOIN bot_instance AS instance
+            ON instance.instance_id = session.owner
+        WHERE session.uuid = $1
+    """,
+    "claim_join_request_sessions": """
+        UPDATE join_request_session AS session
+        SET owner = $1, lease_epoch = session.lease_epoch + 1
+        WHERE (
+            $3::uuid IS NULL
+            OR session.uuid = $3::uuid
+            OR session.batch_id = (
+                SELECT batch_id FROM join_request_session WHERE uuid = $3::uuid
+            )
+        )
+          AND (
+              session.owner IS NULL
+              OR ($4 AND session.owner = $1)
+              OR (
+                  session.owner <> $1
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM bot_instance AS instance
+                      WHERE instance.instance_id = session.owner
+                        AND instance.heartbeat_at > NOW() - make_interval(secs => $2)
+                  )
+              )
+          )
+        RETURNING session.uuid::text AS uuid
+    """,
+    # All or nothing: every session must still be owned by $2 at the epoch it
+    # was loaded with. Renewing the heartbeat keeps the lease alive while the
+    # decision is published.
+    "fence_join_request_sessions": """
+        WITH renewed AS (
+            UPDATE bot_instance SET heartbeat_at = NOW() WHERE instance_id = $2
+        ),
+        held AS (
+            SELECT session.uuid
+            FROM join_request_session AS session
+            JOIN unnest($1::uuid[], $3::bigint[]) AS fence (uuid, lease_epoch)
+                ON fence.uuid = session.uuid
+            WHERE session.owner = $2
+              AND session.lease_epoch = fence.lease_epoch
+            FOR UPDATE OF session
+        )
+        UPDATE join_request_session AS session
+        SET lease_epoch = session.lease_epoch + 1
+        FROM held
+        WHERE session.uuid = held.uuid
+          AND (SELECT COUNT(*) FROM held) = cardinality($1::uuid[])
+        RETURNING session.uuid::text AS uuid, session.lease_epoch
+    """,
+    "find_lost_join_request_sessions": """
+        SELECT uuid::text AS uuid
+        FROM join_request_session
+        WHERE uuid = ANY($2::uuid[]) AND owner IS DISTINCT FROM $1
+    """,
+}
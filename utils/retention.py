@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 23:10
+# @Author  : KimmyXYC
+# @File    : retention.py
+# @Software: PyCharm
+import asyncio
+import gzip
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+
+from loguru import logger
+
+from app_conf import settings
+from utils.postgres import BotDatabase
+
+# Arbitrary key for pg_try_advisory_lock so that only one instance runs retention.
+RETENTION_LOCK_ID = 0x41425052
+
+
+def _add_months(year: int, month: int, months: int) -> tuple[int, int]:
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _month_start(year: int, month: int) -> datetime:
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _compress(source: str, target: str):
+    with open(source, "rb") as raw, gzip.open(target, "wb") as archive:
+        shutil.copyfileobj(raw, archive, 1024 * 1024)
+
+
+class JoinRequestRetention:
+    """
+    Maintain the monthly partitions of join_request.
+    Partitions for the coming months are created ahead of time. Partitions that
+    ended more than `days` days ago are archived to gzip CSV (together with
+    their ballots) and dropped, detached, or just dropped, depending on action.
+    Partitions that still hold a waiting request are kept.
+    """
+
+    PARTITION = re.compile(r"^join_request_p(\d{4})(\d{2})$")
+    ACTIONS = ("archive", "detach", "drop")
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        days: int = 0,
+        action: str = "archive",
+        archive_dir: str = "archive",
+        interval: float = 3600,
+        premake_months: int = 2,
+    ):
+        if action not in self.ACTIONS:
+            raise ValueError(
+                f"retention.action must be one of {', '.join(self.ACTIONS)}"
+            )
+        self.enabled = enabled
+        self.days = days
+        self.action = action
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.premake_months = premake_months
+        self.created = 0
+        self.retired = 0
+        self.archived_rows = 0
+        self.last_run: float | None = None
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_settings(cls) -> "JoinRequestRetention":
+        return cls(
+            enabled=bool(settings.get("retention.enable", True)),
+            days=int(settings.get("retention.days", 0)),
+            action=str(settings.get("retention.action", "archive")),
+            archive_dir=str(settings.get("retention.archive_dir", "archive")),
+            interval=float(settings.get("retention.interval", 3600)),
+            premake_months=int(settings.get("retention.premake_months", 2)),
+        )
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        keep = f"{self.days} days ({self.action})" if self.days > 0 else "forever"
+        logger.info(f"🗄️ join_request retention enabled, keeping {keep}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("join_request retention failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, now: datetime | None = None) -> list[str]:
+        """
+        Create upcoming partitions and retire expired ones.
+        Returns the names of the retired partitions.
+        """
+        now = now or datetime.now(timezone.utc)
+        connection = await BotDatabase.open_connection()
+        try:
+            # Archiving a month of requests may outlast the pool's timeout.
+            await connection.execute("SET statement_timeout = 0")
+            if not await connection.fetchval(
+                "SELECT pg_try_advisory_lock($1)", RETENTION_LOCK_ID
+            ):
+                logger.debug("join_request retention is running elsewhere")
+                return []
+            try:
+                await self._create_partitions(connection, now)
+                retired = []
+                if self.days > 0:
+                    for name in await self._expired_partitions(connection, now):
+                        if await self._retire(connection, name):
+                            retired.append(name)
+                self.last_run = time.time()
+                return retired
+            finally:
+                await connection.execute(
+                    "SELECT pg_advisory_unlock($1)", RETENTION_LOCK_ID
+                )
+        finally:
+            await connection.close()
+
+    async def _partitions(self, connection) -> dict[str, tuple[datetime, datetime]]:
+        rows = await connection.fetch(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'join_request'::regclass
+            """
+        )
+        partitions = {}
+        for row in rows:
+            match = self.PARTITION.match(row["relname"])
+            if match is None:
+                continue
+            year, month = int(match.group(1)), int(match.group(2))
+            partitions[row["relname"]] = (
+                _month_start(year, month),
+                _month_start(*_add_months(year, month, 1)),
+            )
+        return partitions
+
+    async def _create_partitions(self, connection, now: datetime):
+        existing = await self._partitions(connection)
+        for offset in range(self.premake_months + 1):
+            year, month = _add_months(now.year, now.month, offset)
+            name = f"join_request_p{year:04d}{month:02d}"
+            if name in existing:
+                continue
+            lower = _month_start(year, month)
+            upper = _month_start(*_add_months(year, month, 1))
+            try:
+                await connection.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF join_request
+                    FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')
+                    """
+                )
+            except Exception as e:
+                # Rows for this month already sit in join_request_default.
+                logger.error(f"Error creating partition {name}: {str(e)}")
+                continue
+            self.created += 1
+            logger.info(f"Created join_request partition {name}")
+
+    async def _expired_partitions(self, connection, now: datetime) -> list[str]:
+        cutoff = now.timestamp() - self.days * 86400
+        expired = []
+        for name, (lower, upper) in sorted(
+            (await self._partitions(connection)).items()
+        ):
+            if upper.timestamp() > cutoff:
+                continue
+            waiting = await connection.fetchval(
+                """
+                SELECT COUNT(*)
+                FROM join_request_waiting
+                WHERE request_time >= $1 AND request_time < $2
+                """,
+                lower,
+                upper,
+            )
+            if waiting:
+                logger.warning(
+                    f"Keeping join_request partition {name}: "
+                    f"{waiting} requests are still waiting"
+                )
+                continue
+            expired.append(name)
+        return expired
+
+    async def _retire(self, connection, name: str) -> bool:
+        try:
+            async with connection.transaction():
+                if self.action == "archive":
+                    await self._archive(connection, name)
+                if self.action in {"archive", "drop"}:
+                    await connection.execute(
+                        f"""
+                        DELETE FROM join_request_vote AS vote
+                        USING "{name}" AS request
+                        WHERE vote.uuid = request.uuid
+                        """
+                    )
+                # Detaching or dropping a partition locks join_request itself.
+                await connection.execute("SET LOCAL lock_timeout = '10s'")
+                if self.action == "detach":
+                    await connection.execute(
+                        f'ALTER TABLE join_request DETACH PARTITION "{name}"'
+                    )
+                else:
+                    await connection.execute(f'DROP TABLE "{name}"')
+        except Exception as e:
+            logger.error(f"Error retiring join_request partition {name}: {str(e)}")
+            return False
+        self.retired += 1
+        logger.info(f"Retired join_request partition {name} ({self.action})")
+        return True
+
+    async def _archive(self, connection, name: str):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        suffix = name.removeprefix("join_request_")
+        exports = {
+            f"join_request_{suffix}.csv.gz": f'SELECT * FROM "{name}" ORDER BY request_time',
+            f"join_request_vote_{suffix}.csv.gz": f"""
+                SELECT vote.*
+                FROM join_request_vote AS vote
+                JOIN "{name}" AS request ON request.uuid = vote.uuid
+                ORDER BY vote.uuid, vote.voter_id
+            """,
+        }
+        loop = asyncio.get_running_loop()
+        for filename, query in exports.items():
+            path = os.path.join(self.archive_dir, filename)
+            partial = f"{path}.partial"
+            raw = f"{path.removesuffix('.gz')}.partial"
+            # COPY into a plain file (asyncpg writes it from its executor) and
+            # gzip that in a worker thread, so the event loop never compresses.
+            try:
+                result = await connection.copy_from_query(
+                    query, output=raw, format="csv", header=True
+                )
+                await loop.run_in_executor(None, _compress, raw, partial)
+            finally:
+                if os.path.exists(raw):
+                    os.remove(raw)
+            os.replace(partial, path)
+            self.archived_rows += int(result.split()[-1])
+            logger.info(f"Archived {result.split()[-1]} rows to {path}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "days": self.days,
+            "action": self.action,
+            "created": self.created,
+            "retired": self.retired,
+            "archived_rows": self.archived_rows,
+            "last_run": self.last_run,
+        }
+
+
+Retention = JoinRequestRetention.from_settings()
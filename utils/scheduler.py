@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 11:05
+# @Author  : KimmyXYC
+# @File    : scheduler.py
+# @Software: PyCharm
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from utils.tracing import Tracer
+
+
+class DeadlineScheduler:
+    """
+    One task and one heap for every vote deadline and cleanup timer.
+    Each key has at most one pending callback; scheduling a key again replaces it.
+    Times are wall-clock timestamps (time.time()) so they can be persisted.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._heap: list[tuple[float, int, str]] = []
+        self._entries: dict[str, tuple[float, int, Callable[[], Awaitable]]] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def now(self) -> float:
+        """
+        Current time on the scheduler's clock; deadlines are computed from it.
+        """
+        return self._clock()
+
+    def schedule(
+        self, key: str, when: float, callback: Callable[[], Awaitable]
+    ) -> None:
+        sequence = next(self._sequence)
+        self._entries[key] = (when, sequence, callback)
+        heapq.heappush(self._heap, (when, sequence, key))
+        self._wakeup.set()
+
+    def cancel(self, key: str) -> bool:
+        # Heap items are dropped lazily when they reach the top.
+        return self._entries.pop(key, None) is not None
+
+    def next_deadline(self) -> float | None:
+        self._drop_stale()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def _drop_stale(self):
+        while self._heap:
+            when, sequence, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == sequence:
+                return
+            heapq.heappop(self._heap)
+
+    def dispatch_due(self) -> int:
+        """
+        Start every callback whose time has come and return how many were started.
+        """
+        now = self._clock()
+        dispatched = 0
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return dispatched
+            _, _, key = heapq.heappop(self._heap)
+            _, _, callback = self._entries.pop(key)
+            task = asyncio.create_task(self._run_callback(key, callback))
+            self._running.add(task)
+            task.add_done_callback(self._on_callback_done(key))
+            dispatched += 1
+
+    @staticmethod
+    async def _run_callback(key: str, callback: Callable[[], Awaitable]):
+        with Tracer.trace(f"scheduled callback key={key}"):
+            await callback()
+
+    def _on_callback_done(self, key: str):
+        def _done(task: asyncio.Task):
+            self._running.discard(task)
+            if task.cancelled():
+                return
+            error = task.exception()
+            if error:
+                logger.opt(exception=error).error(
+                    f"scheduled callback failed: key={key}"
+                )
+
+        return _done
+
+    async def drain(self):
+        """
+        Wait for callbacks that have already been dispatched.
+        """
+        while self._running:
+            await asyncio.gather(*list(self._running), return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self.dispatch_due()
+            self._wakeup.clear()
+            next_deadline = self.next_deadline()
+            if next_deadline is None:
+                await self._wakeup.wait()
+                continue
+            delay = next_deadline - self._clock()
+            if delay <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
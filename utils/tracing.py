@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:10
+# @Author  : KimmyXYC
+# @File    : tracing.py
+# @Software: PyCharm
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from loguru import logger
+
+from app_conf import settings
+
+_current_trace: ContextVar["UpdateTrace | None"] = ContextVar(
+    "update_trace", default=None
+)
+_current_path: ContextVar[str] = ContextVar("update_trace_path", default="")
+
+
+class UpdateTrace:
+    """
+    Timed spans recorded while one update (or scheduled callback) is handled.
+    Span names are paths of the enclosing spans, e.g.
+    "handler:callback_query/action.publish/api:editMessageText".
+    """
+
+    def __init__(self, name: str, max_spans: int = 500):
+        self.name = name
+        self.max_spans = max_spans
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.spans: list[tuple[float, float, str, bool]] = []
+        self.dropped = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def add(self, path: str, started: float, elapsed: float, failed: bool) -> None:
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        self.spans.append((started - self.started, elapsed, path, failed))
+
+    def format(self) -> str:
+        lines = [f"{self.name} took {self.elapsed:.3f}s, {len(self.spans)} spans:"]
+        for offset, elapsed, path, failed in sorted(
+            self.spans, key=lambda item: (item[0], -item[1])
+        ):
+            suffix = " (failed)" if failed else ""
+            lines.append(f"  +{offset:.3f}s {elapsed:8.3f}s  {path}{suffix}")
+        if self.dropped:
+            lines.append(f"  ... {self.dropped} more spans dropped")
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block as part of the current update trace; a no-op outside one.
+    Tasks started inside the block inherit it as their parent span.
+    """
+    trace = _current_trace.get()
+    if trace is None or trace.closed:
+        yield
+        return
+
+    parent = _current_path.get()
+    path = f"{parent}/{name}" if parent else name
+    token = _current_path.set(path)
+    started = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        _current_path.reset(token)
+        trace.add(path, started, time.perf_counter() - started, failed)
+
+
+class UpdateTracer:
+    """
+    Start a trace per update and log its span breakdown through loguru when
+    handling took longer than slow_update_budget seconds.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        slow_update_budget: float = 2.0,
+        max_spans: int = 500,
+    ):
+        self.enabled = enabled
+        self.slow_update_budget = slow_update_budget
+        self.max_spans = max_spans
+        self.traced = 0
+        self.slow = 0
+
+    @classmethod
+    def from_settings(cls) -> "UpdateTracer":
+        return cls(
+            enabled=bool(settings.get("tracing.enable", True)),
+            slow_update_budget=float(settings.get("tracing.slow_update_budget", 2.0)),
+            max_spans=int(settings.get("tracing.max_spans", 500)),
+        )
+
+    @contextmanager
+    def trace(self, name: str):
+        """
+        Trace the block as one unit of work. Nested calls join the outer trace.
+        """
+        current = _current_trace.get()
+        if not self.enabled or (current is not None and not current.closed):
+            yield current
+            return
+
+        trace = UpdateTrace(name, self.max_spans)
+        trace_token = _current_trace.set(trace)
+        path_token = _current_path.set("")
+        try:
+            yield trace
+        finally:
+            _current_path.reset(path_token)
+            _current_trace.reset(trace_token)
+            trace.finished = time.perf_counter()
+            self.traced += 1
+            if trace.elapsed >= self.slow_update_budget:
+                self.slow += 1
+                logger.warning(
+                    f"Slow update (budget {self.slow_update_budget:.3f}s): "
+                    f"{trace.format()}"
+                )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "traced": self.traced,
+            "slow": self.slow,
+        }
+
+
+Tracer = UpdateTracer.from_settings()
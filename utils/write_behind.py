@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 15:20
+# @Author  : KimmyXYC
+# @File    : write_behind.py
+# @Software: PyCharm
+import asyncio
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+
+class WriteBehindBuffer:
+    """
+    Collect rows in memory and hand them to a batch writer on a short interval,
+    when max_batch rows are pending, or when flush() is awaited.
+    A failed batch is put back in front of the queue and retried on the next flush.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        writer: Callable[[list], Awaitable],
+        interval: float = 1.0,
+        max_batch: int = 500,
+    ):
+        self.name = name
+        self.writer = writer
+        self.interval = interval
+        self.max_batch = max_batch
+        self.flushed = 0
+        self.failures = 0
+        self._pending: list = []
+        self._in_flight: list = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def rows(self) -> list:
+        """
+        Rows not yet known to be written, oldest first (including a batch
+        that is being written right now).
+        """
+        return self._in_flight + self._pending
+
+    def add(self, row) -> None:
+        self._pending.append(row)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """
+        Write every pending row now and return how many were written.
+        Raises the writer's exception after re-queueing the batch.
+        """
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+                self._in_flight = batch
+                try:
+                    await self.writer(batch)
+                except BaseException:
+                    # Also covers cancellation by stop(), so no row is dropped.
+                    self._pending[:0] = batch
+                    self.failures += 1
+                    raise
+                finally:
+                    self._in_flight = []
+                written += len(batch)
+                self.flushed += len(batch)
+            return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception(
+                    f"{self.name} flush failed, {len(self._pending)} rows kept for retry"
+                )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the background flusher and write whatever is still pending.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "failures": self.failures,
+        }